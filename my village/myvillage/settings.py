@@ -154,6 +154,49 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Location hierarchy cache
+# Seconds between checks of the shared hierarchy version counter; each worker
+# rebuilds its in-memory location tree when the counter has moved on.
+LOCATION_TREE_CHECK_INTERVAL = 5
+
+# Browser/proxy cache lifetime (seconds) for /api/hierarchy/ responses. Pages
+# request them with the current hierarchy version in the URL, so a change to
+# the hierarchy produces new URLs rather than stale hits.
+HIERARCHY_CACHE_MAX_AGE = 60 * 60 * 24
+
+# Relationship graph images are rendered by this many background threads per
+# process and stored under MEDIA_ROOT/relationship_graphs/.
+RELATIONSHIP_GRAPH_WORKERS = 2
+RELATIONSHIP_GRAPH_DPI = 150
+
+# Seconds between checks of the shared relationship graph version counter; each
+# worker then applies the changes other workers made in the meantime to its
+# in-memory adjacency index, read from a change log that keeps the last
+# RELATIONSHIP_GRAPH_LOG_VERSIONS versions. A worker further behind reloads
+# the whole graph.
+RELATIONSHIP_GRAPH_CHECK_INTERVAL = 5
+RELATIONSHIP_GRAPH_LOG_VERSIONS = 10000
+
+# "People you may know" suggestions stored per member by the
+# compute_recommendations command.
+RECOMMENDATIONS_PER_PROFILE = 50
+
+# Seconds a member's pending request count (the navbar badge) stays in the
+# cache. Changes drop it right away in the process that made them; with a
+# per-process cache, other workers catch up within this time.
+PENDING_REQUESTS_CACHE_TIMEOUT = 60
+
+# Delta sync (/api/sync). Rows changed in the last few seconds are held back
+# until transactions in flight have committed, so a write must commit within
+# SYNC_SETTLE_SECONDS of saving its rows; longer ones (imports, batch jobs)
+# run in SyncDB.hold(), which holds rows back for up to SYNC_HOLD_TIMEOUT
+# seconds. Deletions are remembered for the retention period (purge older
+# ones with purge_tombstones), after which clients with older tokens must
+# sync from scratch.
+SYNC_SETTLE_SECONDS = 2
+SYNC_HOLD_TIMEOUT = 60 * 60
+SYNC_TOMBSTONE_RETENTION_DAYS = 90
+
 # Authentication settings
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/'
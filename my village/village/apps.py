@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class VillageConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'village'
+
+    def ready(self):
+        from . import signals  # noqa: F401
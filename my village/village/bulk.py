@@ -0,0 +1,72 @@
+"""
+Bulk writes for the REST API.
+
+Clients creating or editing many objects at once (say, importing a village's
+services, or the contributions collected at an event) send them as one list
+instead of one request per object. The list is validated in one pass, with
+the related objects of all items fetched by one query per model, and written
+with ``bulk_create``/``bulk_update`` in a single transaction: either every
+item is saved or, if any is invalid, none is. The write runs in a sync hold
+(see ``SyncDB.hold``), as it may take longer than the sync settle window.
+"""
+
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from .db import SyncDB
+
+
+class BulkWriteMixin:
+    """
+    ViewSet mixin adding ``POST`` and ``PATCH`` on ``<prefix>/bulk/``.
+
+    ``POST`` takes a list of objects to create, and ``PATCH`` a list of
+    partial objects, each with the ``id`` of the object it changes. Both
+    answer with the saved objects, in the order they were sent. The view's
+    serializer must use ``BulkListSerializer``; objects are created through
+    ``perform_create``, so the view can fill in fields (such as the current
+    user) as it does for single objects.
+    """
+
+    bulk_max_size = 500
+
+    @action(detail=False, methods=['post', 'patch'])
+    def bulk(self, request):
+        items = request.data
+        if not isinstance(items, list) or not items:
+            raise ValidationError({'non_field_errors': ['Expected a non-empty list of objects.']})
+        if len(items) > self.bulk_max_size:
+            raise ValidationError({'non_field_errors': [f'At most {self.bulk_max_size} objects can be sent at once.']})
+
+        if request.method == 'POST':
+            serializer = self.get_serializer(data=items, many=True)
+            serializer.is_valid(raise_exception=True)
+            with SyncDB.hold(f'{type(self).__name__}.bulk'):
+                self.perform_create(serializer)
+            pks = [obj.pk for obj in serializer.instance]
+            response_status = status.HTTP_201_CREATED
+        else:
+            pks = self._bulk_ids(items)
+            instances = self.get_queryset().in_bulk(pks)
+            missing = [pk for pk in pks if pk not in instances]
+            if missing:
+                raise ValidationError({'id': [f'No such objects: {", ".join(map(str, missing))}.']})
+            serializer = self.get_serializer(instances, data=items, many=True, partial=True)
+            serializer.is_valid(raise_exception=True)
+            with SyncDB.hold(f'{type(self).__name__}.bulk'):
+                self.perform_update(serializer)
+            response_status = status.HTTP_200_OK
+
+        saved = self.get_queryset().in_bulk(pks)
+        serializer = self.get_serializer([saved[pk] for pk in pks if pk in saved], many=True)
+        return Response(serializer.data, status=response_status)
+
+    def _bulk_ids(self, items):
+        """The ids of the objects a bulk update changes, in order."""
+        pks = [item.get('id') if isinstance(item, dict) else None for item in items]
+        if not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in pks):
+            raise ValidationError({'id': ['Every object must have an integer id.']})
+        if len(set(pks)) != len(pks):
+            raise ValidationError({'id': ['Each object can only be changed once per request.']})
+        return pks
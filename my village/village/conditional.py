@@ -0,0 +1,72 @@
+"""
+Conditional GET for the REST API.
+
+Lists and single objects carry an ``ETag`` built from the number of objects,
+the number of related objects in nested lists and the latest ``updated_at``
+of everything the serializer renders, all read with one aggregate query
+that materializes no rows. Clients that send the tag back in
+``If-None-Match`` get a bodiless 304 while nothing has changed, without the
+objects being loaded or serialized.
+"""
+
+import hashlib
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from .query_optimizer import change_aggregates
+
+
+class ConditionalGetMixin:
+    """
+    ViewSet mixin answering conditional GETs of ``list`` and ``retrieve``.
+
+    Single objects also get ``Last-Modified``. Lists do not: deleting an
+    object does not move the latest ``updated_at`` forward, so only the
+    ETag (which includes the count) can tell that a list changed.
+    """
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return self._conditional(request, queryset, False, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            **{self.lookup_field: kwargs[lookup_url_kwarg]}
+        )
+        return self._conditional(request, queryset, True, super().retrieve, *args, **kwargs)
+
+    def get_validators(self, queryset, with_last_modified):
+        """
+        Compute the ETag (and Last-Modified) of the response for a queryset.
+
+        Returns:
+            An ``(etag, last_modified)`` pair; ``last_modified`` is a
+            timestamp or None.
+        """
+        values = queryset.order_by().aggregate(**change_aggregates(self.get_serializer()))
+        # The query string (fields, expand, cursor...) and the output format
+        # change the body too.
+        renderer = getattr(self.request, 'accepted_renderer', None)
+        digest = hashlib.sha1(repr((
+            self.request.get_full_path(),
+            getattr(renderer, 'format', None),
+            sorted((name, str(value)) for name, value in values.items()),
+        )).encode()).hexdigest()
+        last_modified = None
+        if with_last_modified and values['count']:
+            timestamps = [value for name, value in values.items() if name.startswith('updated_') and value]
+            if timestamps:
+                last_modified = int(max(timestamps).timestamp())
+        return f'W/{quote_etag(digest)}', last_modified
+
+    def _conditional(self, request, queryset, with_last_modified, respond, *args, **kwargs):
+        etag, last_modified = self.get_validators(queryset, with_last_modified)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = respond(request, *args, **kwargs)
+            if response.status_code not in (200, 304):
+                return response
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
@@ -1,11 +1,7 @@
-from .models import RelationshipRequest
+from .db.relationships import RelationshipsDB
 
 def pending_requests(request):
     """Add pending relationship requests count to the template context."""
     if request.user.is_authenticated:
-        pending_count = RelationshipRequest.objects.filter(
-            to_user=request.user.userprofile,
-            status='pending'
-        ).count()
-        return {'pending_requests_count': pending_count}
-    return {'pending_requests_count': 0} 
\ No newline at end of file
+        return {'pending_requests_count': RelationshipsDB.get_pending_count(request.user)}
+    return {'pending_requests_count': 0}
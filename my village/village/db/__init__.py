@@ -9,7 +9,10 @@ from .location_hierarchy import LocationHierarchyDB
 from .community_events import CommunityEventsDB
 from .village_services import VillageServicesDB
 from .relationships import RelationshipsDB
-from .aadhaar_verification import AadhaarVerificationDB
+from .recommendations import RecommendationsDB
+from .kinship import KinshipDB
+from .communities import CommunitiesDB
+from .sync import SyncDB
 
 __all__ = [
     'UserManagementDB',
@@ -17,5 +20,8 @@ __all__ = [
     'CommunityEventsDB',
     'VillageServicesDB',
     'RelationshipsDB',
-    'AadhaarVerificationDB',
+    'RecommendationsDB',
+    'KinshipDB',
+    'CommunitiesDB',
+    'SyncDB',
 ] 
\ No newline at end of file
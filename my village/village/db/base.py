@@ -7,9 +7,14 @@ This module provides common functionality for all database modules.
 from django.db import models
 from django.db.models import Q
 from typing import List, Dict, Any, Optional, Union, Type, TypeVar
+from .search_backends import get_search_backend
 
 T = TypeVar('T', bound=models.Model)
 
+# How many more ranked ids than wanted to read from the full-text index when
+# the results are filtered further.
+SEARCH_OVERFETCH = 4
+
 class BaseDB:
     """
     Base class for all database modules.
@@ -110,26 +115,52 @@ class BaseDB:
             return False
     
     @staticmethod
-    def search(model_class: Type[T], query: str, fields: List[str]) -> List[T]:
+    def search(model_class: Type[T], query: str, fields: List[str],
+               queryset: Optional[models.QuerySet] = None, limit: Optional[int] = None) -> List[T]:
         """
         Search for model instances by the given query in the specified fields.
         
+        Models with a full-text index (see ``search_backends``) are searched
+        through it and come back most relevant first; other models fall back
+        to ``icontains`` matching.
+        
         Args:
             model_class: The model class to query.
             query: The search query.
             fields: The fields to search in.
+            queryset: Restrict the results to this queryset (default: all).
+            limit: The maximum number of results.
             
         Returns:
             A list of model instances matching the query.
         """
         if not query:
             return []
+        if queryset is None:
+            queryset = model_class.objects.all()
+        
+        backend = get_search_backend()
+        if backend is not None and backend.supports(model_class, fields):
+            if limit is None or not queryset.query.where:
+                ids = backend.search(model_class, query, fields, limit=limit)
+                found = queryset.in_bulk(ids)
+                return [found[pk] for pk in ids if pk in found][:limit]
+            # The queryset's filter may drop some of the ranked ids: fetch a
+            # few times more than needed, and more again if that falls short.
+            fetch = limit * SEARCH_OVERFETCH
+            while True:
+                ids = backend.search(model_class, query, fields, limit=fetch)
+                found = queryset.in_bulk(ids)
+                results = [found[pk] for pk in ids if pk in found]
+                if len(results) >= limit or len(ids) < fetch:
+                    return results[:limit]
+                fetch *= SEARCH_OVERFETCH
         
         q_objects = Q()
         for field in fields:
             q_objects |= Q(**{f"{field}__icontains": query})
         
-        return list(model_class.objects.filter(q_objects))
+        return list(queryset.filter(q_objects)[:limit])
     
     @staticmethod
     def count(model_class: Type[T], **kwargs) -> int:
@@ -0,0 +1,52 @@
+"""
+Cache Versions module for database operations.
+
+This module provides the shared version counters used to invalidate
+per-process caches across workers.
+"""
+
+from django.db.models import F
+from django.utils import timezone
+from .base import BaseDB
+from ..models import CacheVersion
+
+class CacheVersionsDB(BaseDB):
+    """
+    Class for reading and bumping cache version counters.
+    """
+    
+    LOCATION_HIERARCHY = 'location_hierarchy'
+    RELATIONSHIP_GRAPH = 'relationship_graph'
+    
+    @classmethod
+    def get_version(cls, key: str) -> int:
+        """
+        Get the current version of a cache.
+        
+        Args:
+            key: The name of the cache.
+            
+        Returns:
+            The current version, or 0 if the cache has never been bumped.
+        """
+        version = CacheVersion.objects.filter(key=key).values_list('version', flat=True).first()
+        return version or 0
+    
+    @classmethod
+    def bump_version(cls, key: str) -> int:
+        """
+        Increment the version of a cache.
+        
+        Args:
+            key: The name of the cache.
+            
+        Returns:
+            The new version.
+        """
+        updated = CacheVersion.objects.filter(key=key).update(
+            version=F('version') + 1,
+            updated_at=timezone.now()
+        )
+        if not updated:
+            CacheVersion.objects.get_or_create(key=key, defaults={'version': 1})
+        return cls.get_version(key)
@@ -0,0 +1,168 @@
+"""
+Communities module for database operations.
+
+This module detects social clusters in the relationship graph with label
+propagation, run entirely on SciPy sparse matrices so it scales to
+statewide graphs, stores each profile's cluster in ``UserProfile.cluster_id``
+and reports cluster statistics per village.
+"""
+
+from collections import defaultdict
+from typing import Any, Dict, List
+from django.db import connection, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+from .base import BaseDB
+from .relationship_graph import adjacency_matrix
+from .sync import SyncDB
+from ..models import UserProfile
+
+class CommunitiesDB(BaseDB):
+    """
+    Class for detecting and reading relationship clusters.
+    """
+
+    MAX_ITERATIONS = 30
+    # Profiles whose cluster_changes counters are reset per query.
+    CHUNK_SIZE = 500
+
+    @classmethod
+    def detect(cls, full: bool = False, seed: int = 0) -> Dict[str, int]:
+        """
+        Run community detection and store the clusters.
+
+        Every round, each profile finds the label most common among its
+        connections (keeping its own on a tie), computed for all of them at
+        once as a sparse product of the adjacency matrix with a one-hot label
+        matrix, and a random half of those whose label differs take it.
+        Moving only half per round stops pairs of profiles from swapping
+        labels forever. Detection stops once (almost) nobody would move.
+
+        Once clusters exist, a run without ``full`` only relabels profiles
+        whose relationships changed since the last run (``cluster_changes``),
+        their connections and profiles never assigned a cluster; everyone
+        else keeps theirs. Run a full detection now and then to pick up larger shifts.
+
+        Args:
+            full: Relabel everyone, starting from one cluster per profile.
+            seed: Seed for the random update order and tie-breaking.
+
+        Returns:
+            A dictionary with the number of 'profiles' relabelled, 'changed'
+            cluster ids and 'iterations' run.
+        """
+        import numpy as np
+        from scipy import sparse
+
+        rows = list(UserProfile.objects.order_by('pk').values_list('pk', 'cluster_id', 'cluster_changes'))
+        if not rows:
+            return {'profiles': 0, 'changed': 0, 'iterations': 0}
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        stored = np.array([row[1] if row[1] is not None else -1 for row in rows], dtype=np.int64)
+        changes = np.array([row[2] for row in rows], dtype=np.int64)
+        dirty = changes > 0
+        n = len(ids)
+        adjacency = adjacency_matrix(ids)
+
+        # Labels are row numbers of the profile a cluster is named after.
+        labels = np.arange(n)
+        incremental = not full and (stored >= 0).any()
+        if incremental:
+            positions = np.minimum(np.searchsorted(ids, stored), n - 1)
+            known = (stored >= 0) & (ids[positions] == stored)
+            labels[known] = positions[known]
+            # The changed profiles, everyone connected to them
+            # and anyone who has never been assigned a cluster.
+            active = dirty | (stored < 0)
+            active[adjacency[np.flatnonzero(dirty)].indices] = True
+        else:
+            active = np.ones(n, dtype=bool)
+
+        rng = np.random.default_rng(seed)
+        everyone = np.arange(n)
+        candidates = np.flatnonzero(active)
+        iterations = 0
+        while iterations < cls.MAX_ITERATIONS and len(candidates):
+            iterations += 1
+            membership = sparse.csr_matrix((np.ones(n, dtype=np.float32), (everyone, labels)), shape=(n, n))
+            votes = (adjacency[candidates] @ membership).tocsr()
+            # Own label counts half a vote, so it wins ties but not majorities;
+            # the noise (< 0.5) breaks ties between other labels at random.
+            votes = (votes + 0.5 * membership[candidates]).tocsr()
+            votes.data += rng.random(votes.nnz).astype(np.float32) * 0.25
+            best = np.asarray(votes.argmax(axis=1)).ravel()
+            moving = best != labels[candidates]
+            # Checking a random half only could stop while others still want
+            # to move; all of them are checked, and half of the movers move.
+            if moving.sum() <= len(candidates) // 10000:
+                break
+            moving &= rng.random(len(candidates)) < 0.5
+            labels[candidates[moving]] = best[moving]
+
+        if not incremental:
+            # Name each cluster after its lowest profile id, so that repeated
+            # full runs keep the ids of clusters that did not change.
+            first = np.full(n, n, dtype=np.int64)
+            np.minimum.at(first, labels, everyone)
+            labels = first[labels]
+
+        relabelled = np.flatnonzero(active)
+        clusters = ids[labels[relabelled]]
+        changed = relabelled[clusters != stored[relabelled]]
+        table = connection.ops.quote_name(UserProfile._meta.db_table)
+        # Reset each counter only if it still holds the value read above, so
+        # that a relationship changed during the run is seen by the next one.
+        dirty_ids = defaultdict(list)
+        for pk, count in zip(ids[dirty].tolist(), changes[dirty].tolist()):
+            dirty_ids[count].append(pk)
+        with SyncDB.hold('detect_communities'), transaction.atomic():
+            now = connection.ops.adapt_datetimefield_value(timezone.now())
+            updates = [(cluster, now, pk) for cluster, pk in zip(ids[labels[changed]].tolist(), ids[changed].tolist())]
+            with connection.cursor() as cursor:
+                cursor.executemany(f'UPDATE {table} SET cluster_id = %s, updated_at = %s WHERE id = %s', updates)
+            for count, pks in dirty_ids.items():
+                for start in range(0, len(pks), cls.CHUNK_SIZE):
+                    UserProfile.objects.filter(
+                        pk__in=pks[start:start + cls.CHUNK_SIZE], cluster_changes=count
+                    ).update(cluster_changes=0)
+        return {'profiles': len(relabelled), 'changed': len(updates), 'iterations': iterations}
+
+    @classmethod
+    def mark_dirty(cls, *profile_ids: int) -> None:
+        """Flag profiles whose relationships changed for the next incremental run."""
+        UserProfile.objects.filter(pk__in=profile_ids).update(cluster_changes=F('cluster_changes') + 1)
+
+    @classmethod
+    def get_village_clusters(cls, village_id: int, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Get the clusters a village's members belong to.
+
+        Args:
+            village_id: The ID of the village.
+            limit: The maximum number of clusters to return.
+
+        Returns:
+            The largest clusters among the village's members, each with
+            'cluster_id', 'members' (in this village), 'size' (overall),
+            'villages' (how many villages it spans) and 'share' (the
+            fraction of the cluster living in this village).
+        """
+        local = list(
+            UserProfile.objects.filter(village_id=village_id, cluster_id__isnull=False)
+            .values('cluster_id').annotate(members=Count('id')).order_by('-members', 'cluster_id')[:limit]
+        )
+        totals = {
+            row['cluster_id']: row
+            for row in UserProfile.objects.filter(cluster_id__in=[row['cluster_id'] for row in local])
+            .values('cluster_id').annotate(size=Count('id'), villages=Count('village', distinct=True))
+        }
+        return [
+            {
+                'cluster_id': row['cluster_id'],
+                'members': row['members'],
+                'size': totals[row['cluster_id']]['size'],
+                'villages': totals[row['cluster_id']]['villages'],
+                'share': round(row['members'] / totals[row['cluster_id']]['size'], 3),
+            }
+            for row in local
+        ]
@@ -285,21 +285,21 @@ class CommunityEventsDB(BaseDB):
         return sum(contribution.amount for contribution in contributions)
     
     @classmethod
-    def search_events(cls, query: str, village_id: int = None) -> List[CommunityEvent]:
+    def search_events(cls, query: str, village_id: int = None, limit: int = None) -> List[CommunityEvent]:
         """
         Search for events by the given query.
         
         Args:
             query: The search query.
             village_id: The ID of the village to filter by, or None for all villages.
+            limit: The maximum number of results, or None for all.
             
         Returns:
-            A list of events matching the query.
+            A list of events matching the query, most relevant first.
         """
         fields = ['title', 'description', 'location', 'contact_person', 'notes']
-        events = cls.search(CommunityEvent, query, fields)
-        
+        queryset = CommunityEvent.objects.all()
         if village_id:
-            return [event for event in events if event.village_id == village_id]
+            queryset = queryset.filter(village_id=village_id)
         
-        return events 
\ No newline at end of file
+        return cls.search(CommunityEvent, query, fields, queryset=queryset, limit=limit)
@@ -0,0 +1,255 @@
+"""
+Kinship module for database operations.
+
+This module manages typed family links between user profiles and the
+``Lineage`` table that materializes every ancestor/descendant pair, so a
+family tree of any depth is read with a single query instead of one lookup
+per generation.
+"""
+
+from collections import defaultdict, deque
+from typing import Any, Dict, Iterable, List, Optional, Set
+from django.db import transaction
+from django.db.models import Q
+from .base import BaseDB
+from ..graph_images import display_name
+from ..models import KinshipEdge, Lineage, UserProfile
+
+class KinshipDB(BaseDB):
+    """
+    Class for interacting with kinship links and lineage.
+    """
+
+    MAX_GENERATIONS = 10
+    LINEAGE_KINDS = ('parent', 'child')
+
+    @classmethod
+    def add_relative(cls, person: UserProfile, relative: UserProfile, kind: str) -> KinshipEdge:
+        """
+        Record that ``person`` is the ``kind`` of ``relative`` (and the
+        inverse link), replacing any earlier link between the two.
+
+        Args:
+            person: The profile the kind describes.
+            relative: The profile they are related to.
+            kind: One of ``KinshipEdge.KINDS``.
+
+        Returns:
+            The link from ``person`` to ``relative``.
+
+        Raises:
+            ValueError: If the kind is unknown, the profiles are the same, or
+                the link would make someone their own ancestor.
+        """
+        if kind not in KinshipEdge.INVERSE_KINDS:
+            raise ValueError(f"Unknown kinship kind '{kind}'.")
+        if person.pk == relative.pk:
+            raise ValueError('A member cannot be their own relative.')
+
+        with transaction.atomic():
+            previous = KinshipEdge.objects.filter(person=person, relative=relative).values_list('kind', flat=True).first()
+            if previous in cls.LINEAGE_KINDS:
+                # Drop the old parent link first, so that the check below does
+                # not see the lineage it is being replaced from (as when
+                # reversing a link entered the wrong way round).
+                affected = cls.with_descendants([person.pk, relative.pk])
+                KinshipEdge.objects.filter(
+                    Q(person=person, relative=relative) | Q(person=relative, relative=person)
+                ).delete()
+                cls.rebuild_lineage(affected)
+            if kind in cls.LINEAGE_KINDS:
+                parent, child = (person, relative) if kind == 'parent' else (relative, person)
+                if Lineage.objects.filter(ancestor=child, descendant=parent).exists():
+                    # Leaving the atomic block restores the old link.
+                    raise ValueError('This link would make a member their own ancestor.')
+
+            edge, _ = KinshipEdge.objects.update_or_create(person=person, relative=relative, defaults={'kind': kind})
+            KinshipEdge.objects.update_or_create(
+                person=relative, relative=person, defaults={'kind': KinshipEdge.INVERSE_KINDS[kind]}
+            )
+            if kind in cls.LINEAGE_KINDS:
+                cls.rebuild_lineage(cls.with_descendants([person.pk, relative.pk]))
+        return edge
+
+    @classmethod
+    def remove_relative(cls, person: UserProfile, relative: UserProfile) -> bool:
+        """
+        Remove the link between two profiles, in both directions.
+
+        Args:
+            person: One of the profiles.
+            relative: The other profile.
+
+        Returns:
+            True if there was a link, False otherwise.
+        """
+        with transaction.atomic():
+            links = KinshipEdge.objects.filter(
+                Q(person=person, relative=relative) | Q(person=relative, relative=person)
+            )
+            kinds = set(links.values_list('kind', flat=True))
+            if not kinds:
+                return False
+            affected = cls.with_descendants([person.pk, relative.pk])
+            links.delete()
+            if kinds & set(cls.LINEAGE_KINDS):
+                cls.rebuild_lineage(affected)
+        return True
+
+    @classmethod
+    def rebuild_lineage(cls, profile_ids: Optional[Iterable[int]] = None) -> int:
+        """
+        Recompute the lineage rows of some profiles from the parent links.
+
+        The set must contain the descendants of every profile in it (see
+        ``with_descendants``); ancestors outside the set are read from their
+        existing lineage rows.
+
+        Args:
+            profile_ids: The profiles whose ancestors changed (default:
+                everyone, rebuilding the whole table).
+
+        Returns:
+            The number of lineage rows written.
+        """
+        full = profile_ids is None
+        parent_links = KinshipEdge.objects.filter(kind='parent')
+        if not full:
+            profile_ids = set(profile_ids)
+            parent_links = parent_links.filter(relative_id__in=profile_ids)
+        parents = defaultdict(list)
+        for child, parent in parent_links.values_list('relative_id', 'person_id'):
+            parents[child].append(parent)
+        if full:
+            profile_ids = set(parents) | {parent for found in parents.values() for parent in found}
+
+        # Ancestors of parents outside the set are already correct.
+        closure: Dict[int, Dict[int, int]] = defaultdict(dict)
+        outside = {parent for found in parents.values() for parent in found if parent not in profile_ids}
+        for descendant, ancestor, depth in Lineage.objects.filter(descendant_id__in=outside).values_list(
+            'descendant_id', 'ancestor_id', 'depth'
+        ):
+            closure[descendant][ancestor] = depth
+
+        # Parents before children (Kahn's algorithm within the set).
+        waiting = {pk: sum(1 for parent in parents[pk] if parent in profile_ids) for pk in profile_ids}
+        children = defaultdict(list)
+        for child, found in parents.items():
+            for parent in found:
+                if parent in profile_ids:
+                    children[parent].append(child)
+        ready = deque(pk for pk, count in waiting.items() if count == 0)
+        rows = []
+        while ready:
+            pk = ready.popleft()
+            ancestors: Dict[int, int] = {}
+            for parent in parents[pk]:
+                ancestors[parent] = 1
+                for ancestor, depth in closure[parent].items():
+                    if depth + 1 < ancestors.get(ancestor, depth + 2):
+                        ancestors[ancestor] = depth + 1
+            closure[pk] = ancestors
+            rows.extend(Lineage(ancestor_id=ancestor, descendant_id=pk, depth=depth) for ancestor, depth in ancestors.items())
+            for child in children[pk]:
+                waiting[child] -= 1
+                if waiting[child] == 0:
+                    ready.append(child)
+
+        with transaction.atomic():
+            stale = Lineage.objects.all() if full else Lineage.objects.filter(descendant_id__in=profile_ids)
+            stale.delete()
+            Lineage.objects.bulk_create(rows, batch_size=2000)
+        return len(rows)
+
+    @classmethod
+    def get_family_tree(cls, profile_id: int, generations: int = 3) -> Dict[str, Any]:
+        """
+        Get a profile's ancestors and descendants up to ``generations`` away,
+        with the parent links between them, in a single query.
+
+        Args:
+            profile_id: The ID of the profile at the root.
+            generations: How many generations to go up and down (capped at
+                ``MAX_GENERATIONS``).
+
+        Returns:
+            A dictionary with 'root', 'people' (id, label, generation:
+            negative for ancestors, positive for descendants) and 'links'
+            (parent, child).
+        """
+        generations = max(1, min(generations, cls.MAX_GENERATIONS))
+        ancestors = Lineage.objects.filter(descendant_id=profile_id, depth__lt=generations).values('ancestor_id')
+        descendants = Lineage.objects.filter(ancestor_id=profile_id, depth__lt=generations).values('descendant_id')
+        links = list(
+            Lineage.objects.filter(depth=1).filter(
+                Q(descendant_id=profile_id) | Q(descendant_id__in=ancestors)
+                | Q(ancestor_id=profile_id) | Q(ancestor_id__in=descendants)
+            ).select_related('ancestor__user', 'descendant__user')
+        )
+
+        labels = {}
+        parents_of = defaultdict(list)
+        children_of = defaultdict(list)
+        for link in links:
+            labels[link.ancestor_id] = display_name(link.ancestor.user)
+            labels[link.descendant_id] = display_name(link.descendant.user)
+            parents_of[link.descendant_id].append(link.ancestor_id)
+            children_of[link.ancestor_id].append(link.descendant_id)
+
+        # Generations relative to the root, walking up and down separately.
+        found = {profile_id: 0}
+        for step, neighbours in ((-1, parents_of), (1, children_of)):
+            queue = deque([profile_id])
+            seen: Set[int] = {profile_id}
+            while queue:
+                current = queue.popleft()
+                for pk in neighbours[current]:
+                    if pk not in seen:
+                        seen.add(pk)
+                        found.setdefault(pk, found[current] + step)
+                        queue.append(pk)
+
+        if profile_id not in labels:
+            profile = UserProfile.objects.select_related('user').filter(pk=profile_id).first()
+            labels[profile_id] = display_name(profile.user) if profile else ''
+        people: List[Dict[str, Any]] = [
+            {'id': pk, 'label': labels.get(pk, ''), 'generation': generation}
+            for pk, generation in sorted(found.items(), key=lambda item: (item[1], item[0]))
+        ]
+        return {
+            'root': profile_id,
+            'people': people,
+            'links': [{'parent': link.ancestor_id, 'child': link.descendant_id} for link in links],
+        }
+
+    @classmethod
+    def get_relatives(cls, profile: UserProfile) -> List[KinshipEdge]:
+        """
+        Get a profile's direct kinship links (parents, children, spouses and
+        siblings).
+
+        Args:
+            profile: The profile to get the relatives of.
+
+        Returns:
+            The links from the profile, with the relatives' users loaded.
+        """
+        return list(
+            KinshipEdge.objects.filter(person=profile).select_related('relative__user').order_by('kind', 'relative_id')
+        )
+
+    @classmethod
+    def with_descendants(cls, profile_ids: Iterable[int]) -> Set[int]:
+        """
+        Get some profiles plus all of their descendants.
+
+        Args:
+            profile_ids: The IDs of the profiles.
+
+        Returns:
+            A set of profile IDs.
+        """
+        profile_ids = set(profile_ids)
+        return profile_ids | set(
+            Lineage.objects.filter(ancestor_id__in=profile_ids).values_list('descendant_id', flat=True)
+        )
@@ -5,67 +5,22 @@ This module provides functionality for interacting with location-related models.
 """
 
 from typing import List, Dict, Any, Optional, Union, Tuple
+from django.db import transaction
+from django.db.models import Count, QuerySet
 from .base import BaseDB
-from ..models import State, District, Block, PoliceStation, PostOffice, Panchayat, Village
+from .location_search import get_autocomplete_index
+from .location_tree import get_location_tree
+from ..models import (
+    District, Block, PoliceStation, PostOffice, Panchayat, Village,
+    UserProfile, CommunityEvent, LocationClosure, LOCATION_MODELS, LOCATION_LEVELS
+)
+from ..phonetics import phonetic_key
 
 class LocationHierarchyDB(BaseDB):
     """
     Class for interacting with location-related models.
     """
     
-    @classmethod
-    def get_state_by_id(cls, state_id: int) -> Optional[State]:
-        """
-        Get a state by its ID.
-        
-        Args:
-            state_id: The ID of the state to retrieve.
-            
-        Returns:
-            The state if found, None otherwise.
-        """
-        return cls.get_by_id(State, state_id)
-    
-    @classmethod
-    def get_state_by_name(cls, state_name: str) -> Optional[State]:
-        """
-        Get a state by its name.
-        
-        Args:
-            state_name: The name of the state to retrieve.
-            
-        Returns:
-            The state if found, None otherwise.
-        """
-        try:
-            return State.objects.get(name=state_name)
-        except State.DoesNotExist:
-            return None
-    
-    @classmethod
-    def get_all_states(cls) -> List[State]:
-        """
-        Get all states.
-        
-        Returns:
-            A list of all states.
-        """
-        return cls.get_all(State)
-    
-    @classmethod
-    def create_state(cls, name: str, code: str = None) -> State:
-        """
-        Create a new state.
-        
-        Args:
-            name: The name of the state.
-            code: The code of the state.
-            
-        Returns:
-            The created state.
-        """
-        return cls.create(State, name=name, code=code)
-    
     @classmethod
     def get_district_by_id(cls, district_id: int) -> Optional[District]:
         """
@@ -80,34 +35,30 @@ class LocationHierarchyDB(BaseDB):
         return cls.get_by_id(District, district_id)
     
     @classmethod
-    def get_districts_by_state(cls, state_id: int) -> List[District]:
+    def get_districts_by_state(cls, state: str) -> List[District]:
         """
         Get all districts in a state.
         
         Args:
-            state_id: The ID of the state.
+            state: The name of the state.
             
         Returns:
             A list of districts in the state.
         """
-        return cls.filter(District, state_id=state_id)
+        return cls.filter(District, state=state)
     
     @classmethod
-    def create_district(cls, name: str, state_id: int) -> District:
+    def create_district(cls, name: str, state: str = 'Bihar') -> District:
         """
         Create a new district.
         
         Args:
             name: The name of the district.
-            state_id: The ID of the state.
+            state: The name of the state.
             
         Returns:
             The created district.
         """
-        state = cls.get_state_by_id(state_id)
-        if not state:
-            raise ValueError(f"State with ID {state_id} not found.")
-        
         return cls.create(District, name=name, state=state)
     
     @classmethod
@@ -336,61 +287,319 @@ class LocationHierarchyDB(BaseDB):
         """
         Get the complete location hierarchy for a village.
         
+        The hierarchy is answered from the in-memory location tree, so no
+        queries are made once the tree has been built.
+        
         Args:
             village_id: The ID of the village.
             
         Returns:
-            A dictionary containing the complete location hierarchy.
+            A dictionary mapping each level to a ``LocationNode``, plus the
+            name of the state.
         """
-        village = cls.get_village_by_id(village_id)
-        if not village:
+        path = get_location_tree().get_path('village', village_id)
+        if not path:
             return {}
         
-        panchayat = village.panchayat
-        post_office = panchayat.post_office
-        police_station = post_office.police_station
-        block = police_station.block
-        district = block.district
-        state = district.state
+        district = path.get('district')
+        path['state'] = district.extra if district else None
+        return path
+    
+    @classmethod
+    def filter_villages(cls, queryset: QuerySet, params: Dict[str, Any]) -> QuerySet:
+        """
+        Filter a village queryset by any level of the hierarchy.
+        
+        Each level is matched on the village's own denormalized column, so
+        every filter is a single indexed lookup.
         
-        return {
-            'village': village,
-            'panchayat': panchayat,
-            'post_office': post_office,
-            'police_station': police_station,
-            'block': block,
-            'district': district,
-            'state': state
-        }
+        Args:
+            queryset: The village queryset to filter.
+            params: A mapping such as ``request.GET``; keys named after a
+                level ('district', 'block', ...) hold the ID to filter by.
+                Values that are not IDs are ignored. 'q' keeps villages
+                whose name sounds like it starts with the given text.
+            
+        Returns:
+            The filtered queryset.
+        """
+        for level in list(LOCATION_LEVELS)[:-1]:
+            value = params.get(level)
+            if value and str(value).isdigit():
+                queryset = queryset.filter(**{f'{level}_id': int(value)})
+        
+        key = phonetic_key(params.get('q') or '')
+        if key:
+            # A range scan on the indexed key; keys only contain a-z and spaces.
+            queryset = queryset.filter(name_phonetic__gte=key, name_phonetic__lt=key + '{')
+        return queryset
     
     @classmethod
-    def search_locations(cls, query: str) -> Dict[str, List[Any]]:
+    def search_locations(cls, query: str, limit: int = 50) -> Dict[str, List[Any]]:
         """
         Search for locations by the given query.
         
+        Matches come from the in-memory autocomplete index (exact, prefix and
+        fuzzy name matches, and village codes) rather than table scans; only
+        the matching rows are then loaded, with one query per level.
+        
         Args:
             query: The search query.
+            limit: The maximum number of matches across all levels.
             
         Returns:
             A dictionary containing lists of matching locations for each level.
         """
+        results = {f'{level}s': [] for level in LOCATION_LEVELS}
         if not query:
-            return {
-                'states': [],
-                'districts': [],
-                'blocks': [],
-                'police_stations': [],
-                'post_offices': [],
-                'panchayats': [],
-                'villages': []
-            }
+            return results
+        
+        matches = get_autocomplete_index().search(query, limit=limit)
+        for level, model in LOCATION_LEVELS.items():
+            ids = [match['id'] for match in matches if match['level'] == level]
+            if ids:
+                found = model.objects.in_bulk(ids)
+                results[f'{level}s'] = [found[pk] for pk in ids if pk in found]
+        return results
+    
+    @classmethod
+    def get_descendants(cls, level: str, id: int, target_level: str) -> QuerySet:
+        """
+        Get all locations of one level below a location, at any depth.
         
+        Args:
+            level: The level of the ancestor (e.g. 'block').
+            id: The ID of the ancestor.
+            target_level: The level of the descendants to return (e.g. 'village').
+            
+        Returns:
+            A queryset of the descendants, resolved through the closure table.
+        """
+        model = cls._get_level_model(target_level)
+        descendant_ids = LocationClosure.objects.filter(
+            ancestor_level=level,
+            ancestor_id=id,
+            descendant_level=target_level
+        ).values('descendant_id')
+        return model.objects.filter(pk__in=descendant_ids)
+    
+    @classmethod
+    def get_ancestors(cls, level: str, id: int) -> Dict[str, Any]:
+        """
+        Get all ancestors of a location.
+        
+        Args:
+            level: The level of the location (e.g. 'village').
+            id: The ID of the location.
+            
+        Returns:
+            A dictionary mapping each ancestor level to its instance, ordered
+            from the district down (empty if the location does not exist).
+        """
+        model = cls._get_level_model(level)
+        # The denormalized ancestor columns are joined in a single query.
+        location = model.objects.select_related(*model.ancestor_fields).filter(pk=id).first()
+        if location is None:
+            return {}
         return {
-            'states': cls.search(State, query, ['name', 'code']),
-            'districts': cls.search(District, query, ['name']),
-            'blocks': cls.search(Block, query, ['name']),
-            'police_stations': cls.search(PoliceStation, query, ['name']),
-            'post_offices': cls.search(PostOffice, query, ['name']),
-            'panchayats': cls.search(Panchayat, query, ['name']),
-            'villages': cls.search(Village, query, ['name', 'code'])
-        } 
\ No newline at end of file
+            field: getattr(location, field)
+            for field in model.ancestor_fields
+            if getattr(location, f'{field}_id') is not None
+        }
+    
+    @classmethod
+    def count_descendants(cls, level: str, id: int) -> Dict[str, int]:
+        """
+        Count the locations below a location, grouped by level.
+        
+        Args:
+            level: The level of the ancestor.
+            id: The ID of the ancestor.
+            
+        Returns:
+            A dictionary mapping each descendant level to its count.
+        """
+        rows = LocationClosure.objects.filter(
+            ancestor_level=level,
+            ancestor_id=id,
+            depth__gt=0
+        ).values('descendant_level').annotate(total=Count('descendant_id'))
+        return {row['descendant_level']: row['total'] for row in rows}
+    
+    @classmethod
+    def get_user_profiles_in(cls, level: str, id: int) -> QuerySet:
+        """
+        Get all user profiles whose village lies below a location.
+        
+        Args:
+            level: The level of the location.
+            id: The ID of the location.
+            
+        Returns:
+            A queryset of user profiles.
+        """
+        return UserProfile.objects.filter(village__in=cls.get_descendants(level, id, 'village'))
+    
+    @classmethod
+    def get_events_in(cls, level: str, id: int) -> QuerySet:
+        """
+        Get all community events held in villages below a location.
+        
+        Args:
+            level: The level of the location.
+            id: The ID of the location.
+            
+        Returns:
+            A queryset of community events.
+        """
+        return CommunityEvent.objects.filter(village__in=cls.get_descendants(level, id, 'village'))
+    
+    @classmethod
+    def add_to_closure(cls, instance) -> None:
+        """
+        Insert the closure rows for a newly created location.
+        
+        Args:
+            instance: The location that was created.
+        """
+        LocationClosure.objects.bulk_create(cls._closure_rows(instance), ignore_conflicts=True)
+    
+    @classmethod
+    def add_many_to_closure(cls, instances: List[Any], batch_size: int = 1000) -> None:
+        """
+        Insert the closure rows for many newly created locations at once.
+        
+        Args:
+            instances: The locations that were created, with their ancestor
+                columns filled in.
+            batch_size: The number of rows to insert per query.
+        """
+        rows = []
+        for instance in instances:
+            rows.extend(cls._closure_rows(instance))
+            if len(rows) >= batch_size:
+                LocationClosure.objects.bulk_create(rows, batch_size=batch_size, ignore_conflicts=True)
+                rows = []
+        if rows:
+            LocationClosure.objects.bulk_create(rows, batch_size=batch_size, ignore_conflicts=True)
+    
+    @classmethod
+    def move_in_closure(cls, instance) -> None:
+        """
+        Re-link a location and its whole subtree under its new ancestors.
+        
+        Args:
+            instance: The location whose parent changed.
+        """
+        level = instance.hierarchy_level
+        upper_levels = list(instance.ancestor_fields)
+        subtree = list(LocationClosure.objects.filter(
+            ancestor_level=level,
+            ancestor_id=instance.pk
+        ).values_list('descendant_level', 'descendant_id', 'depth'))
+        
+        with transaction.atomic():
+            for descendant_level in {row[0] for row in subtree}:
+                LocationClosure.objects.filter(
+                    ancestor_level__in=upper_levels,
+                    descendant_level=descendant_level,
+                    descendant_id__in=LocationClosure.objects.filter(
+                        ancestor_level=level,
+                        ancestor_id=instance.pk,
+                        descendant_level=descendant_level
+                    ).values('descendant_id')
+                ).delete()
+            
+            ancestors = cls._ancestor_depths(instance)
+            LocationClosure.objects.bulk_create([
+                LocationClosure(
+                    ancestor_level=ancestor_level,
+                    ancestor_id=ancestor_id,
+                    descendant_level=descendant_level,
+                    descendant_id=descendant_id,
+                    depth=depth + ancestor_depth
+                )
+                for descendant_level, descendant_id, depth in subtree
+                for ancestor_level, ancestor_id, ancestor_depth in ancestors
+            ], batch_size=1000, ignore_conflicts=True)
+    
+    @classmethod
+    def remove_from_closure(cls, instance) -> None:
+        """
+        Delete the closure rows of a deleted location.
+        
+        Args:
+            instance: The location that was deleted.
+        """
+        level = instance.hierarchy_level
+        LocationClosure.objects.filter(descendant_level=level, descendant_id=instance.pk).delete()
+        LocationClosure.objects.filter(ancestor_level=level, ancestor_id=instance.pk).delete()
+    
+    @classmethod
+    @transaction.atomic
+    def rebuild_closure(cls, batch_size: int = 1000) -> int:
+        """
+        Rebuild the whole closure table from the ancestor columns.
+        
+        Args:
+            batch_size: The number of rows to insert per query.
+            
+        Returns:
+            The number of closure rows written.
+        """
+        LocationClosure.objects.all().delete()
+        
+        written = 0
+        for model in LOCATION_MODELS:
+            fields = ['pk'] + [f'{field}_id' for field in model.ancestor_fields]
+            batch = []
+            for values in model.objects.values_list(*fields).iterator(chunk_size=batch_size):
+                node = model(pk=values[0], **dict(zip(fields[1:], values[1:])))
+                batch.extend(cls._closure_rows(node))
+                if len(batch) >= batch_size:
+                    LocationClosure.objects.bulk_create(batch, batch_size=batch_size)
+                    written += len(batch)
+                    batch = []
+            if batch:
+                LocationClosure.objects.bulk_create(batch, batch_size=batch_size)
+                written += len(batch)
+        return written
+    
+    @classmethod
+    def _closure_rows(cls, instance) -> List[LocationClosure]:
+        """
+        Build the closure rows linking a location to itself and its ancestors.
+        """
+        level = instance.hierarchy_level
+        return [
+            LocationClosure(
+                ancestor_level=ancestor_level,
+                ancestor_id=ancestor_id,
+                descendant_level=level,
+                descendant_id=instance.pk,
+                depth=depth
+            )
+            for ancestor_level, ancestor_id, depth in [(level, instance.pk, 0)] + cls._ancestor_depths(instance)
+        ]
+    
+    @classmethod
+    def _ancestor_depths(cls, instance) -> List[Tuple[str, int, int]]:
+        """
+        Return ``(level, id, depth)`` for each known ancestor of a location.
+        """
+        count = len(instance.ancestor_fields)
+        return [
+            (field, ancestor_id, count - index)
+            for index, (field, ancestor_id) in enumerate(instance.get_ancestor_ids().items())
+            if ancestor_id is not None
+        ]
+    
+    @classmethod
+    def _get_level_model(cls, level: str):
+        """
+        Return the model for a hierarchy level name.
+        """
+        try:
+            return LOCATION_LEVELS[level]
+        except KeyError:
+            raise ValueError(f"Unknown location level '{level}'.")
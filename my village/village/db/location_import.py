@@ -0,0 +1,301 @@
+"""
+Location Import module for database operations.
+
+This module provides a bulk importer for the District > Block > PoliceStation >
+PostOffice > Panchayat > Village hierarchy. The source JSON is streamed one
+district at a time, existing rows are resolved from one prefetch per level and
+new rows are written with ``bulk_create``.
+"""
+
+import json
+import re
+import time
+from typing import Any, Dict, IO, Iterator, List, Optional, Tuple
+from django.db import transaction
+from .base import BaseDB
+from .location_hierarchy import LocationHierarchyDB
+from .location_tree import invalidate_location_tree
+from .sync import SyncDB
+from ..models import LOCATION_MODELS
+from ..phonetics import phonetic_key
+
+# The key holding each level's children in the source JSON.
+CHILD_KEYS = {
+    'district': 'blocks',
+    'block': 'police_stations',
+    'police_station': 'post_offices',
+    'post_office': 'panchayats',
+    'panchayat': 'villages',
+}
+
+# A whole string, a string cut off at the end of the buffer (a lone quote),
+# or one of the characters that delimit array items.
+_token = re.compile(r'"(?:[^"\\]|\\.)*"|["\[\]{},]', re.DOTALL)
+
+def iter_json_array(fp: IO[str], key: str, chunk_size: int = 1 << 16) -> Iterator[Any]:
+    """
+    Yield the items of a top-level JSON array one at a time.
+
+    Only the item currently being read is held in memory, so files far
+    larger than RAM can be read as long as each single item fits. The end of
+    each item is found by tracking the bracket depth outside strings, and the
+    item is then decoded once, so reading is linear in the size of the file.
+
+    Args:
+        fp: A text file object positioned at the start of the document.
+        key: The name of the top-level array to read (e.g. 'districts').
+        chunk_size: The number of characters to read at a time.
+
+    Returns:
+        An iterator over the decoded items.
+    """
+    buffer = ''
+
+    # Find the opening bracket of the array.
+    array_start = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+    while True:
+        match = array_start.search(buffer)
+        if match:
+            buffer = buffer[match.end():]
+            break
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            return
+        buffer += chunk
+
+    pieces: List[str] = []
+    depth = 0
+    while True:
+        start = 0
+        carry = ''
+        for match in _token.finditer(buffer):
+            token = match.group()
+            if len(token) > 1:
+                continue
+            if token == '"':
+                # The string is cut off at the end of the buffer; scan it
+                # again once the rest has been read.
+                carry = buffer[match.start():]
+                break
+            if token in '[{':
+                depth += 1
+            elif token in ']}' and depth:
+                depth -= 1
+            elif token in ',]' and not depth:
+                pieces.append(buffer[start:match.start()])
+                text = ''.join(pieces).strip()
+                pieces, start = [], match.end()
+                if text:
+                    yield json.loads(text)
+                if token == ']':
+                    return
+        pieces.append(buffer[start:len(buffer) - len(carry)])
+
+        # Read at least as much as is carried over, so that a string longer
+        # than a chunk is not rescanned once per chunk.
+        chunk = fp.read(max(chunk_size, len(carry)))
+        if not chunk:
+            raise ValueError(f"Unterminated '{key}' array")
+        buffer = carry + chunk
+
+def read_json_header(fp: IO[str], fields: Tuple[str, ...], limit: int = 1 << 16) -> Dict[str, str]:
+    """
+    Read top-level string fields (such as the state name) from the start of
+    a JSON document without decoding the rest of it.
+
+    Args:
+        fp: A text file object positioned at the start of the document.
+        fields: The names of the fields to look for.
+        limit: The number of characters to inspect.
+
+    Returns:
+        A dictionary of the fields that were found.
+    """
+    head = fp.read(limit)
+    fp.seek(0)
+    header = {}
+    for field in fields:
+        match = re.search(r'"%s"\s*:\s*("(?:[^"\\]|\\.)*")' % re.escape(field), head)
+        if match:
+            header[field] = json.loads(match.group(1))
+    return header
+
+class LocationImporter(BaseDB):
+    """
+    Class for bulk importing the location hierarchy.
+
+    Re-running an import is idempotent: a location is matched on its parent
+    and name, and only locations that do not exist yet are inserted.
+    """
+
+    def __init__(self, state: str = 'Bihar', batch_size: int = 1000):
+        self.state = state
+        self.batch_size = batch_size
+        self.index: Dict[str, Dict[Tuple[Optional[int], str], int]] = {}
+        self.created: Dict[str, int] = {model.hierarchy_level: 0 for model in LOCATION_MODELS}
+        self.matched: Dict[str, int] = {model.hierarchy_level: 0 for model in LOCATION_MODELS}
+        self.new_instances: List[Any] = []
+
+    def prefetch(self) -> None:
+        """
+        Load the (parent, name) -> id index of every level, one query per level.
+        """
+        for model in LOCATION_MODELS:
+            self.index[model.hierarchy_level] = self._index_rows(model, model.objects.all())
+
+    @classmethod
+    def _index_rows(cls, model, queryset) -> Dict[Tuple[Optional[int], str], int]:
+        """
+        Map (parent id, name) to the primary key for the rows of a queryset.
+        """
+        if not model.parent_field:
+            return {(None, name): pk for pk, name in queryset.values_list('pk', 'name').iterator(chunk_size=5000)}
+        return {
+            (parent_id, name): pk
+            for pk, name, parent_id in queryset.values_list('pk', 'name', f'{model.parent_field}_id').iterator(chunk_size=5000)
+        }
+
+    @classmethod
+    def get_name(cls, data: Dict[str, Any], level: str) -> str:
+        """
+        Read a location's name, accepting both 'name' and '<level>_name' keys.
+        """
+        return (data.get('name') or data.get(f'{level}_name') or '').strip()
+
+    def import_district(self, district_data: Dict[str, Any]) -> None:
+        """
+        Import one district and everything below it, level by level.
+
+        Args:
+            district_data: The decoded district object from the source JSON.
+        """
+        pending = [(district_data, {})]
+        for model in LOCATION_MODELS:
+            level = model.hierarchy_level
+            resolved, new_rows = self._resolve_level(model, pending)
+            if new_rows:
+                self._insert(model, new_rows)
+
+            child_key = CHILD_KEYS.get(level)
+            if not child_key:
+                break
+            pending = []
+            for data, ancestors, key in resolved:
+                ids = dict(ancestors, **{level: self.index[level][key]})
+                pending.extend((child, ids) for child in data.get(child_key, []) or [])
+
+    def run(self, districts: Iterator[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Import a stream of districts.
+
+        Args:
+            districts: An iterator over district objects.
+
+        Returns:
+            A summary with per-level counts, the elapsed time and the
+            throughput in rows per second.
+        """
+        started = time.monotonic()
+        self.prefetch()
+        for district_data in districts:
+            self.import_district(district_data)
+        self.flush()
+
+        elapsed = time.monotonic() - started
+        rows = sum(self.created.values()) + sum(self.matched.values())
+        return {
+            'created': dict(self.created),
+            'matched': dict(self.matched),
+            'rows': rows,
+            'seconds': elapsed,
+            'rows_per_second': rows / elapsed if elapsed else float(rows),
+        }
+
+    def flush(self) -> None:
+        """
+        Write the closure rows of the inserted locations and invalidate the
+        location tree once all districts have been processed.
+        """
+        LocationHierarchyDB.add_many_to_closure(self.new_instances, batch_size=self.batch_size)
+        if self.new_instances:
+            invalidate_location_tree()
+
+    @classmethod
+    def import_file(cls, fp: IO[str], batch_size: int = 1000, dry_run: bool = False, **kwargs) -> Dict[str, Any]:
+        """
+        Import a hierarchy JSON file inside a single transaction.
+
+        Args:
+            fp: The JSON file, opened in text mode.
+            batch_size: The number of rows per ``bulk_create`` query.
+            dry_run: Roll the transaction back instead of committing it.
+            **kwargs: Extra arguments for the importer class.
+
+        Returns:
+            The import summary (see ``run``).
+        """
+        header = read_json_header(fp, ('state', 'state_name'))
+        importer = cls(
+            state=header.get('state') or header.get('state_name') or 'Bihar',
+            batch_size=batch_size,
+            **kwargs
+        )
+        with SyncDB.hold(cls.__name__), transaction.atomic():
+            summary = importer.run(iter_json_array(fp, 'districts'))
+            if dry_run:
+                transaction.set_rollback(True)
+        return summary
+
+    def _resolve_level(self, model, pending):
+        """
+        Match the pending rows of one level against the index and build
+        instances for the ones that are missing.
+        """
+        level = model.hierarchy_level
+        index = self.index[level]
+        resolved = []
+        new_rows = {}
+        for data, ancestors in pending:
+            name = self.get_name(data, level)
+            if not name:
+                continue
+            key = (ancestors.get(model.parent_field), name)
+            resolved.append((data, ancestors, key))
+            if key in index:
+                self.matched[level] += 1
+            elif key not in new_rows:
+                new_rows[key] = self._build(model, name, ancestors, data)
+        return resolved, new_rows
+
+    def _build(self, model, name, ancestors, data):
+        """
+        Build an unsaved instance with its ancestor columns already filled in.
+        """
+        fields = {f'{field}_id': ancestors[field] for field in model.ancestor_fields}
+        if model.hierarchy_level == 'district':
+            fields['state'] = self.state
+        elif model.hierarchy_level == 'village':
+            fields['code'] = data.get('code')
+            fields['name_phonetic'] = phonetic_key(name)[:100]
+        return model(name=name, **fields)
+
+    def _insert(self, model, new_rows):
+        """
+        Insert new rows in batches and record their primary keys in the index.
+        """
+        level = model.hierarchy_level
+        instances = model.objects.bulk_create(list(new_rows.values()), batch_size=self.batch_size)
+
+        if any(instance.pk is None for instance in instances):
+            # Backends that cannot return ids from a bulk insert.
+            queryset = model.objects.filter(name__in=[name for _, name in new_rows])
+            if model.parent_field:
+                queryset = queryset.filter(**{f'{model.parent_field}_id__in': {parent_id for parent_id, _ in new_rows}})
+            fetched = self._index_rows(model, queryset)
+            for key, instance in new_rows.items():
+                instance.pk = fetched[key]
+
+        for key, instance in new_rows.items():
+            self.index[level][key] = instance.pk
+        self.created[level] += len(instances)
+        self.new_instances.extend(instances)
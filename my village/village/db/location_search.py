@@ -0,0 +1,242 @@
+"""
+Location Search module.
+
+This module provides an in-memory autocomplete index over every location name
+and village code. Names are matched by prefix (binary search over a sorted key
+array, including the start of every word) and, when there are too few prefix
+matches, by phonetic key (so Devanagari and alternative Roman spellings find
+each other) and by trigram similarity to tolerate typos. The index is built
+from the location tree and rebuilt whenever the tree changes.
+"""
+
+import re
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+from .location_tree import LocationTree, get_location_tree
+from ..models import Village
+from ..phonetics import phonetic_key
+
+# Match kinds, best first.
+EXACT, CODE, PREFIX, WORD_PREFIX, PHONETIC, FUZZY = range(6)
+
+_punctuation = re.compile(r'[^\w\s\u0900-\u097f]+')
+_spaces = re.compile(r'\s+')
+
+def normalize(text: str) -> str:
+    """
+    Lower-case a name and strip punctuation so that 'Nawada-Sadar' and
+    'nawada sadar' produce the same key. Devanagari signs are preserved.
+    """
+    return _spaces.sub(' ', _punctuation.sub(' ', (text or '').casefold())).strip()
+
+def trigrams(key: str) -> set:
+    """
+    Return the set of character trigrams of a normalized key, padded so that
+    word boundaries count.
+    """
+    padded = f'  {key} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class LocationAutocompleteIndex:
+    """
+    Prefix and trigram index over the location tree.
+    """
+
+    # Trigrams shared by more entries than this are too common to be useful
+    # on their own and are skipped while scoring fuzzy candidates.
+    MAX_POSTINGS = 20000
+    MIN_SIMILARITY = 0.35
+
+    def __init__(self, tree: LocationTree):
+        self.version = tree.version
+        self.tree = tree
+        self.levels: List[str] = []
+        self.ids = array('q')
+        self.names: List[str] = []
+        self.level_codes = array('b')
+        self.gram_counts = array('h')
+
+        prefix_keys: List[Tuple[str, int, int]] = []
+        phonetic_keys: List[Tuple[str, int, int]] = []
+        postings: Dict[str, List[int]] = {}
+        codes: Dict[str, List[int]] = {}
+
+        # Villages carry their phonetic key in an indexed column already.
+        stored_keys = dict(Village.objects.values_list('pk', 'name_phonetic').iterator(chunk_size=10000))
+
+        for level_code, level_name in enumerate(tree.level_names):
+            self.levels.append(level_name)
+            store = tree.levels[level_name]
+            for index in range(len(store)):
+                entry = len(self.ids)
+                name = store.names[index]
+                key = normalize(name)
+                self.ids.append(store.ids[index])
+                self.names.append(name)
+                self.level_codes.append(level_code)
+
+                prefix_keys.append((key, entry, PREFIX))
+                for match in re.finditer(r' ', key):
+                    prefix_keys.append((key[match.end():], entry, WORD_PREFIX))
+
+                sound = stored_keys.get(store.ids[index]) if level_name == 'village' else None
+                sound = sound or phonetic_key(name)
+                phonetic_keys.append((sound, entry, PREFIX))
+                for match in re.finditer(r' ', sound):
+                    phonetic_keys.append((sound[match.end():], entry, WORD_PREFIX))
+
+                grams = trigrams(key)
+                self.gram_counts.append(len(grams))
+                for gram in grams:
+                    postings.setdefault(gram, []).append(entry)
+
+                if level_name == 'village' and store.extras[index]:
+                    codes.setdefault(normalize(store.extras[index]), []).append(entry)
+
+        # Sorted key runs over all levels (under None) and per level, so that
+        # a search restricted to one level never scans other levels' keys.
+        self.prefix = self._sorted_runs(prefix_keys)
+        self.phonetic = self._sorted_runs(phonetic_keys)
+        self.postings = {gram: array('i', entries) for gram, entries in postings.items()}
+        self.codes = codes
+
+    def search(self, query: str, limit: int = 10, level: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Find the locations best matching a partial name or village code.
+
+        Args:
+            query: The text typed so far.
+            limit: The maximum number of results.
+            level: Restrict results to one level (e.g. 'village').
+
+        Returns:
+            Result dictionaries ordered exact > prefix > phonetic > fuzzy, each with the
+            level, id, name and the names of its ancestors.
+        """
+        key = normalize(query)
+        if not key:
+            return []
+        level_code = self.levels.index(level) if level in self.levels else None
+
+        best: Dict[int, Tuple[int, float]] = {}
+
+        def consider(entry: int, kind: int, score: float = 0.0) -> None:
+            if level_code is not None and self.level_codes[entry] != level_code:
+                return
+            rank = (kind, -score)
+            if entry not in best or rank < best[entry]:
+                best[entry] = rank
+
+        for entry in self.codes.get(key, ()):
+            consider(entry, CODE)
+
+        keys, entries, kinds = self.prefix[level_code]
+        for position in self._prefix_range(keys, key, limit * 20):
+            candidate = keys[position]
+            kind = EXACT if candidate == key and kinds[position] == PREFIX else kinds[position]
+            consider(entries[position], kind, -len(candidate))
+
+        sound = phonetic_key(query)
+        if len(best) < limit and sound:
+            keys, entries, kinds = self.phonetic[level_code]
+            for position in self._prefix_range(keys, sound, limit * 20):
+                candidate = keys[position]
+                # One-letter keys ('Gaya' -> 'g') only match exactly.
+                if len(sound) > 1 or candidate == sound:
+                    # Whole-name matches rank above matches on a later word.
+                    penalty = 0.5 if kinds[position] == WORD_PREFIX else 0.0
+                    consider(entries[position], PHONETIC, -len(candidate) - penalty)
+
+        if len(best) < limit and len(key) >= 3:
+            for entry, similarity in self._fuzzy(key, limit * 4, level_code):
+                consider(entry, FUZZY, similarity)
+
+        ranked = sorted(best.items(), key=lambda item: (item[1], self.names[item[0]]))[:limit]
+        return [self._result(entry) for entry, _ in ranked]
+
+    def _sorted_runs(self, rows: List[Tuple[str, int, int]]) -> Dict[Optional[int], Tuple[List[str], array, array]]:
+        """
+        Sort (key, entry, kind) rows into parallel arrays, once for all
+        levels (under None) and once per level code.
+        """
+        rows.sort()
+        runs = {None: rows}
+        for level_code in range(len(self.levels)):
+            runs[level_code] = [row for row in rows if self.level_codes[row[1]] == level_code]
+        return {
+            level_code: (
+                [key for key, _, _ in level_rows],
+                array('i', (entry for _, entry, _ in level_rows)),
+                array('b', (kind for _, _, kind in level_rows)),
+            )
+            for level_code, level_rows in runs.items()
+        }
+
+    @staticmethod
+    def _prefix_range(keys: List[str], prefix: str, maximum: int) -> range:
+        """
+        Return the positions of (at most ``maximum``) keys starting with
+        ``prefix``; in a sorted array they form one contiguous run.
+        """
+        start = bisect_left(keys, prefix)
+        end = start
+        while end < len(keys) and end - start < maximum and keys[end].startswith(prefix):
+            end += 1
+        return range(start, end)
+
+    def _fuzzy(self, key: str, limit: int, level_code: Optional[int] = None) -> List[Tuple[int, float]]:
+        """
+        Score entries (of one level, if given) by the Dice coefficient of
+        their trigram sets.
+        """
+        grams = trigrams(key)
+        lists = [self.postings[gram] for gram in grams if gram in self.postings]
+        selective = [entries for entries in lists if len(entries) <= self.MAX_POSTINGS] or lists
+
+        shared = Counter()
+        for entries in selective:
+            shared.update(entries)
+        if level_code is not None:
+            shared = Counter({entry: count for entry, count in shared.items() if self.level_codes[entry] == level_code})
+
+        scored = []
+        for entry, count in shared.most_common(limit * 4):
+            similarity = 2.0 * count / (len(grams) + self.gram_counts[entry])
+            if similarity >= self.MIN_SIMILARITY:
+                scored.append((entry, similarity))
+        scored.sort(key=lambda item: -item[1])
+        return scored[:limit]
+
+    def _result(self, entry: int) -> Dict[str, Any]:
+        level = self.levels[self.level_codes[entry]]
+        path = self.tree.get_path(level, self.ids[entry])
+        node = path.pop(level)
+        result = {
+            'level': level,
+            'id': node.id,
+            'name': node.name,
+            'path': [ancestor.name for ancestor in path.values()],
+        }
+        if level == 'village':
+            result['code'] = node.extra
+        return result
+
+_lock = threading.Lock()
+_index: Optional[LocationAutocompleteIndex] = None
+
+def get_autocomplete_index() -> LocationAutocompleteIndex:
+    """
+    Return this process's autocomplete index, rebuilding it whenever the
+    location tree has been rebuilt.
+    """
+    global _index
+    tree = get_location_tree()
+    if _index is not None and _index.tree is tree:
+        return _index
+    with _lock:
+        if _index is None or _index.tree is not tree:
+            _index = LocationAutocompleteIndex(tree)
+        return _index
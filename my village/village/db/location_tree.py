@@ -0,0 +1,189 @@
+"""
+Location Tree module.
+
+This module keeps a compact, read-only copy of the whole location hierarchy in
+memory. Each level is stored as parallel arrays (ids, names, parent indexes)
+sorted by parent and name, so lookups and child listings never touch the
+database. The tree is rebuilt lazily whenever the shared hierarchy version
+counter changes.
+"""
+
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional
+from django.conf import settings
+from .cache_versions import CacheVersionsDB
+from ..models import LOCATION_MODELS
+
+class LocationNode:
+    """
+    A lightweight, read-only view of one location in the tree.
+    """
+    __slots__ = ('level', 'id', 'name', 'parent_id', 'extra')
+    
+    def __init__(self, level: str, id: int, name: str, parent_id: Optional[int], extra: Optional[str] = None):
+        self.level = level
+        self.id = id
+        self.name = name
+        self.parent_id = parent_id
+        self.extra = extra
+    
+    @property
+    def pk(self) -> int:
+        return self.id
+    
+    def __str__(self):
+        return self.name
+    
+    def __repr__(self):
+        return f"<LocationNode {self.level}:{self.id} {self.name!r}>"
+
+class LocationLevel:
+    """
+    Array-backed storage for all locations of one level.
+    
+    Rows are sorted by (parent index, name), so the children of any parent
+    form one contiguous slice found by binary search on ``parents``.
+    """
+    __slots__ = ('name', 'ids', 'names', 'parents', 'extras', 'positions')
+    
+    def __init__(self, name: str, rows: List[tuple], parent_level: Optional['LocationLevel']):
+        self.name = name
+        resolved = []
+        for row in rows:
+            pk, label, parent_id, extra = row
+            parent_index = parent_level.positions.get(parent_id, -1) if parent_level else -1
+            resolved.append((parent_index, label, pk, extra))
+        resolved.sort()
+        
+        self.ids = array('q', (row[2] for row in resolved))
+        self.names = [row[1] for row in resolved]
+        self.parents = array('l', (row[0] for row in resolved))
+        self.extras = [row[3] for row in resolved]
+        self.positions = {pk: index for index, pk in enumerate(self.ids)}
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    def node(self, index: int, parent_level: Optional['LocationLevel']) -> LocationNode:
+        parent_index = self.parents[index]
+        parent_id = parent_level.ids[parent_index] if parent_level and parent_index >= 0 else None
+        return LocationNode(self.name, self.ids[index], self.names[index], parent_id, self.extras[index])
+    
+    def child_range(self, parent_index: int) -> range:
+        return range(bisect_left(self.parents, parent_index), bisect_right(self.parents, parent_index))
+
+class LocationTree:
+    """
+    An immutable snapshot of the District > ... > Village hierarchy.
+    """
+    
+    # Per-level column kept in ``LocationNode.extra``.
+    EXTRA_FIELDS = {'district': 'state', 'village': 'code'}
+    
+    def __init__(self, version: int):
+        self.version = version
+        self.level_names = [model.hierarchy_level for model in LOCATION_MODELS]
+        self.levels: Dict[str, LocationLevel] = {}
+        
+        parent_level = None
+        for model in LOCATION_MODELS:
+            parent_column = f'{model.parent_field}_id' if model.parent_field else None
+            extra_field = self.EXTRA_FIELDS.get(model.hierarchy_level)
+            columns = ['pk', 'name'] + [column for column in (parent_column, extra_field) if column]
+            
+            rows = []
+            for values in model.objects.values_list(*columns).iterator(chunk_size=5000):
+                row = dict(zip(columns, values))
+                rows.append((row['pk'], row['name'], row.get(parent_column), row.get(extra_field)))
+            
+            level = LocationLevel(model.hierarchy_level, rows, parent_level)
+            self.levels[model.hierarchy_level] = level
+            parent_level = level
+    
+    def _parent_level(self, level: str) -> Optional[LocationLevel]:
+        index = self.level_names.index(level)
+        return self.levels[self.level_names[index - 1]] if index else None
+    
+    def get(self, level: str, id: int) -> Optional[LocationNode]:
+        """
+        Get a single location by level and ID.
+        """
+        store = self.levels[level]
+        index = store.positions.get(id)
+        if index is None:
+            return None
+        return store.node(index, self._parent_level(level))
+    
+    def get_children(self, level: Optional[str], id: Optional[int]) -> List[LocationNode]:
+        """
+        Get the direct children of a location, sorted by name.
+        
+        Passing ``level=None`` returns all districts.
+        """
+        if level is None:
+            store = self.levels[self.level_names[0]]
+            return [store.node(index, None) for index in range(len(store))]
+        
+        position = self.level_names.index(level)
+        if position + 1 >= len(self.level_names):
+            return []
+        parent_index = self.levels[level].positions.get(id)
+        if parent_index is None:
+            return []
+        
+        store = self.levels[self.level_names[position + 1]]
+        return [store.node(index, self.levels[level]) for index in store.child_range(parent_index)]
+    
+    def get_path(self, level: str, id: int) -> Dict[str, LocationNode]:
+        """
+        Get a location and all of its ancestors, keyed by level.
+        """
+        path = {}
+        position = self.level_names.index(level)
+        index = self.levels[level].positions.get(id)
+        while index is not None and index >= 0 and position >= 0:
+            store = self.levels[self.level_names[position]]
+            parent_store = self.levels[self.level_names[position - 1]] if position else None
+            path[store.name] = store.node(index, parent_store)
+            index = store.parents[index]
+            position -= 1
+        return dict(reversed(list(path.items())))
+
+_lock = threading.Lock()
+_tree: Optional[LocationTree] = None
+_checked_at = 0.0
+
+def get_location_tree() -> LocationTree:
+    """
+    Return this process's location tree, rebuilding it if the hierarchy
+    version has moved on since it was built.
+    
+    The shared version counter is read at most once every
+    ``LOCATION_TREE_CHECK_INTERVAL`` seconds.
+    """
+    global _tree, _checked_at
+    
+    interval = getattr(settings, 'LOCATION_TREE_CHECK_INTERVAL', 5)
+    now = time.monotonic()
+    if _tree is not None and now - _checked_at < interval:
+        return _tree
+    
+    with _lock:
+        if _tree is not None and now - _checked_at < interval:
+            return _tree
+        version = CacheVersionsDB.get_version(CacheVersionsDB.LOCATION_HIERARCHY)
+        if _tree is None or _tree.version != version:
+            _tree = LocationTree(version)
+        _checked_at = time.monotonic()
+        return _tree
+
+def invalidate_location_tree() -> None:
+    """
+    Bump the shared hierarchy version and force this process to re-check it.
+    """
+    global _checked_at
+    CacheVersionsDB.bump_version(CacheVersionsDB.LOCATION_HIERARCHY)
+    _checked_at = 0.0
@@ -0,0 +1,170 @@
+"""
+Recommendations module for database operations.
+
+This module computes and serves "people you may know" suggestions. Scores are
+computed in batch with sparse matrix products over the whole relationship
+graph and stored in ``ProfileRecommendation``, so a page of suggestions is a
+single indexed read regardless of how many members there are.
+"""
+
+from typing import Iterable, Optional
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from .base import BaseDB
+from .relationship_graph import adjacency_matrix
+from ..models import ProfileRecommendation, Relationship, UserProfile
+
+class RecommendationsDB(BaseDB):
+    """
+    Class for computing and reading profile recommendations.
+    """
+
+    # Score of a candidate: weighted sum of the signals below.
+    MUTUAL_WEIGHT = 1.0
+    SAME_VILLAGE_WEIGHT = 2.0
+    SAME_PANCHAYAT_WEIGHT = 1.0
+    SAME_PROFESSION_WEIGHT = 0.5
+
+    # Profiles scored per sparse matrix product.
+    BATCH_SIZE = 500
+
+    @classmethod
+    def compute(cls, profile_ids: Optional[Iterable[int]] = None, top_n: Optional[int] = None) -> int:
+        """
+        Recompute the stored recommendations.
+
+        Candidates are the people a profile shares a connection, village or
+        panchayat with; a shared profession only adds to the score, since
+        on its own it would make half the village a candidate. People the
+        profile is already related to are left out.
+
+        Args:
+            profile_ids: Only recompute these profiles (default: everyone).
+            top_n: Suggestions kept per profile (default:
+                ``settings.RECOMMENDATIONS_PER_PROFILE``).
+
+        Returns:
+            The number of recommendations written.
+        """
+        import numpy as np
+        from scipy import sparse
+
+        top_n = top_n or settings.RECOMMENDATIONS_PER_PROFILE
+        rows = list(UserProfile.objects.order_by('pk').values_list('pk', 'village_id', 'village__panchayat_id', 'profession'))
+        if not rows:
+            return 0
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        n = len(ids)
+
+        def codes(values):
+            """Dense integer code per profile; -1 where the value is missing."""
+            lookup = {}
+            return np.array([lookup.setdefault(value, len(lookup)) if value else -1 for value in values], dtype=np.int64)
+
+        def one_hot(code):
+            present = np.flatnonzero(code >= 0)
+            return sparse.csr_matrix(
+                (np.ones(len(present), dtype=np.float32), (present, code[present])),
+                shape=(n, int(code.max()) + 1 if len(present) else 1)
+            )
+
+        village = codes(row[1] for row in rows)
+        panchayat = codes(row[2] for row in rows)
+        profession = codes((row[3] or '').strip().lower() for row in rows)
+        villages, panchayats = one_hot(village), one_hot(panchayat)
+
+        connected = adjacency_matrix(ids)
+
+        if profile_ids is None:
+            positions = np.arange(n)
+        else:
+            wanted = np.array(sorted(set(profile_ids)), dtype=np.int64)
+            positions = np.searchsorted(ids, wanted)
+            found = positions < n
+            found[found] = ids[positions[found]] == wanted[found]
+            positions = positions[found]
+
+        columns = ['profile_id', 'candidate_id', 'rank', 'score', 'mutual_count',
+                   'same_village', 'same_panchayat', 'same_profession', 'computed_at']
+        insert = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            connection.ops.quote_name(ProfileRecommendation._meta.db_table),
+            ', '.join(connection.ops.quote_name(column) for column in columns),
+            ', '.join(['%s'] * len(columns))
+        )
+        computed_at = connection.ops.adapt_datetimefield_value(timezone.now())
+
+        written = 0
+        for start in range(0, len(positions), cls.BATCH_SIZE):
+            batch = positions[start:start + cls.BATCH_SIZE]
+            neighbours = connected[batch]
+            mutual = (neighbours @ connected).tocsr()
+            candidates = (
+                mutual + villages[batch] @ villages.T + panchayats[batch] @ panchayats.T
+            ).tocoo()
+            row, col = candidates.row, candidates.col
+            profile = batch[row]
+
+            # Drop the profile itself and the people they are already related to.
+            keep = col != profile
+            keep &= np.asarray(neighbours[row, col]).ravel() == 0
+            row, col, profile = row[keep], col[keep], profile[keep]
+
+            mutual_count = np.asarray(mutual[row, col]).ravel().astype(np.int64)
+            same_village = (village[profile] >= 0) & (village[profile] == village[col])
+            same_panchayat = (panchayat[profile] >= 0) & (panchayat[profile] == panchayat[col])
+            same_profession = (profession[profile] >= 0) & (profession[profile] == profession[col])
+            score = (
+                cls.MUTUAL_WEIGHT * mutual_count
+                + cls.SAME_VILLAGE_WEIGHT * same_village
+                + cls.SAME_PANCHAYAT_WEIGHT * same_panchayat
+                + cls.SAME_PROFESSION_WEIGHT * same_profession
+            )
+
+            # Best first within each profile, ties broken by candidate id.
+            order = np.lexsort((ids[col], -score, row))
+            row = row[order]
+            group_start = np.searchsorted(row, row, side='left')
+            rank = np.arange(len(row)) - group_start + 1
+            best = order[rank <= top_n]
+            rank = rank[rank <= top_n]
+
+            # Written with executemany: building a million model instances
+            # for bulk_create costs several times the scoring itself.
+            recommendations = list(zip(
+                ids[profile[best]].tolist(),
+                ids[col[best]].tolist(),
+                rank.tolist(),
+                score[best].tolist(),
+                mutual_count[best].tolist(),
+                same_village[best].tolist(),
+                same_panchayat[best].tolist(),
+                same_profession[best].tolist(),
+                [computed_at] * len(best),
+            ))
+            with transaction.atomic():
+                ProfileRecommendation.objects.filter(profile_id__in=ids[batch].tolist()).delete()
+                with connection.cursor() as cursor:
+                    cursor.executemany(insert, recommendations)
+            written += len(recommendations)
+        return written
+
+    @classmethod
+    def get_recommendations(cls, profile: UserProfile):
+        """
+        Get a profile's stored recommendations, best first.
+
+        People the profile has become related to since the last batch run
+        are left out.
+
+        Args:
+            profile: The profile to get suggestions for.
+
+        Returns:
+            A queryset of ProfileRecommendation ordered by rank, with the
+            candidate's user and village loaded.
+        """
+        related = Relationship.objects.filter(user=profile).values('related_user_id')
+        return ProfileRecommendation.objects.filter(profile=profile).exclude(
+            candidate_id__in=related
+        ).select_related('candidate__user', 'candidate__village').order_by('rank')
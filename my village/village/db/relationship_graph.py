@@ -0,0 +1,488 @@
+"""
+Relationship Graph module.
+
+This module keeps the accepted relationships between user profiles in memory
+as a compressed sparse row (CSR) adjacency structure: the source profile ids
+in one sorted array, the offsets of each source's edges in another, and the
+target ids and relationship-type codes of all edges in two flat arrays. A
+million edges take a few tens of megabytes and a neighbour lookup is a binary
+search plus an array slice, so graph features never query ``Relationship``
+per hop.
+
+Changes made by this process are applied to a small overlay on top of the
+arrays (via the signal handlers in ``village.signals``). They are also
+written to a change log under the shared ``relationship_graph`` version, from
+which other processes apply them to their own copy when they see the version
+move on.
+Changes never modify the arrays or overlay in place: a new snapshot of both
+is swapped in, so threads reading the index need no lock.
+"""
+
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter, OrderedDict, deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from django.conf import settings
+from django.db import transaction
+from .cache_versions import CacheVersionsDB
+from ..models import Relationship, RelationshipGraphChange
+
+# Relationship type <-> small integer code stored per edge.
+EDGE_TYPES = [relationship_type for relationship_type, _ in Relationship.RELATIONSHIP_TYPES]
+EDGE_TYPE_CODES = {relationship_type: code for code, relationship_type in enumerate(EDGE_TYPES)}
+
+class _GraphSnapshot:
+    """
+    One immutable state of the index: the CSR arrays plus the overlay.
+
+    ``apply`` and ``compact`` never change a snapshot that readers may hold;
+    they build a new one and swap it in with a single assignment.
+    """
+
+    __slots__ = ('ids', 'offsets', 'targets', 'types', 'added', 'removed')
+
+    def __init__(self, ids, offsets, targets, types, added=None, removed=frozenset()):
+        self.ids = ids
+        self.offsets = offsets
+        self.targets = targets
+        self.types = types
+        self.added: Dict[int, Dict[int, int]] = added or {}
+        self.removed: frozenset = removed
+
+    @classmethod
+    def load(cls, rows: Iterable[Tuple[int, int, str]]) -> '_GraphSnapshot':
+        """Build the arrays from (source, target, type) rows sorted by source."""
+        ids, offsets, targets, types = array('q'), array('q', [0]), array('q'), array('b')
+        other = EDGE_TYPE_CODES.get('other', 0)
+        previous = None
+        for source, target, relationship_type in rows:
+            if source != previous:
+                if previous is not None:
+                    offsets.append(len(targets))
+                ids.append(source)
+                previous = source
+            targets.append(target)
+            types.append(EDGE_TYPE_CODES.get(relationship_type, other))
+        if previous is not None:
+            offsets.append(len(targets))
+        return cls(ids, offsets, targets, types)
+
+    @property
+    def overlay_size(self) -> int:
+        return len(self.removed) + sum(len(edges) for edges in self.added.values())
+
+    def row(self, profile_id: int) -> Tuple[int, int]:
+        position = bisect_left(self.ids, profile_id)
+        if position < len(self.ids) and self.ids[position] == profile_id:
+            return self.offsets[position], self.offsets[position + 1]
+        return 0, 0
+
+    def edges(self, profile_id: int) -> List[Tuple[int, int]]:
+        start, end = self.row(profile_id)
+        edges = [
+            (target, code) for target, code in zip(self.targets[start:end], self.types[start:end])
+            if (profile_id, target) not in self.removed
+        ]
+        added = self.added.get(profile_id)
+        if added:
+            edges.extend(added.items())
+        return edges
+
+    def neighbour_ids(self, profile_id: int) -> List[int]:
+        start, end = self.row(profile_id)
+        if not self.removed and not self.added:
+            return self.targets[start:end].tolist()
+        return [target for target, _ in self.edges(profile_id)]
+
+    def degree(self, profile_id: int) -> int:
+        start, end = self.row(profile_id)
+        if not self.removed and not self.added:
+            return end - start
+        return len(self.edges(profile_id))
+
+class RelationshipGraphIndex:
+    """
+    CSR adjacency over profile ids with an overlay of recent changes.
+
+    Edges are directed as stored (``user`` -> ``related_user``); the app
+    stores every relationship in both directions, so the out-neighbours of a
+    profile are everyone it is related to.
+
+    Readers take the current ``_GraphSnapshot`` once per call and work on
+    it alone, so they need no lock even while another thread applies
+    changes.
+    """
+
+    # Fold the overlay into the arrays once it holds this many edges.
+    COMPACT_THRESHOLD = 5000
+    # Number of shortest-path results remembered per process.
+    PATH_CACHE_SIZE = 10000
+
+    def __init__(self, version: int, rows: Optional[Iterable[Tuple[int, int, str]]] = None):
+        self.version = version
+        self._paths: OrderedDict = OrderedDict()
+        self._paths_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+        if rows is None:
+            rows = Relationship.objects.filter(status='accepted').order_by('user_id', 'related_user_id').values_list(
+                'user_id', 'related_user_id', 'relationship_type'
+            ).iterator(chunk_size=10000)
+        self._snapshot = _GraphSnapshot.load(rows)
+
+    @property
+    def ids(self) -> array:
+        return self._snapshot.ids
+
+    @property
+    def offsets(self) -> array:
+        return self._snapshot.offsets
+
+    @property
+    def targets(self) -> array:
+        return self._snapshot.targets
+
+    @property
+    def edge_count(self) -> int:
+        snapshot = self._snapshot
+        return len(snapshot.targets) - len(snapshot.removed) + sum(len(edges) for edges in snapshot.added.values())
+
+    def neighbours(self, profile_id: int) -> List[Tuple[int, str]]:
+        """
+        Get everyone a profile is related to.
+
+        Returns:
+            (profile id, relationship type) pairs.
+        """
+        return [(target, EDGE_TYPES[code]) for target, code in self._snapshot.edges(profile_id)]
+
+    def neighbour_ids(self, profile_id: int) -> List[int]:
+        """Get the ids of everyone a profile is related to."""
+        return self._snapshot.neighbour_ids(profile_id)
+
+    def edge_type(self, source: int, target: int) -> Optional[str]:
+        """Get the type of the relationship between two profiles, if any."""
+        snapshot = self._snapshot
+        for profile_id, other in ((source, target), (target, source)):
+            for neighbour, code in snapshot.edges(profile_id):
+                if neighbour == other:
+                    return EDGE_TYPES[code]
+        return None
+
+    def degree(self, profile_id: int) -> int:
+        """Get the number of relationships of a profile."""
+        return self._snapshot.degree(profile_id)
+
+    def expand(self, profile_id: int, hops: int, limit: Optional[int] = None) -> Dict[int, int]:
+        """
+        Breadth-first k-hop expansion around a profile.
+
+        Args:
+            profile_id: The profile to start from.
+            hops: The maximum distance to follow.
+            limit: Stop once this many profiles (including the start) are found.
+
+        Returns:
+            A mapping of profile id to its distance from the start, in
+            breadth-first order.
+        """
+        snapshot = self._snapshot
+        distances = {profile_id: 0}
+        queue = deque([profile_id])
+        while queue:
+            current = queue.popleft()
+            distance = distances[current]
+            if distance >= hops:
+                continue
+            for target in snapshot.neighbour_ids(current):
+                if target in distances:
+                    continue
+                if limit is not None and len(distances) >= limit:
+                    return distances
+                distances[target] = distance + 1
+                queue.append(target)
+        return distances
+
+    def mutual_counts(self, profile_id: int, candidate_ids: Iterable[int]) -> Dict[int, int]:
+        """
+        Count the connections a profile shares with each of some candidates.
+
+        Uses whichever of two plans touches fewer edges: counting every
+        friend-of-a-friend once (cost: the degrees of the profile's
+        connections), or intersecting the profile's connections with each
+        candidate's (cost: the candidates' degrees).
+
+        Args:
+            profile_id: The viewing profile.
+            candidate_ids: The profiles to count mutual connections with.
+
+        Returns:
+            A mapping of candidate id to the number of mutual connections.
+        """
+        snapshot = self._snapshot
+        candidate_ids = list(candidate_ids)
+        friends = snapshot.neighbour_ids(profile_id)
+        if not friends or not candidate_ids:
+            return {candidate: 0 for candidate in candidate_ids}
+
+        if sum(snapshot.degree(friend) for friend in friends) <= sum(snapshot.degree(c) for c in candidate_ids):
+            counts = Counter()
+            for friend in friends:
+                counts.update(snapshot.neighbour_ids(friend))
+            return {candidate: counts.get(candidate, 0) for candidate in candidate_ids}
+
+        friends = set(friends)
+        return {
+            candidate: len(friends.intersection(snapshot.neighbour_ids(candidate)))
+            for candidate in candidate_ids
+        }
+
+    def shortest_path(self, source: int, target: int, max_depth: int) -> Optional[List[int]]:
+        """
+        Find a shortest chain of relationships between two profiles.
+
+        Runs a bidirectional breadth-first search, always growing the smaller
+        of the two frontiers by a whole level, so only about the square root
+        of the nodes a one-sided search would visit are touched. Relationships
+        are treated as undirected. Results are cached per pair until the
+        graph changes.
+
+        Args:
+            source: The profile to start from.
+            target: The profile to reach.
+            max_depth: The longest path (in relationships) to look for.
+
+        Returns:
+            The profile ids along the path, including both ends, or None if
+            the two are further apart than ``max_depth``.
+        """
+        key = (source, target, max_depth)
+        with self._paths_lock:
+            if key in self._paths:
+                self._paths.move_to_end(key)
+                return self._paths[key]
+
+        snapshot = self._snapshot
+        path = self._search(snapshot, source, target, max_depth)
+        with self._paths_lock:
+            # apply() swaps the snapshot before it clears the cache, so a
+            # search that overlapped a change is not stored.
+            if self._snapshot is snapshot:
+                self._paths[key] = path
+                if len(self._paths) > self.PATH_CACHE_SIZE:
+                    self._paths.popitem(last=False)
+        return path
+
+    def _search(self, snapshot: '_GraphSnapshot', source: int, target: int, max_depth: int) -> Optional[List[int]]:
+        if source == target:
+            return [source]
+        forward = {source: None}
+        backward = {target: None}
+        forward_frontier, backward_frontier = [source], [target]
+        depth = 0
+
+        while forward_frontier and backward_frontier and depth < max_depth:
+            if len(forward_frontier) <= len(backward_frontier):
+                parents, others, frontier = forward, backward, forward_frontier
+            else:
+                parents, others, frontier = backward, forward, backward_frontier
+            next_frontier = []
+            meeting = None
+            for current in frontier:
+                for neighbour in snapshot.neighbour_ids(current):
+                    if neighbour in parents:
+                        continue
+                    parents[neighbour] = current
+                    if neighbour in others:
+                        meeting = neighbour
+                        break
+                    next_frontier.append(neighbour)
+                if meeting is not None:
+                    break
+            depth += 1
+
+            if meeting is not None:
+                path = []
+                node = meeting
+                while node is not None:
+                    path.append(node)
+                    node = forward[node]
+                path.reverse()
+                node = backward[meeting]
+                while node is not None:
+                    path.append(node)
+                    node = backward[node]
+                return path
+
+            if frontier is forward_frontier:
+                forward_frontier = next_frontier
+            else:
+                backward_frontier = next_frontier
+        return None
+
+    def apply(self, changes: Iterable[Tuple[int, int, Optional[str]]]) -> None:
+        """
+        Apply edge changes to the overlay.
+
+        Args:
+            changes: (source, target, type) triples; a type of None removes
+                the edge.
+        """
+        other = EDGE_TYPE_CODES.get('other', 0)
+        with self._write_lock:
+            snapshot = self._snapshot
+            added = dict(snapshot.added)
+            removed = set(snapshot.removed)
+            copied = set()
+            for source, target, relationship_type in changes:
+                if source in added and source not in copied:
+                    added[source] = dict(added[source])
+                copied.add(source)
+                added.get(source, {}).pop(target, None)
+                start, end = snapshot.row(source)
+                if target in snapshot.targets[start:end]:
+                    removed.add((source, target))
+                if relationship_type is not None:
+                    added.setdefault(source, {})[target] = EDGE_TYPE_CODES.get(relationship_type, other)
+            added = {source: edges for source, edges in added.items() if edges}
+            self._snapshot = _GraphSnapshot(
+                snapshot.ids, snapshot.offsets, snapshot.targets, snapshot.types, added, frozenset(removed)
+            )
+            with self._paths_lock:
+                self._paths.clear()
+            if self._snapshot.overlay_size > self.COMPACT_THRESHOLD:
+                self._compact()
+
+    def compact(self) -> None:
+        """Fold the overlay into the CSR arrays."""
+        with self._write_lock:
+            self._compact()
+
+    def _compact(self) -> None:
+        snapshot = self._snapshot
+        sources = sorted(set(snapshot.ids) | set(snapshot.added))
+        self._snapshot = _GraphSnapshot.load(
+            (source, target, EDGE_TYPES[code])
+            for source in sources
+            for target, code in sorted(snapshot.edges(source))
+        )
+
+def adjacency_matrix(profile_ids):
+    """
+    Build the relationship graph as a symmetric 0/1 SciPy CSR matrix, for
+    batch jobs. The edges are loaded afresh from the database rather than
+    taken from this process's index.
+
+    Args:
+        profile_ids: Sorted NumPy array of every profile id; row/column ``i``
+            of the matrix is ``profile_ids[i]``.
+
+    Returns:
+        An ``n x n`` ``scipy.sparse.csr_matrix`` of float32.
+    """
+    import numpy as np
+    from scipy import sparse
+
+    graph = RelationshipGraphIndex(CacheVersionsDB.get_version(CacheVersionsDB.RELATIONSHIP_GRAPH))
+    n = len(profile_ids)
+    sources = np.searchsorted(profile_ids, np.frombuffer(graph.ids, dtype=np.int64))
+    targets = np.searchsorted(profile_ids, np.frombuffer(graph.targets, dtype=np.int64))
+    edge_sources = np.repeat(sources, np.diff(np.frombuffer(graph.offsets, dtype=np.int64)))
+    adjacency = sparse.csr_matrix(
+        (np.ones(len(targets), dtype=np.float32), (edge_sources, targets)), shape=(n, n)
+    )
+    # Related either way round counts as connected.
+    adjacency = (adjacency + adjacency.T).tocsr()
+    adjacency.data[:] = 1
+    return adjacency
+
+_lock = threading.Lock()
+_graph: Optional[RelationshipGraphIndex] = None
+_checked_at = 0.0
+
+def get_relationship_graph() -> RelationshipGraphIndex:
+    """
+    Return this process's relationship graph index, bringing it up to date
+    with changes other processes made since it was built.
+
+    The shared version counter is read at most once every
+    ``RELATIONSHIP_GRAPH_CHECK_INTERVAL`` seconds. Missed versions are read
+    from the change log and applied to the index; the index is only rebuilt
+    when some of them are no longer in the log.
+    """
+    global _graph, _checked_at
+
+    interval = getattr(settings, 'RELATIONSHIP_GRAPH_CHECK_INTERVAL', 5)
+    now = time.monotonic()
+    if _graph is not None and now - _checked_at < interval:
+        return _graph
+
+    with _lock:
+        if _graph is not None and now - _checked_at < interval:
+            return _graph
+        version = CacheVersionsDB.get_version(CacheVersionsDB.RELATIONSHIP_GRAPH)
+        if _graph is None or not _catch_up(_graph, version):
+            _graph = RelationshipGraphIndex(version)
+        _checked_at = time.monotonic()
+        return _graph
+
+def _catch_up(graph: RelationshipGraphIndex, version: int) -> bool:
+    """
+    Apply the logged changes between the index's version and ``version``.
+
+    Returns:
+        False if the log does not hold all of them, and the index must be
+        rebuilt instead.
+    """
+    if version == graph.version:
+        return True
+    if version < graph.version:
+        return False
+    rows = list(
+        RelationshipGraphChange.objects.filter(version__gt=graph.version, version__lte=version)
+        .order_by('version', 'id').values_list('version', 'source_id', 'target_id', 'relationship_type')
+    )
+    # Versions commit in order (the counter row is locked until commit), so
+    # a gap means the log was pruned.
+    if {row[0] for row in rows} != set(range(graph.version + 1, version + 1)):
+        return False
+    graph.apply([(source, target, relationship_type) for _, source, target, relationship_type in rows])
+    graph.version = version
+    return True
+
+def record_relationship_changes(changes: List[Tuple[int, int, Optional[str]]]) -> None:
+    """
+    Bump the shared graph version for changed relationships, log them
+    under the new version for other processes and, once the transaction
+    commits, apply them to this process's index.
+
+    Args:
+        changes: (user id, related user id, type) triples; a type of None
+            means the relationship no longer exists (or is not accepted).
+    """
+    if not changes:
+        return
+    version = CacheVersionsDB.bump_version(CacheVersionsDB.RELATIONSHIP_GRAPH)
+    RelationshipGraphChange.objects.bulk_create([
+        RelationshipGraphChange(version=version, source_id=source, target_id=target, relationship_type=relationship_type)
+        for source, target, relationship_type in changes
+    ], batch_size=1000)
+    keep = settings.RELATIONSHIP_GRAPH_LOG_VERSIONS
+    if version % 100 == 0 and version > keep:
+        RelationshipGraphChange.objects.filter(version__lte=version - keep).delete()
+
+    def apply():
+        global _checked_at
+        with _lock:
+            if _graph is None:
+                return
+            if _graph.version == version - 1:
+                _graph.apply(changes)
+                _graph.version = version
+            else:
+                # Someone else changed the graph in between; catch up on next use.
+                _checked_at = 0.0
+
+    transaction.on_commit(apply)
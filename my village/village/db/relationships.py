@@ -0,0 +1,292 @@
+"""
+Relationships module for database operations.
+
+This module provides functionality for reading the social graph formed by
+``Relationship`` rows between user profiles, for answering relationship
+requests in bulk and for counting the requests each member has pending.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from .base import BaseDB
+from .communities import CommunitiesDB
+from .relationship_graph import get_relationship_graph, record_relationship_changes
+from ..graph_images import CENTER_COLOR, COLOR_MAP, display_name, invalidate_graph_image
+from ..models import Relationship, RelationshipRequest, UserProfile
+
+class RelationshipsDB(BaseDB):
+    """
+    Class for interacting with the relationship graph.
+    """
+
+    MAX_GRAPH_DEPTH = 3
+    MAX_GRAPH_NODES = 500
+    MAX_PATH_DEPTH = 6
+
+    @classmethod
+    def get_graph(cls, profile_id: int, depth: int = 1, max_nodes: int = MAX_GRAPH_NODES) -> Dict[str, Any]:
+        """
+        Get the neighbourhood of a profile as nodes and edges, ready to be
+        laid out by the browser.
+
+        The graph is expanded breadth-first over the in-memory relationship
+        graph index and stops growing once ``max_nodes`` members have been
+        reached; only the names of the members found are read from the
+        database.
+
+        Args:
+            profile_id: The ID of the profile at the centre.
+            depth: How many hops to follow (capped at ``MAX_GRAPH_DEPTH``).
+            max_nodes: The maximum number of nodes to return.
+
+        Returns:
+            A dictionary with 'nodes' (id, label, depth, color), 'edges'
+            (source, target, type, label, color) and 'truncated'.
+        """
+        depth = max(1, min(depth, cls.MAX_GRAPH_DEPTH))
+        type_labels = dict(Relationship.RELATIONSHIP_TYPES)
+        graph = get_relationship_graph()
+
+        depths = {profile_id: 0}
+        colors = {profile_id: CENTER_COLOR}
+        edges: Dict[frozenset, Dict[str, Any]] = {}
+        frontier = [profile_id]
+        truncated = False
+
+        for hop in range(1, depth + 1):
+            if not frontier or truncated:
+                break
+            next_frontier = []
+            for source in frontier:
+                for target, relationship_type in sorted(graph.neighbours(source)):
+                    if target not in depths:
+                        if len(depths) >= max_nodes:
+                            # Leave the member (and the edge to them) out.
+                            truncated = True
+                            continue
+                        depths[target] = hop
+                        colors[target] = COLOR_MAP.get(relationship_type, COLOR_MAP['other'])
+                        next_frontier.append(target)
+                    # Relationships are stored in both directions; keep one edge per pair.
+                    pair = frozenset((source, target))
+                    if pair not in edges:
+                        edges[pair] = {
+                            'source': source,
+                            'target': target,
+                            'type': relationship_type,
+                            'label': type_labels.get(relationship_type, relationship_type),
+                            'color': COLOR_MAP.get(relationship_type, COLOR_MAP['other']),
+                        }
+            frontier = next_frontier
+
+        profiles = UserProfile.objects.filter(pk__in=depths).select_related('user').only(
+            'pk', 'user__username', 'user__first_name', 'user__last_name'
+        )
+        labels = {profile.pk: display_name(profile.user) for profile in profiles}
+        nodes: List[Dict[str, Any]] = [
+            {'id': pk, 'label': labels.get(pk, ''), 'depth': node_depth, 'color': colors[pk]}
+            for pk, node_depth in depths.items()
+        ]
+        return {
+            'nodes': nodes,
+            'edges': list(edges.values()),
+            'truncated': truncated,
+        }
+
+    @classmethod
+    def get_mutual_counts(cls, profile_id: int, profile_ids: Iterable[int]) -> Dict[int, int]:
+        """
+        Get the number of mutual connections between a viewer and a page of
+        other profiles, in one pass over the in-memory relationship graph.
+
+        Args:
+            profile_id: The ID of the viewing profile.
+            profile_ids: The IDs of the profiles shown.
+
+        Returns:
+            A dictionary mapping each of ``profile_ids`` to its count.
+        """
+        return get_relationship_graph().mutual_counts(profile_id, profile_ids)
+
+    @classmethod
+    def get_path(cls, source_id: int, target_id: int, max_depth: int = MAX_PATH_DEPTH) -> Optional[List[Dict[str, Any]]]:
+        """
+        Get how two profiles are connected: a shortest chain of
+        relationships between them.
+
+        Args:
+            source_id: The ID of the profile to start from.
+            target_id: The ID of the profile to reach.
+            max_depth: The longest chain to look for.
+
+        Returns:
+            One step per profile along the chain, starting with the source,
+            each with 'id', 'label' and the 'type'/'type_label' of the
+            relationship leading to it (None for the source); or None if the
+            profiles are not connected within ``max_depth`` relationships.
+        """
+        graph = get_relationship_graph()
+        path = graph.shortest_path(source_id, target_id, max(1, min(max_depth, cls.MAX_PATH_DEPTH)))
+        if path is None:
+            return None
+
+        type_labels = dict(Relationship.RELATIONSHIP_TYPES)
+        profiles = UserProfile.objects.filter(pk__in=path).select_related('user').only(
+            'pk', 'user__username', 'user__first_name', 'user__last_name'
+        )
+        labels = {profile.pk: display_name(profile.user) for profile in profiles}
+        steps = []
+        for position, pk in enumerate(path):
+            relationship_type = graph.edge_type(path[position - 1], pk) if position else None
+            steps.append({
+                'id': pk,
+                'label': labels.get(pk, ''),
+                'type': relationship_type,
+                'type_label': type_labels.get(relationship_type, relationship_type) if relationship_type else None,
+            })
+        return steps
+
+    @classmethod
+    def respond_to_requests(cls, profile: UserProfile, request_ids: Iterable[int], action: str) -> Dict[str, int]:
+        """
+        Accept or reject many pending relationship requests sent to a profile
+        in one transaction.
+
+        Accepting checks every pair for an existing relationship with one
+        query, creates the reciprocal ``Relationship`` rows with
+        ``bulk_create`` and updates the request statuses with one UPDATE
+        per outcome. As bulk writes skip model signals, the relationship
+        graph index, graph images, cluster flags and pending request count
+        are updated here.
+        Requests from people the profile is already related to are rejected,
+        as when they are answered one by one.
+
+        Args:
+            profile: The profile the requests were sent to.
+            request_ids: The IDs of the requests; others' requests and
+                requests that are no longer pending are ignored.
+            action: 'accept' or 'reject'.
+
+        Returns:
+            A dictionary with the number of requests 'accepted', 'rejected'
+            and 'already_connected' (rejected because of an existing
+            relationship).
+
+        Raises:
+            ValueError: If the action is not 'accept' or 'reject'.
+        """
+        if action not in ('accept', 'reject'):
+            raise ValueError(f"Unknown action '{action}'.")
+
+        with transaction.atomic():
+            pending = list(
+                RelationshipRequest.objects.select_for_update()
+                .filter(pk__in=list(request_ids), to_user=profile, status='pending')
+                .values_list('pk', 'from_user_id', 'relationship_type')
+            )
+            now = timezone.now()
+            cls.adjust_pending_count(profile.pk, -len(pending), user_id=profile.user_id)
+            if action == 'reject':
+                RelationshipRequest.objects.filter(pk__in=[pk for pk, _, _ in pending]).update(
+                    status='rejected', updated_at=now
+                )
+                return {'accepted': 0, 'rejected': len(pending), 'already_connected': 0}
+
+            senders = [sender for _, sender, _ in pending]
+            connected = set()
+            for user_id, related_user_id in Relationship.objects.filter(
+                Q(user=profile, related_user_id__in=senders) | Q(user_id__in=senders, related_user=profile)
+            ).values_list('user_id', 'related_user_id'):
+                connected.add(related_user_id if user_id == profile.pk else user_id)
+
+            accepted = [(pk, sender, kind) for pk, sender, kind in pending if sender not in connected]
+            rejected = [pk for pk, sender, _ in pending if sender in connected]
+            relationships = []
+            for _, sender, kind in accepted:
+                relationships.append(Relationship(user_id=sender, related_user=profile, relationship_type=kind))
+                relationships.append(Relationship(user=profile, related_user_id=sender, relationship_type=kind))
+            Relationship.objects.bulk_create(relationships)
+            RelationshipRequest.objects.filter(pk__in=[pk for pk, _, _ in accepted]).update(
+                status='accepted', updated_at=now
+            )
+            RelationshipRequest.objects.filter(pk__in=rejected).update(status='rejected', updated_at=now)
+
+            if relationships:
+                record_relationship_changes([
+                    (relationship.user_id, relationship.related_user_id, relationship.relationship_type)
+                    for relationship in relationships
+                ])
+                new_partners = [sender for _, sender, _ in accepted]
+                CommunitiesDB.mark_dirty(profile.pk, *new_partners)
+
+                def invalidate_images():
+                    for profile_id in [profile.pk, *new_partners]:
+                        invalidate_graph_image(profile_id)
+                transaction.on_commit(invalidate_images)
+        return {'accepted': len(accepted), 'rejected': len(rejected), 'already_connected': len(rejected)}
+
+    @classmethod
+    def get_pending_count(cls, user) -> int:
+        """
+        Get the number of pending relationship requests sent to a user.
+
+        The count is read from ``UserProfile.pending_received_count`` and
+        kept in the cache, so showing it on every page normally costs no
+        query at all.
+
+        Args:
+            user: The user (who may not have a profile).
+
+        Returns:
+            The number of pending requests; 0 if the user has no profile.
+        """
+        key = _pending_cache_key(user.pk)
+        count = cache.get(key)
+        if count is None:
+            count = UserProfile.objects.filter(user_id=user.pk).values_list(
+                'pending_received_count', flat=True
+            ).first() or 0
+            cache.set(key, count, settings.PENDING_REQUESTS_CACHE_TIMEOUT)
+        return count
+
+    @classmethod
+    def adjust_pending_count(cls, profile_id: int, delta: int, user_id: Optional[int] = None) -> None:
+        """
+        Add ``delta`` to a profile's pending request count and drop the
+        cached count once the transaction commits.
+
+        Args:
+            profile_id: The ID of the profile the requests were sent to.
+            delta: The change in the number of pending requests.
+            user_id: The ID of the profile's user, if already known.
+        """
+        if not delta:
+            return
+        UserProfile.objects.filter(pk=profile_id).update(
+            pending_received_count=Greatest(F('pending_received_count') + delta, 0)
+        )
+        cls._forget_pending_count(profile_id, user_id)
+
+    @classmethod
+    def refresh_pending_count(cls, profile_id: int) -> None:
+        """Recount a profile's pending requests from scratch."""
+        UserProfile.objects.filter(pk=profile_id).update(
+            pending_received_count=RelationshipRequest.objects.filter(to_user_id=profile_id, status='pending').count()
+        )
+        cls._forget_pending_count(profile_id)
+
+    @classmethod
+    def _forget_pending_count(cls, profile_id: int, user_id: Optional[int] = None) -> None:
+        if user_id is None:
+            user_id = UserProfile.objects.filter(pk=profile_id).values_list('user_id', flat=True).first()
+        if user_id is not None:
+            key = _pending_cache_key(user_id)
+            transaction.on_commit(lambda: cache.delete(key))
+
+def _pending_cache_key(user_id: int) -> str:
+    return f'pending_requests:{user_id}'
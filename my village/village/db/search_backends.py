@@ -0,0 +1,332 @@
+"""
+Search Backends module.
+
+This module provides full-text search over the free-text columns of member
+profiles, community events and village services. Each indexed model gets a
+side table holding one row per object: an FTS5 virtual table on SQLite, or a
+table of ``tsvector`` columns with a GIN index on PostgreSQL. The side tables
+are created by a migration and kept current by the signal handlers in
+``village.signals``; ``rebuild`` repopulates them after bulk writes.
+"""
+
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connection as default_connection
+
+class SearchIndex:
+    """
+    Description of the searchable columns of one model.
+
+    Args:
+        label: The model label, e.g. 'village.UserProfile'.
+        fields: The indexed field paths (related lookups are allowed).
+        weights: Ranking weights for fields that matter more than the rest.
+    """
+
+    def __init__(self, label: str, fields: Sequence[str], weights: Optional[Dict[str, float]] = None):
+        self.label = label
+        self.fields = tuple(fields)
+        self.weights = weights or {}
+        app_label, model_name = label.split('.')
+        self.table = f'{app_label}_{model_name.lower()}_fts'
+
+    def weight(self, field: str) -> float:
+        return self.weights.get(field, 1.0)
+
+SEARCH_INDEXES = {
+    index.label: index for index in (
+        SearchIndex(
+            'village.UserProfile',
+            ['user__first_name', 'user__last_name', 'nickname', 'father_name', 'mother_name',
+             'education', 'profession', 'hobbies', 'achievements', 'social_contributions',
+             'name_phonetic'],
+            weights={'user__first_name': 10.0, 'user__last_name': 10.0, 'nickname': 10.0},
+        ),
+        SearchIndex(
+            'village.CommunityEvent',
+            ['title', 'description', 'location', 'contact_person', 'notes'],
+            weights={'title': 10.0, 'location': 2.0},
+        ),
+        SearchIndex(
+            'village.VillageService',
+            ['name', 'service_type', 'description', 'address'],
+            weights={'name': 10.0, 'service_type': 2.0},
+        ),
+    )
+}
+
+_word = re.compile(r'[\w\u0300-\u036f\u0900-\u097f]+')
+
+def query_terms(query: str) -> List[str]:
+    """
+    Split a user's query into search terms, dropping operators and punctuation.
+    """
+    return [term.lower() for term in _word.findall(query or '') if term.strip('_')]
+
+def get_index(model) -> Optional[SearchIndex]:
+    """
+    Return the search index of a model (or historical model), if it has one.
+    """
+    return SEARCH_INDEXES.get(model._meta.label)
+
+def _has_field(model, path: str) -> bool:
+    for name in path.split('__'):
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return False
+        model = field.related_model
+    return True
+
+class SearchBackend:
+    """
+    Base class for full-text search backends.
+
+    Queries match every term of the query as a word prefix, so 'farm' finds
+    'farmer', and results are ordered by relevance.
+    """
+
+    vendor = None
+    batch_size = 1000
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._installed: Optional[bool] = None
+
+    def is_available(self) -> bool:
+        """
+        Check (once per process) that the index tables have been created.
+        """
+        if self._installed is None:
+            tables = set(self.connection.introspection.table_names())
+            self._installed = all(index.table in tables for index in SEARCH_INDEXES.values())
+        return self._installed
+
+    def supports(self, model, fields: Iterable[str]) -> bool:
+        index = get_index(model)
+        return index is not None and set(fields) <= set(index.fields) and self.is_available()
+
+    def install(self) -> None:
+        """Create the index tables."""
+        with self.connection.cursor() as cursor:
+            for index in SEARCH_INDEXES.values():
+                for statement in self.create_sql(index):
+                    cursor.execute(statement)
+        self._installed = True
+
+    def recreate(self, model) -> int:
+        """
+        Drop and re-create the index table of one model after its indexed
+        fields changed, then repopulate it.
+
+        Returns:
+            The number of indexed objects.
+        """
+        index = get_index(model)
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {index.table}')
+            for statement in self.create_sql(index):
+                cursor.execute(statement)
+        return self.rebuild(model)
+
+    def uninstall(self) -> None:
+        """Drop the index tables."""
+        with self.connection.cursor() as cursor:
+            for index in SEARCH_INDEXES.values():
+                cursor.execute(f'DROP TABLE IF EXISTS {index.table}')
+        self._installed = False
+
+    def index(self, instance) -> None:
+        """Write (or overwrite) the index row of one object."""
+        self.index_many(type(instance), [instance.pk])
+
+    def index_many(self, model, pks: Iterable[int]) -> None:
+        """
+        Re-read the given objects from the database and rewrite their rows.
+        """
+        index = get_index(model)
+        pks = list(pks)
+        if index is None or not pks or not self.is_available():
+            return
+        for start in range(0, len(pks), self.batch_size):
+            batch = pks[start:start + self.batch_size]
+            rows = self._read(index, model._base_manager.filter(pk__in=batch))
+            self._write(index, batch, rows)
+
+    def remove(self, model, pk: int) -> None:
+        """Delete the index row of one object."""
+        index = get_index(model)
+        if index is None or not self.is_available():
+            return
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {index.table} WHERE rowid = %s', [pk])
+
+    def rebuild(self, model) -> int:
+        """
+        Repopulate a model's index from scratch.
+
+        Returns:
+            The number of indexed objects.
+        """
+        index = get_index(model)
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {index.table}')
+        written = 0
+        batch = []
+        for row in self._read(index, model._base_manager.all()):
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                written += self._insert(index, batch)
+                batch = []
+        if batch:
+            written += self._insert(index, batch)
+        return written
+
+    def search(self, model, query: str, fields: Optional[Sequence[str]] = None, limit: Optional[int] = None) -> List[int]:
+        """
+        Find the objects matching every term of a query.
+
+        Args:
+            model: The model to search.
+            query: The user's query.
+            fields: Restrict matching to these indexed fields (default: all).
+            limit: The maximum number of results.
+
+        Returns:
+            Primary keys, most relevant first.
+        """
+        index = get_index(model)
+        terms = query_terms(query)
+        if not terms:
+            return []
+        sql, params = self.search_sql(index, terms, tuple(fields or index.fields))
+        if limit is not None:
+            sql += ' LIMIT %s'
+            params.append(limit)
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+    def _read(self, index: SearchIndex, queryset) -> Iterable[Tuple]:
+        """
+        Yield (pk, *indexed values) rows. Fields that the model does not have
+        (yet), as in migrations that run before the field is added, are empty.
+        """
+        model = queryset.model
+        present = [field for field in index.fields if _has_field(model, field)]
+        for row in queryset.values_list('pk', *present).iterator(chunk_size=self.batch_size):
+            values = dict(zip(present, row[1:]))
+            yield (row[0], *(values.get(field) for field in index.fields))
+
+    def _write(self, index: SearchIndex, pks: List[int], rows) -> None:
+        with self.connection.cursor() as cursor:
+            placeholders = ', '.join(['%s'] * len(pks))
+            cursor.execute(f'DELETE FROM {index.table} WHERE rowid IN ({placeholders})', pks)
+        self._insert(index, list(rows))
+
+    def _insert(self, index: SearchIndex, rows: List[Tuple]) -> int:
+        if not rows:
+            return 0
+        with self.connection.cursor() as cursor:
+            cursor.executemany(self.insert_sql(index), [
+                [row[0]] + [value or '' for value in row[1:]] for row in rows
+            ])
+        return len(rows)
+
+    def create_sql(self, index: SearchIndex) -> List[str]:
+        raise NotImplementedError
+
+    def insert_sql(self, index: SearchIndex) -> str:
+        raise NotImplementedError
+
+    def search_sql(self, index: SearchIndex, terms: List[str], fields: Tuple[str, ...]) -> Tuple[str, list]:
+        raise NotImplementedError
+
+class SQLiteSearchBackend(SearchBackend):
+    """
+    FTS5 backend. Ranking uses bm25 with the per-field weights of the index.
+    """
+
+    vendor = 'sqlite'
+    # Treat combining marks (Devanagari vowel signs) as part of a word.
+    tokenizer = "unicode61 remove_diacritics 2 categories 'L* N* Co M*'"
+
+    @classmethod
+    def is_supported(cls, connection) -> bool:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            return bool(cursor.fetchone()[0])
+
+    def create_sql(self, index):
+        columns = ', '.join(index.fields)
+        return [
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {index.table} USING fts5('
+            f'{columns}, tokenize="{self.tokenizer}", prefix=\'2 3\')'
+        ]
+
+    def insert_sql(self, index):
+        placeholders = ', '.join(['%s'] * (len(index.fields) + 1))
+        return f'INSERT INTO {index.table} (rowid, {", ".join(index.fields)}) VALUES ({placeholders})'
+
+    def search_sql(self, index, terms, fields):
+        match = ' '.join(f'"{term}"*' for term in terms)
+        if set(fields) != set(index.fields):
+            match = '{%s} : (%s)' % (' '.join(fields), match)
+        weights = ', '.join(str(index.weight(field)) for field in index.fields)
+        sql = (
+            f'SELECT rowid FROM {index.table} WHERE {index.table} MATCH %s '
+            f'ORDER BY bm25({index.table}, {weights}), rowid'
+        )
+        return sql, [match]
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    ``tsvector`` backend. Every indexed field gets its own ``tsvector``
+    column so searches can be restricted to some fields; one multi-column GIN
+    index serves them all. Ranking sums ``ts_rank`` weighted per field.
+    """
+
+    vendor = 'postgresql'
+    config = 'simple'
+
+    @classmethod
+    def is_supported(cls, connection) -> bool:
+        return True
+
+    def create_sql(self, index):
+        columns = ', '.join(f'{field} tsvector NOT NULL' for field in index.fields)
+        return [
+            f'CREATE TABLE IF NOT EXISTS {index.table} (rowid bigint PRIMARY KEY, {columns})',
+            f'CREATE INDEX IF NOT EXISTS {index.table}_gin ON {index.table} USING GIN ({", ".join(index.fields)})',
+        ]
+
+    def insert_sql(self, index):
+        values = ', '.join(f"to_tsvector('{self.config}', %s)" for _ in index.fields)
+        return f'INSERT INTO {index.table} (rowid, {", ".join(index.fields)}) VALUES (%s, {values})'
+
+    def search_sql(self, index, terms, fields):
+        tsquery = f"to_tsquery('{self.config}', %s)"
+        match = ' OR '.join(f'{field} @@ {tsquery}' for field in fields)
+        rank = ' + '.join(f'{index.weight(field)} * ts_rank({field}, {tsquery})' for field in fields)
+        query = ' & '.join(f'{term}:*' for term in terms)
+        sql = f'SELECT rowid FROM {index.table} WHERE {match} ORDER BY {rank} DESC, rowid'
+        return sql, [query] * (2 * len(fields))
+
+BACKENDS = {backend.vendor: backend for backend in (SQLiteSearchBackend, PostgresSearchBackend)}
+
+_backends: Dict[str, Optional[SearchBackend]] = {}
+
+def get_search_backend(connection=None) -> Optional[SearchBackend]:
+    """
+    Return the full-text backend for a database connection, or None when the
+    database engine has no supported full-text search.
+    """
+    connection = connection or default_connection
+    if connection.alias not in _backends:
+        backend_class = BACKENDS.get(connection.vendor)
+        if backend_class is None or not backend_class.is_supported(connection):
+            _backends[connection.alias] = None
+        else:
+            _backends[connection.alias] = backend_class(connection)
+    return _backends[connection.alias]
@@ -0,0 +1,182 @@
+"""
+Sync module for database operations.
+
+This module serves incremental changes to offline clients. Each kind of
+object is read in ``(updated_at, id)`` order from where the client's sync
+token left off, and deletions are read the same way from ``Tombstone`` rows
+written by the delete signals, so catching up costs time proportional to
+what changed rather than to the size of the data set.
+
+``updated_at`` is stamped when a row is saved, not when its transaction
+commits, so a token must not move past rows that are written but not yet
+committed. Tokens stop ``settings.SYNC_SETTLE_SECONDS`` short of the present,
+which covers ordinary requests. Writes that may take longer to commit (imports,
+batch jobs, bulk API writes) run inside ``SyncDB.hold()``, and tokens stop
+before the start of any hold still in progress.
+"""
+
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, Optional
+from django.conf import settings
+from django.db.models import Min
+from django.utils import timezone
+from .base import BaseDB
+from ..models import (
+    CommunityEvent, EventContribution, Relationship, SyncHold, Tombstone, UserProfile, Village, VillageService,
+)
+from ..pagination import keyset_after, decode_token, encode_cursor
+
+class SyncTokenExpired(Exception):
+    """The token predates the deletions still on record; a full sync is needed."""
+
+class SyncDB(BaseDB):
+    """
+    Class for reading changes since a sync token.
+    """
+
+    # Name in the response -> model. Deletions are reported under the same names.
+    MODELS = {
+        'villages': Village,
+        'profiles': UserProfile,
+        'relationships': Relationship,
+        'events': CommunityEvent,
+        'contributions': EventContribution,
+        'services': VillageService,
+    }
+    DELETED = 'deleted'
+
+    PAGE_SIZE = 200
+    MAX_PAGE_SIZE = 1000
+
+    @classmethod
+    def get_changes(cls, token: Optional[str] = None, page_size: int = PAGE_SIZE,
+                    prepare: Optional[Callable] = None) -> Dict[str, Any]:
+        """
+        Get up to ``page_size`` changed objects of each kind, and deletions,
+        since a sync token.
+
+        Rows changed in the last ``settings.SYNC_SETTLE_SECONDS``, or since
+        the start of a ``hold()`` still in progress, are left for the next
+        sync, so that a transaction in flight when the page is read cannot
+        commit a row behind the new token. An object changed while a client
+        is paging may be returned twice; clients apply each page's changes as
+        upserts, then its deletions.
+
+        Args:
+            token: The token from the previous response, or None for a full
+                (first) sync, which reports no deletions.
+            page_size: The maximum number of objects of each kind.
+            prepare: Called as ``prepare(name, queryset)`` to add loading
+                options (such as ``select_related``) to each queryset.
+
+        Returns:
+            A dictionary with 'changes' (name -> list of objects), 'deleted'
+            (name -> list of ids), 'token' for the next request and
+            'has_more' (True until the client has caught up).
+
+        Raises:
+            ValueError: If the token is malformed.
+            SyncTokenExpired: If deletions since the token may have been
+                purged already.
+        """
+        now = timezone.now()
+        until = now - timedelta(seconds=settings.SYNC_SETTLE_SECONDS)
+        held_since = SyncHold.objects.filter(
+            started_at__gte=now - timedelta(seconds=settings.SYNC_HOLD_TIMEOUT)
+        ).aggregate(since=Min('started_at'))['since']
+        if held_since is not None:
+            until = min(until, held_since)
+        if token:
+            values = decode_token(token).get('v')
+            positions = values[0] if isinstance(values, list) and len(values) == 1 else None
+            if not isinstance(positions, dict) or not isinstance(positions.get(cls.DELETED), list):
+                raise ValueError('Invalid token')
+            deleted_since = _position(positions[cls.DELETED])[0]
+            if deleted_since < now - timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS):
+                raise SyncTokenExpired()
+        else:
+            positions = {cls.DELETED: [until.isoformat(), 0]}
+
+        next_positions = {}
+        has_more = False
+        changes: Dict[str, list] = {}
+        streams = [(name, model, 'updated_at') for name, model in cls.MODELS.items()]
+        streams.append((cls.DELETED, Tombstone, 'deleted_at'))
+        for name, model, field in streams:
+            queryset = model._default_manager.filter(**{f'{field}__lt': until})
+            if positions.get(name):
+                queryset = queryset.filter(keyset_after([field, 'id'], _position(positions[name])))
+            if prepare is not None and name != cls.DELETED:
+                queryset = prepare(name, queryset)
+            rows = list(queryset.order_by(field, 'id')[:page_size + 1])
+            if len(rows) > page_size:
+                has_more = True
+                rows = rows[:page_size]
+                last = rows[-1]
+                next_positions[name] = [getattr(last, field).isoformat(), last.pk]
+            else:
+                # Caught up: later syncs only need rows changed from here on.
+                next_positions[name] = [until.isoformat(), 0]
+            changes[name] = rows
+
+        tombstones = changes.pop(cls.DELETED)
+        names = {model._meta.label_lower: name for name, model in cls.MODELS.items()}
+        deleted: Dict[str, list] = {name: [] for name in cls.MODELS}
+        for tombstone in tombstones:
+            if tombstone.model in names:
+                deleted[names[tombstone.model]].append(tombstone.object_id)
+        return {
+            'changes': changes,
+            'deleted': deleted,
+            'token': encode_cursor([next_positions]),
+            'has_more': has_more,
+        }
+
+    @classmethod
+    @contextmanager
+    def hold(cls, label: str) -> Iterator[None]:
+        """
+        Keep sync tokens from passing the start of a long write.
+
+        Enter it outside the write's transaction (the hold must be visible to
+        other connections while the transaction is open), before any row is
+        stamped. Holds older than ``settings.SYNC_HOLD_TIMEOUT`` are ignored,
+        so one left behind by a crashed process does not stop syncing.
+
+        Args:
+            label: What is writing, for the admin and logs.
+        """
+        hold = SyncHold.objects.create(label=label[:100], started_at=timezone.now())
+        try:
+            yield
+        finally:
+            SyncHold.objects.filter(pk=hold.pk).delete()
+
+    @classmethod
+    def record_deletion(cls, instance) -> None:
+        """Write the tombstone of a deleted object of one of the synced models."""
+        Tombstone.objects.create(model=instance._meta.label_lower, object_id=instance.pk)
+
+    @classmethod
+    def purge_tombstones(cls) -> int:
+        """
+        Delete tombstones older than ``settings.SYNC_TOMBSTONE_RETENTION_DAYS``.
+
+        Returns:
+            The number of tombstones deleted.
+        """
+        cutoff = timezone.now() - timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS)
+        deleted, _ = Tombstone.objects.filter(deleted_at__lt=cutoff).delete()
+        return deleted
+
+def _position(value):
+    """Parse a stream position ``[iso timestamp, id]`` from a token."""
+    try:
+        moment, pk = value
+        moment = datetime.fromisoformat(moment)
+        if timezone.is_naive(moment):
+            raise ValueError('Naive timestamp')
+        return moment, int(pk)
+    except (TypeError, ValueError) as e:
+        raise ValueError('Invalid token') from e
@@ -9,6 +9,7 @@ from django.db.models import Q
 from typing import List, Dict, Any, Optional, Union, Tuple
 from .base import BaseDB
 from ..models import UserProfile
+from ..phonetics import phonetic_key
 
 class UserManagementDB(BaseDB):
     """
@@ -212,19 +213,48 @@ class UserManagementDB(BaseDB):
         return list(User.objects.filter(q_objects))
     
     @classmethod
-    def search_user_profiles(cls, query: str) -> List[UserProfile]:
+    def search_user_profiles(cls, query: str, limit: int = None) -> List[UserProfile]:
         """
         Search for user profiles by the given query.
         
         Args:
             query: The search query.
+            limit: The maximum number of results, or None for all.
             
         Returns:
-            A list of user profiles matching the query.
+            A list of user profiles matching the query, most relevant first.
         """
         fields = ['education', 'profession', 'hobbies', 'achievements', 
                  'social_contributions', 'father_name', 'mother_name', 'nickname']
-        return cls.search(UserProfile, query, fields)
+        return cls.search(UserProfile, query, fields, limit=limit)
+    
+    @classmethod
+    def search_members(cls, query: str, queryset=None, limit: int = None) -> List[UserProfile]:
+        """
+        Search for members by name, nickname, education or profession.
+        
+        Text matches come first; members whose names merely sound like the
+        query (other Roman spellings, or Devanagari) follow, matched on the
+        indexed phonetic key.
+        
+        Args:
+            query: The search query.
+            queryset: Restrict the results to this queryset (default: all profiles).
+            limit: The maximum number of results, or None for all.
+            
+        Returns:
+            A list of user profiles matching the query.
+        """
+        fields = ['user__first_name', 'user__last_name', 'nickname', 'education', 'profession']
+        results = cls.search(UserProfile, query, fields, queryset=queryset, limit=limit)
+        
+        key = phonetic_key(query)
+        if key and (limit is None or len(results) < limit):
+            seen = {profile.pk for profile in results}
+            for profile in cls.search(UserProfile, key, ['name_phonetic'], queryset=queryset, limit=limit):
+                if profile.pk not in seen:
+                    results.append(profile)
+        return results[:limit]
     
     @classmethod
     def get_user_with_profile(cls, user_id: int) -> Tuple[Optional[User], Optional[UserProfile]]:
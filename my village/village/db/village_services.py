@@ -135,21 +135,21 @@ class VillageServicesDB(BaseDB):
         return cls.filter(VillageService, contact_person_id=contact_person_id)
     
     @classmethod
-    def search_services(cls, query: str, village_id: int = None) -> List[VillageService]:
+    def search_services(cls, query: str, village_id: int = None, limit: int = None) -> List[VillageService]:
         """
         Search for services by the given query.
         
         Args:
             query: The search query.
             village_id: The ID of the village to filter by, or None for all villages.
+            limit: The maximum number of results, or None for all.
             
         Returns:
-            A list of services matching the query.
+            A list of services matching the query, most relevant first.
         """
-        fields = ['name', 'description', 'category', 'contact_person__user__username', 'notes']
-        services = cls.search(VillageService, query, fields)
-        
+        fields = ['name', 'service_type', 'description', 'address']
+        queryset = VillageService.objects.all()
         if village_id:
-            return [service for service in services if service.village_id == village_id]
+            queryset = queryset.filter(village_id=village_id)
         
-        return services 
\ No newline at end of file
+        return cls.search(VillageService, query, fields, queryset=queryset, limit=limit)
@@ -0,0 +1,167 @@
+"""
+Village Sync module for database operations.
+
+This module re-synchronises village master data against a fresh copy of the
+government list. Villages are matched on their census code, and only the
+differences (new villages, renames and moves) are written, in bulk.
+"""
+
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from django.utils import timezone
+from .location_hierarchy import LocationHierarchyDB
+from .location_import import LocationImporter
+from .location_tree import invalidate_location_tree
+from ..models import LocationClosure, Village
+
+class VillageSynchronizer(LocationImporter):
+    """
+    Class for applying a diff between a hierarchy JSON file and the database.
+
+    Levels above the village are resolved exactly like a normal import
+    (missing districts, blocks, ... are created). Villages are matched by
+    ``Village.code`` instead of by name, so a village whose name or panchayat
+    changed is updated in place rather than duplicated.
+    """
+
+    def __init__(self, state: str = 'Bihar', batch_size: int = 1000, per_district: bool = False):
+        super().__init__(state=state, batch_size=batch_size)
+        self.per_district = per_district
+        self.by_code: Dict[Any, Tuple[int, str, int]] = {}
+        self.ambiguous = set()
+        self.seen = set()
+        self.pending_updates: List[Village] = []
+        self.moved_ids: List[int] = []
+        self.changes: Dict[str, List[Dict[str, Any]]] = {
+            'inserted': [],
+            'renamed': [],
+            'moved': [],
+            'skipped': [],
+        }
+
+    def code_key(self, code: str, district_id: Optional[int]):
+        """
+        Return the key a village is matched on.
+
+        Census codes are unique state-wide; sources that restart numbering in
+        every district are matched with ``per_district=True`` instead.
+        """
+        return (district_id, code) if self.per_district else code
+
+    def prefetch(self) -> None:
+        """
+        Load the per-level index plus a code -> (id, name, panchayat) map of
+        all existing villages.
+        """
+        super().prefetch()
+        rows = Village.objects.exclude(code__isnull=True).exclude(code='').values_list(
+            'pk', 'code', 'name', 'panchayat_id', 'district_id'
+        )
+        for pk, code, name, panchayat_id, district_id in rows.iterator(chunk_size=5000):
+            key = self.code_key(code, district_id)
+            if key in self.by_code:
+                self.ambiguous.add(key)
+            self.by_code[key] = (pk, name, panchayat_id)
+
+    def _resolve_level(self, model, pending):
+        if model is not Village:
+            return super()._resolve_level(model, pending)
+
+        new_rows = {}
+        for data, ancestors in pending:
+            name = self.get_name(data, 'village')
+            code = (data.get('code') or '').strip()
+            key = self.code_key(code, ancestors.get('district'))
+            if not name or not code or key in self.ambiguous or key in self.seen:
+                self.changes['skipped'].append({'code': code, 'name': name})
+                continue
+            self.seen.add(key)
+
+            existing = self.by_code.get(key)
+            if existing is None:
+                new_rows[key] = self._build(model, name, ancestors, data)
+                self.changes['inserted'].append({'code': code, 'name': name, 'panchayat': ancestors['panchayat']})
+                continue
+
+            pk, current_name, panchayat_id = existing
+            renamed = current_name != name
+            moved = panchayat_id != ancestors['panchayat']
+            if not renamed and not moved:
+                self.matched['village'] += 1
+                continue
+
+            village = self._build(model, name, ancestors, data)
+            village.pk = pk
+            village.updated_at = timezone.now()
+            self.pending_updates.append(village)
+            if renamed:
+                self.changes['renamed'].append({'code': code, 'from': current_name, 'to': name})
+            if moved:
+                self.moved_ids.append(pk)
+                self.changes['moved'].append({'code': code, 'name': name, 'from': panchayat_id, 'to': ancestors['panchayat']})
+            if len(self.pending_updates) >= self.batch_size:
+                self._apply_updates()
+
+        return [], new_rows
+
+    def _insert(self, model, new_rows):
+        if model is not Village:
+            return super()._insert(model, new_rows)
+
+        instances = Village.objects.bulk_create(list(new_rows.values()), batch_size=self.batch_size)
+        if any(instance.pk is None for instance in instances):
+            # Backends that cannot return ids from a bulk insert.
+            fetched = {
+                self.code_key(code, district_id): pk
+                for pk, code, district_id in Village.objects.filter(
+                    code__in=[instance.code for instance in instances]
+                ).values_list('pk', 'code', 'district_id')
+            }
+            for key, instance in new_rows.items():
+                instance.pk = fetched[key]
+        self.created['village'] += len(instances)
+        self.new_instances.extend(instances)
+
+    def _apply_updates(self) -> None:
+        """
+        Write the pending renames and moves with one ``bulk_update`` and
+        re-link moved villages in the closure table.
+        """
+        if not self.pending_updates:
+            return
+
+        Village.objects.bulk_update(
+            self.pending_updates,
+            ['name', 'name_phonetic', 'panchayat', 'post_office', 'police_station', 'block', 'district', 'updated_at'],
+            batch_size=self.batch_size
+        )
+        moved = set(self.moved_ids)
+        if moved:
+            LocationClosure.objects.filter(
+                descendant_level='village',
+                descendant_id__in=moved,
+                depth__gt=0
+            ).delete()
+            LocationHierarchyDB.add_many_to_closure(
+                [village for village in self.pending_updates if village.pk in moved],
+                batch_size=self.batch_size
+            )
+        invalidate_location_tree()
+        self.pending_updates = []
+        self.moved_ids = []
+
+    def flush(self) -> None:
+        self._apply_updates()
+        super().flush()
+
+    def run(self, districts: Iterator[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Apply the diff for a stream of districts.
+
+        Returns:
+            The import summary, extended with a ``changes`` report and the
+            number of existing coded villages missing from the source.
+        """
+        summary = super().run(districts)
+        summary['changes'] = self.changes
+        summary['missing'] = len(set(self.by_code) - self.seen)
+        return summary
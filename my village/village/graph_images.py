@@ -0,0 +1,179 @@
+"""
+Relationship graph images.
+
+Drawing a member's relationship network (spring layout plus a matplotlib
+render) takes seconds, so it never happens inside a request. Images are
+rendered by a small background thread pool and stored under
+``MEDIA_ROOT/relationship_graphs/``, named after a hash of everything that is
+drawn: the member, the people they are related to and the relationship types.
+A page can therefore serve a stored image directly, and any change to the
+relationship set simply produces a new name. Each member's images are kept in
+their own directory, which signals on ``Relationship`` empty when the
+member's relationships change, whichever process rendered them.
+
+A render that fails leaves a ``.failed`` marker next to where the image would
+be, so it is not retried on every poll; the marker goes with the rest of the
+directory once the relationships change.
+"""
+
+import hashlib
+import io
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from .models import Relationship
+
+logger = logging.getLogger(__name__)
+
+# Bump when the drawing code changes so old images are not served.
+RENDER_VERSION = 1
+IMAGE_DIR = 'relationship_graphs'
+
+CENTER_COLOR = '#FFD700'  # Gold for the member themselves
+COLOR_MAP = {
+    'family': '#FF6B6B',      # Red
+    'friend': '#4ECDC4',      # Turquoise
+    'classmate': '#45B7D1',   # Blue
+    'colleague': '#96CEB4',   # Green
+    'neighbor': '#FFEEAD',    # Yellow
+    'other': '#D4A5A5'        # Pink
+}
+
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+_in_flight = set()
+
+class GraphRenderFailed(Exception):
+    """Drawing the current graph of a member failed; it is not retried."""
+
+def display_name(user) -> str:
+    return user.get_full_name() or user.username
+
+def get_graph_edges(profile) -> List[Tuple[int, str, str, str]]:
+    """
+    Return ``(profile id, name, type, type label)`` for everyone ``profile``
+    is related to, in a stable order.
+    """
+    relationships = Relationship.objects.filter(user=profile).select_related('related_user__user')
+    edges = [
+        (rel.related_user_id, display_name(rel.related_user.user), rel.relationship_type,
+         rel.get_relationship_type_display())
+        for rel in relationships
+    ]
+    return sorted(edges)
+
+def graph_key(profile, edges) -> str:
+    """Hash of everything that appears in the image."""
+    payload = json.dumps([RENDER_VERSION, profile.pk, display_name(profile.user), edges])
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+def image_dir(profile_id: int) -> str:
+    return f'{IMAGE_DIR}/{profile_id}'
+
+def image_name(profile_id: int, key: str) -> str:
+    return f'{image_dir(profile_id)}/{key}.png'
+
+def failure_name(name: str) -> str:
+    return f'{name[:-len(".png")]}.failed'
+
+def get_graph_image(profile) -> Tuple[Optional[str], List[Tuple[int, str, str, str]]]:
+    """
+    Return the URL of the member's graph image, scheduling a render if it
+    does not exist yet.
+
+    Returns:
+        A ``(url, edges)`` pair; the URL is None while the image is rendering.
+
+    Raises:
+        GraphRenderFailed: If rendering this graph failed before.
+    """
+    edges = get_graph_edges(profile)
+    key = graph_key(profile, edges)
+    name = image_name(profile.pk, key)
+    if default_storage.exists(name):
+        return default_storage.url(name), edges
+    if default_storage.exists(failure_name(name)):
+        raise GraphRenderFailed(name)
+
+    with _lock:
+        if name not in _in_flight:
+            _in_flight.add(name)
+            _get_executor().submit(_render_job, name, display_name(profile.user), edges)
+    return None, edges
+
+def invalidate_graph_image(profile_id: int) -> None:
+    """Delete the images (and failure markers) rendered for a member."""
+    directory = image_dir(profile_id)
+    try:
+        _, files = default_storage.listdir(directory)
+    except FileNotFoundError:
+        return
+    for filename in files:
+        try:
+            default_storage.delete(f'{directory}/{filename}')
+        except OSError:
+            logger.warning('Could not delete relationship graph %s/%s', directory, filename, exc_info=True)
+
+def render_graph(center_label: str, edges) -> bytes:
+    """
+    Draw the graph and return it as PNG bytes.
+
+    Uses a standalone ``Figure`` rather than ``pyplot`` so renders running in
+    worker threads do not share global state.
+    """
+    import networkx as nx
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    G = nx.DiGraph()
+    G.add_node('me', label=center_label, color=CENTER_COLOR)
+    for profile_id, name, relationship_type, type_label in edges:
+        G.add_node(profile_id, label=name, color=COLOR_MAP.get(relationship_type, COLOR_MAP['other']))
+        G.add_edge('me', profile_id, label=type_label)
+
+    figure = Figure(figsize=(12, 8))
+    FigureCanvasAgg(figure)
+    ax = figure.add_subplot()
+    ax.set_axis_off()
+    pos = nx.spring_layout(G, k=1, iterations=50, seed=1)
+
+    nx.draw_networkx_nodes(G, pos, ax=ax,
+                           node_color=[G.nodes[node]['color'] for node in G.nodes()],
+                           node_size=2000)
+    nx.draw_networkx_edges(G, pos, ax=ax, edge_color='gray', arrows=True, arrowsize=20)
+    nx.draw_networkx_labels(G, pos, ax=ax,
+                            labels={node: G.nodes[node]['label'] for node in G.nodes()},
+                            font_size=10)
+    nx.draw_networkx_edge_labels(G, pos, ax=ax, edge_labels=nx.get_edge_attributes(G, 'label'), font_size=8)
+
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format='png', bbox_inches='tight', dpi=settings.RELATIONSHIP_GRAPH_DPI)
+    return buffer.getvalue()
+
+def _render_job(name: str, center_label: str, edges) -> None:
+    try:
+        if not default_storage.exists(name):
+            default_storage.save(name, ContentFile(render_graph(center_label, edges)))
+    except Exception:
+        logger.exception('Rendering relationship graph %s failed', name)
+        try:
+            default_storage.save(failure_name(name), ContentFile(b''))
+        except OSError:
+            logger.warning('Could not record the failure of %s', name, exc_info=True)
+    finally:
+        with _lock:
+            _in_flight.discard(name)
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.RELATIONSHIP_GRAPH_WORKERS,
+            thread_name_prefix='relationship-graph'
+        )
+    return _executor
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from village.models import LOCATION_MODELS
+from village.db import LocationHierarchyDB, SyncDB
+
+class Command(BaseCommand):
+    help = 'Fill the denormalized ancestor columns (district_id, block_id, ...) and the closure table of the location hierarchy'
+
+    def handle(self, *args, **options):
+        with SyncDB.hold('backfill_location_ancestors'), transaction.atomic():
+            now = timezone.now()
+            # Walk top-down so every parent is already correct when its children copy from it.
+            for model in LOCATION_MODELS:
+                if not model.parent_field:
+                    continue
+
+                parent_model = model._meta.get_field(model.parent_field).related_model
+                inherited = [field for field in model.ancestor_fields if field != model.parent_field]
+                if not inherited:
+                    continue
+
+                updates = {
+                    f'{field}_id': Subquery(
+                        parent_model.objects.filter(pk=OuterRef(f'{model.parent_field}_id')).values(f'{field}_id')[:1]
+                    )
+                    for field in inherited
+                }
+                # The API renders these columns: let cached copies and sync
+                # clients see the change.
+                updates['updated_at'] = now
+                updated = model.objects.update(**updates)
+                self.stdout.write(f'Updated {updated} {model._meta.verbose_name_plural}')
+
+            written = LocationHierarchyDB.rebuild_closure()
+            self.stdout.write(f'Rebuilt location closure table with {written} rows')
+
+        self.stdout.write(self.style.SUCCESS('Successfully backfilled location ancestor columns'))
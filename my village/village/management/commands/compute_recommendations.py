@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from village.db.recommendations import RecommendationsDB
+
+class Command(BaseCommand):
+    help = 'Recompute the "people you may know" suggestions of every member (run periodically, e.g. nightly)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=None,
+                            help='Suggestions kept per member (default: RECOMMENDATIONS_PER_PROFILE)')
+
+    def handle(self, *args, **options):
+        written = RecommendationsDB.compute(top_n=options['top'])
+        self.stdout.write(self.style.SUCCESS(f'Successfully stored {written} recommendations'))
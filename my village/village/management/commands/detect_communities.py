@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from village.db.communities import CommunitiesDB
+
+class Command(BaseCommand):
+    help = 'Detect social clusters in the relationship graph (incrementally, unless --full)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Relabel every member instead of only those whose relationships changed')
+
+    def handle(self, *args, **options):
+        result = CommunitiesDB.detect(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Relabelled {result['profiles']} members in {result['iterations']} rounds; "
+            f"{result['changed']} changed cluster"
+        ))
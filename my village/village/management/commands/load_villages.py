@@ -1,13 +1,16 @@
-import json
 import os
 from django.core.management.base import BaseCommand
-from village.models import District, Block, PoliceStation, PostOffice, Panchayat, Village
+from village.db.location_import import LocationImporter
 
 class Command(BaseCommand):
     help = 'Load village data from a JSON file'
 
     def add_arguments(self, parser):
         parser.add_argument('json_file', type=str, help='Path to the JSON file containing village data')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of rows to insert per query')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Run the import and report what would change, then roll it back')
 
     def handle(self, *args, **options):
         json_file = options['json_file']
@@ -17,71 +20,28 @@ class Command(BaseCommand):
             return
         
         try:
-            with open(json_file, 'r') as f:
-                data = json.load(f)
-            
-            state_name = data.get('state')
-            
-            for district_data in data.get('districts', []):
-                district_name = district_data.get('name')
-                district, _ = District.objects.get_or_create(
-                    name=district_name,
-                    defaults={'state': state_name}
+            with open(json_file, 'r', encoding='utf-8') as f:
+                summary = LocationImporter.import_file(
+                    f,
+                    batch_size=options['batch_size'],
+                    dry_run=options['dry_run']
                 )
-                
-                for block_data in district_data.get('blocks', []):
-                    block_name = block_data.get('name')
-                    block, _ = Block.objects.get_or_create(
-                        name=block_name,
-                        district=district
-                    )
-                    
-                    for ps_data in block_data.get('police_stations', []):
-                        ps_name = ps_data.get('name')
-                        police_station, _ = PoliceStation.objects.get_or_create(
-                            name=ps_name,
-                            block=block
-                        )
-                        
-                        for po_data in ps_data.get('post_offices', []):
-                            po_name = po_data.get('name')
-                            post_office, _ = PostOffice.objects.get_or_create(
-                                name=po_name,
-                                police_station=police_station
-                            )
-                            
-                            for panchayat_data in po_data.get('panchayats', []):
-                                panchayat_name = panchayat_data.get('name')
-                                panchayat, _ = Panchayat.objects.get_or_create(
-                                    name=panchayat_name,
-                                    post_office=post_office
-                                )
-                                
-                                for village_data in panchayat_data.get('villages', []):
-                                    village_name = village_data.get('name')
-                                    village_code = village_data.get('code')
-                                    village, created = Village.objects.get_or_create(
-                                        name=village_name,
-                                        panchayat=panchayat,
-                                        defaults={'code': village_code}
-                                    )
-                                    
-                                    if created:
-                                        self.stdout.write(
-                                            self.style.SUCCESS(
-                                                f'Created village: {village_name} in {panchayat_name}, {po_name}, {ps_name}, {block_name}, {district_name}'
-                                            )
-                                        )
-                                    else:
-                                        self.stdout.write(
-                                            self.style.SUCCESS(
-                                                f'Updated village: {village_name} in {panchayat_name}, {po_name}, {ps_name}, {block_name}, {district_name}'
-                                            )
-                                        )
-            
-            self.stdout.write(self.style.SUCCESS('Successfully loaded village data'))
-        
-        except json.JSONDecodeError:
-            self.stdout.write(self.style.ERROR('Invalid JSON file'))
+        except ValueError as e:
+            self.stdout.write(self.style.ERROR(f'Invalid JSON file: {str(e)}'))
+            return
         except Exception as e:
-            self.stdout.write(self.style.ERROR(f'Error loading village data: {str(e)}')) 
\ No newline at end of file
+            self.stdout.write(self.style.ERROR(f'Error loading village data: {str(e)}'))
+            return
+        
+        for level, created in summary['created'].items():
+            self.stdout.write(f"{level}: {created} created, {summary['matched'][level]} already present")
+        
+        self.stdout.write(
+            f"Processed {summary['rows']} rows in {summary['seconds']:.2f}s "
+            f"({summary['rows_per_second']:.0f} rows/sec)"
+        )
+        
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('Dry run: no changes were saved'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Successfully loaded village data'))
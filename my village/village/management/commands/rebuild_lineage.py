@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from village.db.kinship import KinshipDB
+
+class Command(BaseCommand):
+    help = 'Recompute the ancestor/descendant lineage table from the parent kinship links (e.g. after bulk imports)'
+
+    def handle(self, *args, **options):
+        written = KinshipDB.rebuild_lineage()
+        self.stdout.write(self.style.SUCCESS(f'Successfully stored {written} lineage rows'))
@@ -0,0 +1,20 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from village.db.search_backends import SEARCH_INDEXES, get_search_backend
+
+class Command(BaseCommand):
+    help = 'Repopulate the full-text search index of profiles, events and services (e.g. after bulk imports)'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        if backend is None or not backend.is_available():
+            raise CommandError('Full-text search is not available on this database; searches use icontains instead')
+
+        with transaction.atomic():
+            for label in SEARCH_INDEXES:
+                model = apps.get_model(label)
+                written = backend.rebuild(model)
+                self.stdout.write(f'Indexed {written} {model._meta.verbose_name_plural}')
+
+        self.stdout.write(self.style.SUCCESS('Successfully rebuilt the search index'))
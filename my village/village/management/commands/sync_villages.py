@@ -0,0 +1,72 @@
+import json
+import os
+from django.core.management.base import BaseCommand
+from village.db.village_sync import VillageSynchronizer
+
+class Command(BaseCommand):
+    help = 'Apply only the differences between a village JSON file and the database, matching villages by census code'
+
+    def add_arguments(self, parser):
+        parser.add_argument('json_file', type=str, help='Path to the JSON file containing village data')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of rows to insert or update per query')
+        parser.add_argument('--per-district', action='store_true',
+                            help='Treat village codes as unique only within their district')
+        parser.add_argument('--report', type=str,
+                            help='Write the full change report to this JSON file')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Compute and report the changes, then roll them back')
+
+    def handle(self, *args, **options):
+        json_file = options['json_file']
+        
+        if not os.path.exists(json_file):
+            self.stdout.write(self.style.ERROR(f'File {json_file} does not exist'))
+            return
+        
+        try:
+            with open(json_file, 'r', encoding='utf-8') as f:
+                summary = VillageSynchronizer.import_file(
+                    f,
+                    batch_size=options['batch_size'],
+                    dry_run=options['dry_run'],
+                    per_district=options['per_district']
+                )
+        except ValueError as e:
+            self.stdout.write(self.style.ERROR(f'Invalid JSON file: {str(e)}'))
+            return
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Error syncing village data: {str(e)}'))
+            return
+        
+        changes = summary['changes']
+        if options['verbosity'] >= 2:
+            for change in changes['inserted']:
+                self.stdout.write(f"+ {change['code']} {change['name']}")
+            for change in changes['renamed']:
+                self.stdout.write(f"~ {change['code']} {change['from']} -> {change['to']}")
+            for change in changes['moved']:
+                self.stdout.write(f"> {change['code']} {change['name']} moved to panchayat {change['to']}")
+        
+        for level, created in summary['created'].items():
+            if level != 'village' and created:
+                self.stdout.write(f'{level}: {created} created')
+        self.stdout.write(
+            f"villages: {len(changes['inserted'])} inserted, {len(changes['renamed'])} renamed, "
+            f"{len(changes['moved'])} moved, {summary['matched']['village']} unchanged, "
+            f"{len(changes['skipped'])} skipped, {summary['missing']} not in source"
+        )
+        self.stdout.write(
+            f"Processed {summary['rows']} rows in {summary['seconds']:.2f}s "
+            f"({summary['rows_per_second']:.0f} rows/sec)"
+        )
+        
+        if options['report']:
+            with open(options['report'], 'w', encoding='utf-8') as f:
+                json.dump(summary, f, indent=2, ensure_ascii=False)
+            self.stdout.write(f"Change report written to {options['report']}")
+        
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('Dry run: no changes were saved'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Successfully synced village data'))
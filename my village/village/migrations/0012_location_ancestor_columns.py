@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('village', '0011_alter_aadhaarverification_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='panchayat',
+            name='block',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='village.block'),
+        ),
+        migrations.AddField(
+            model_name='panchayat',
+            name='district',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='village.district'),
+        ),
+        migrations.AddField(
+            model_name='panchayat',
+            name='police_station',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='village.policestation'),
+        ),
+        migrations.AddField(
+            model_name='policestation',
+            name='district',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='village.district'),
+        ),
+        migrations.AddField(
+            model_name='postoffice',
+            name='block',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='village.block'),
+        ),
+        migrations.AddField(
+            model_name='postoffice',
+            name='district',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='village.district'),
+        ),
+        migrations.AddField(
+            model_name='village',
+            name='block',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='village.block'),
+        ),
+        migrations.AddField(
+            model_name='village',
+            name='district',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='village.district'),
+        ),
+        migrations.AddField(
+            model_name='village',
+            name='police_station',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='village.policestation'),
+        ),
+        migrations.AddField(
+            model_name='village',
+            name='post_office',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='village.postoffice'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('village', '0012_location_ancestor_columns'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LocationClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ancestor_level', models.CharField(choices=[('district', 'District'), ('block', 'Block'), ('police_station', 'Police Station'), ('post_office', 'Post Office'), ('panchayat', 'Panchayat'), ('village', 'Village')], max_length=20)),
+                ('ancestor_id', models.PositiveBigIntegerField()),
+                ('descendant_level', models.CharField(choices=[('district', 'District'), ('block', 'Block'), ('police_station', 'Police Station'), ('post_office', 'Post Office'), ('panchayat', 'Panchayat'), ('village', 'Village')], max_length=20)),
+                ('descendant_id', models.PositiveBigIntegerField()),
+                ('depth', models.PositiveSmallIntegerField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['descendant_level', 'descendant_id'], name='village_closure_desc_idx')],
+                'unique_together': {('ancestor_level', 'ancestor_id', 'descendant_level', 'descendant_id')},
+            },
+        ),
+    ]
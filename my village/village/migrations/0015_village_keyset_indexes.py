@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('village', '0014_cacheversion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='village',
+            index=models.Index(fields=['name', 'id'], name='village_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='village',
+            index=models.Index(fields=['district', 'name', 'id'], name='village_district_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='village',
+            index=models.Index(fields=['block', 'name', 'id'], name='village_block_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='village',
+            index=models.Index(fields=['panchayat', 'name', 'id'], name='village_panchayat_name_idx'),
+        ),
+    ]
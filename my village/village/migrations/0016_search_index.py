@@ -0,0 +1,26 @@
+from django.db import migrations
+from village.db.search_backends import SEARCH_INDEXES, get_search_backend
+
+def create_search_index(apps, schema_editor):
+    backend = get_search_backend(schema_editor.connection)
+    if backend is None:
+        # No full-text support on this engine; searches fall back to icontains.
+        return
+    backend.install()
+    for label in SEARCH_INDEXES:
+        backend.rebuild(apps.get_model(label))
+
+def drop_search_index(apps, schema_editor):
+    backend = get_search_backend(schema_editor.connection)
+    if backend is not None:
+        backend.uninstall()
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('village', '0015_village_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
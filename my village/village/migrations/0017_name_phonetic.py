@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:16
+
+from django.db import migrations, models
+from village.db.search_backends import get_search_backend
+from village.phonetics import phonetic_key
+
+def fill_phonetic_keys(apps, schema_editor):
+    Village = apps.get_model('village', 'Village')
+    UserProfile = apps.get_model('village', 'UserProfile')
+
+    villages = []
+    for village in Village.objects.only('pk', 'name').iterator(chunk_size=2000):
+        village.name_phonetic = phonetic_key(village.name)[:100]
+        villages.append(village)
+    Village.objects.bulk_update(villages, ['name_phonetic'], batch_size=1000)
+
+    profiles = []
+    for profile in UserProfile.objects.select_related('user').iterator(chunk_size=2000):
+        profile.name_phonetic = phonetic_key(
+            ' '.join([profile.user.first_name, profile.user.last_name, profile.nickname])
+        )[:255]
+        profiles.append(profile)
+    UserProfile.objects.bulk_update(profiles, ['name_phonetic'], batch_size=1000)
+
+    # The profile search index gains a name_phonetic column.
+    backend = get_search_backend(schema_editor.connection)
+    if backend is not None:
+        backend.recreate(UserProfile)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('village', '0016_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='name_phonetic',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='village',
+            name='name_phonetic',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=100),
+        ),
+        migrations.RunPython(fill_phonetic_keys, migrations.RunPython.noop),
+    ]
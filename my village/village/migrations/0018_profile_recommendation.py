@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('village', '0017_name_phonetic'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveIntegerField()),
+                ('score', models.FloatField()),
+                ('mutual_count', models.PositiveIntegerField(default=0)),
+                ('same_village', models.BooleanField(default=False)),
+                ('same_panchayat', models.BooleanField(default=False)),
+                ('same_profession', models.BooleanField(default=False)),
+                ('computed_at', models.DateTimeField(auto_now_add=True)),
+                ('candidate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='village.userprofile')),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='village.userprofile')),
+            ],
+            options={
+                'unique_together': {('profile', 'rank')},
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('village', '0018_profile_recommendation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KinshipEdge',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('parent', 'Parent'), ('child', 'Child'), ('spouse', 'Spouse'), ('sibling', 'Sibling')], max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('person', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='kinship_edges', to='village.userprofile')),
+                ('relative', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='village.userprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['relative', 'kind'], name='kinship_relative_kind_idx')],
+                'unique_together': {('person', 'relative')},
+            },
+        ),
+        migrations.CreateModel(
+            name='Lineage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveSmallIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='village.userprofile')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='village.userprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ancestor', 'depth'], name='lineage_ancestor_depth_idx')],
+                'unique_together': {('descendant', 'ancestor')},
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:47
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+def fill_pending_counts(apps, schema_editor):
+    UserProfile = apps.get_model('village', 'UserProfile')
+    RelationshipRequest = apps.get_model('village', 'RelationshipRequest')
+
+    pending = RelationshipRequest.objects.filter(to_user=OuterRef('pk'), status='pending').order_by().values(
+        'to_user'
+    ).annotate(count=Count('pk')).values('count')
+    UserProfile.objects.update(pending_received_count=Coalesce(Subquery(pending), Value(0)))
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('village', '0020_profile_cluster'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='pending_received_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_pending_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('village', '0021_profile_pending_received_count'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='eventcontribution',
+            name='event',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='contributions', to='village.communityevent'),
+        ),
+    ]
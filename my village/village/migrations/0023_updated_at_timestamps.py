@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('village', '0022_event_contributions_related_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventcontribution',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='kinshipedge',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
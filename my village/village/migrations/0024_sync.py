@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('village', '0023_updated_at_timestamps'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='communityevent',
+            index=models.Index(fields=['updated_at', 'id'], name='event_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='eventcontribution',
+            index=models.Index(fields=['updated_at', 'id'], name='contribution_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='relationship',
+            index=models.Index(fields=['updated_at', 'id'], name='relationship_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['updated_at', 'id'], name='profile_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='village',
+            index=models.Index(fields=['updated_at', 'id'], name='village_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='villageservice',
+            index=models.Index(fields=['updated_at', 'id'], name='service_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['deleted_at', 'id'], name='tombstone_deleted_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('village', '0024_sync'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('label', models.CharField(max_length=100)),
+                ('started_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['started_at'], name='sync_hold_started_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('village', '0025_sync_holds'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelationshipGraphChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField()),
+                ('source_id', models.PositiveBigIntegerField()),
+                ('target_id', models.PositiveBigIntegerField()),
+                ('relationship_type', models.CharField(max_length=20, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['version', 'id'], name='graph_change_version_idx')],
+            },
+        ),
+    ]
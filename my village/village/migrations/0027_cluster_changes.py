@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('village', '0026_relationship_graph_changes'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='userprofile',
+            old_name='cluster_dirty',
+            new_name='cluster_changes',
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='cluster_changes',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+        ),
+    ]
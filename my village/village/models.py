@@ -1,8 +1,75 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
+from .phonetics import phonetic_key
+
+class LocationHierarchyModel(models.Model):
+    """
+    Shared behaviour for the District > Block > PoliceStation > PostOffice >
+    Panchayat > Village hierarchy.
+
+    Every level below District carries denormalized, indexed foreign keys to
+    all of its ancestors (``district_id``, ``block_id``, ...), so filtering by
+    any level is a single indexed lookup instead of a chain of joins. The
+    columns are copied from the parent on save and pushed down to the subtree
+    when a node is moved.
+    """
+    hierarchy_level = None
+    parent_field = None
+    ancestor_fields = ()
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Reading a deferred column here would recurse into from_db again.
+        deferred = instance.get_deferred_fields()
+        if not any(f'{field}_id' in deferred for field in cls.ancestor_fields):
+            instance._loaded_ancestors = instance.get_ancestor_ids()
+        return instance
+
+    def get_ancestor_ids(self):
+        """Return the current ``{field: id}`` mapping of ancestor columns."""
+        return {field: getattr(self, f'{field}_id', None) for field in self.ancestor_fields}
+
+    def sync_ancestors(self):
+        """Copy the denormalized ancestor columns from the parent."""
+        if not self.parent_field:
+            return
+        parent = getattr(self, self.parent_field)
+        for field in self.ancestor_fields:
+            if field != self.parent_field:
+                setattr(self, f'{field}_id', getattr(parent, f'{field}_id'))
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            if not {self.parent_field, f'{self.parent_field}_id'} & set(update_fields):
+                # The parent is not saved, so neither are the ancestor columns.
+                super().save(*args, **kwargs)
+                return
+            kwargs['update_fields'] = {*update_fields, *self.ancestor_fields}
+        self.sync_ancestors()
+        super().save(*args, **kwargs)
+
+        loaded = getattr(self, '_loaded_ancestors', None)
+        current = self.get_ancestor_ids()
+        if loaded is not None and loaded != current:
+            self.propagate_ancestors()
+        self._loaded_ancestors = current
+
+    def propagate_ancestors(self):
+        """Rewrite the ancestor columns of every node below this one."""
+        values = {f'{field}_id': getattr(self, f'{field}_id') for field in self.ancestor_fields}
+        values['updated_at'] = timezone.now()
+        for model in get_descendant_models(type(self)):
+            model.objects.filter(**{f'{self.hierarchy_level}_id': self.pk}).update(**values)
+
+class District(LocationHierarchyModel):
+    hierarchy_level = 'district'
 
-class District(models.Model):
     name = models.CharField(max_length=100)
     state = models.CharField(max_length=100, default='Bihar')
     created_at = models.DateTimeField(auto_now_add=True)
@@ -11,7 +78,11 @@ class District(models.Model):
     def __str__(self):
         return self.name
 
-class Block(models.Model):
+class Block(LocationHierarchyModel):
+    hierarchy_level = 'block'
+    parent_field = 'district'
+    ancestor_fields = ('district',)
+
     name = models.CharField(max_length=100)
     district = models.ForeignKey(District, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -20,58 +91,152 @@ class Block(models.Model):
     def __str__(self):
         return f"{self.name}, {self.district.name}"
 
-class PoliceStation(models.Model):
+class PoliceStation(LocationHierarchyModel):
+    hierarchy_level = 'police_station'
+    parent_field = 'block'
+    ancestor_fields = ('district', 'block')
+
     name = models.CharField(max_length=100)
     block = models.ForeignKey(Block, on_delete=models.CASCADE)
+    district = models.ForeignKey(District, on_delete=models.CASCADE, null=True, blank=True, editable=False, related_name='+')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
 
-class PostOffice(models.Model):
+class PostOffice(LocationHierarchyModel):
+    hierarchy_level = 'post_office'
+    parent_field = 'police_station'
+    ancestor_fields = ('district', 'block', 'police_station')
+
     name = models.CharField(max_length=100)
     police_station = models.ForeignKey(PoliceStation, on_delete=models.CASCADE)
+    district = models.ForeignKey(District, on_delete=models.CASCADE, null=True, blank=True, editable=False, related_name='+')
+    block = models.ForeignKey(Block, on_delete=models.CASCADE, null=True, blank=True, editable=False, related_name='+')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
 
-class Panchayat(models.Model):
+class Panchayat(LocationHierarchyModel):
+    hierarchy_level = 'panchayat'
+    parent_field = 'post_office'
+    ancestor_fields = ('district', 'block', 'police_station', 'post_office')
+
     name = models.CharField(max_length=100)
     post_office = models.ForeignKey(PostOffice, on_delete=models.CASCADE)
+    district = models.ForeignKey(District, on_delete=models.CASCADE, null=True, blank=True, editable=False, related_name='+')
+    block = models.ForeignKey(Block, on_delete=models.CASCADE, null=True, blank=True, editable=False, related_name='+')
+    police_station = models.ForeignKey(PoliceStation, on_delete=models.CASCADE, null=True, blank=True, editable=False, related_name='+')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
 
-class Village(models.Model):
+class Village(LocationHierarchyModel):
+    hierarchy_level = 'village'
+    parent_field = 'panchayat'
+    ancestor_fields = ('district', 'block', 'police_station', 'post_office', 'panchayat')
+
     name = models.CharField(max_length=100)
+    name_phonetic = models.CharField(max_length=100, blank=True, db_index=True, editable=False)
     code = models.CharField(max_length=10, blank=True, null=True)
     panchayat = models.ForeignKey(Panchayat, on_delete=models.CASCADE)
+    district = models.ForeignKey(District, on_delete=models.CASCADE, null=True, blank=True, editable=False, related_name='+')
+    block = models.ForeignKey(Block, on_delete=models.CASCADE, null=True, blank=True, editable=False, related_name='+')
+    police_station = models.ForeignKey(PoliceStation, on_delete=models.CASCADE, null=True, blank=True, editable=False, related_name='+')
+    post_office = models.ForeignKey(PostOffice, on_delete=models.CASCADE, null=True, blank=True, editable=False, related_name='+')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination on (name, id), overall and within the common filters.
+            models.Index(fields=['name', 'id'], name='village_name_id_idx'),
+            models.Index(fields=['district', 'name', 'id'], name='village_district_name_idx'),
+            models.Index(fields=['block', 'name', 'id'], name='village_block_name_idx'),
+            models.Index(fields=['panchayat', 'name', 'id'], name='village_panchayat_name_idx'),
+            # Delta sync scans changes in (updated_at, id) order.
+            models.Index(fields=['updated_at', 'id'], name='village_updated_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.name_phonetic = phonetic_key(self.name)[:100]
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'name' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'name_phonetic'}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.name
 
-    @property
-    def post_office(self):
-        return self.panchayat.post_office
+# Ordered from the top of the hierarchy to the bottom.
+LOCATION_MODELS = [District, Block, PoliceStation, PostOffice, Panchayat, Village]
+LOCATION_LEVELS = {model.hierarchy_level: model for model in LOCATION_MODELS}
+
+def get_descendant_models(model):
+    """Return the hierarchy models that sit below ``model``."""
+    return LOCATION_MODELS[LOCATION_MODELS.index(model) + 1:]
 
-    @property
-    def police_station(self):
-        return self.panchayat.post_office.police_station
+class LocationClosure(models.Model):
+    """
+    Closure table over the location hierarchy.
 
-    @property
-    def block(self):
-        return self.panchayat.post_office.police_station.block
+    Holds one row for every (ancestor, descendant) pair, including each node
+    paired with itself at depth 0, so any subtree can be selected with a
+    single indexed query regardless of how many levels it spans.
+    """
+    LEVEL_CHOICES = [(level, level.replace('_', ' ').title()) for level in LOCATION_LEVELS]
 
-    @property
-    def district(self):
-        return self.panchayat.post_office.police_station.block.district
+    ancestor_level = models.CharField(max_length=20, choices=LEVEL_CHOICES)
+    ancestor_id = models.PositiveBigIntegerField()
+    descendant_level = models.CharField(max_length=20, choices=LEVEL_CHOICES)
+    descendant_id = models.PositiveBigIntegerField()
+    depth = models.PositiveSmallIntegerField()
+
+    class Meta:
+        unique_together = ('ancestor_level', 'ancestor_id', 'descendant_level', 'descendant_id')
+        indexes = [
+            models.Index(fields=['descendant_level', 'descendant_id'], name='village_closure_desc_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestor_level}:{self.ancestor_id} > {self.descendant_level}:{self.descendant_id} ({self.depth})"
+
+class CacheVersion(models.Model):
+    """
+    A named counter that is bumped whenever the data behind a per-process
+    cache changes, so every worker can tell when to rebuild its copy.
+    """
+    key = models.CharField(max_length=50, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.key} v{self.version}"
+
+class RelationshipGraphChange(models.Model):
+    """
+    One edge change of the relationship graph, tagged with the
+    ``relationship_graph`` version it was made in, so other processes can
+    bring their in-memory index up to date without reloading it.
+    """
+    version = models.PositiveBigIntegerField()
+    source_id = models.PositiveBigIntegerField()
+    target_id = models.PositiveBigIntegerField()
+    # None: the relationship no longer exists (or is not accepted).
+    relationship_type = models.CharField(max_length=20, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['version', 'id'], name='graph_change_version_idx'),
+        ]
+
+    def __str__(self):
+        return f"v{self.version}: {self.source_id} -> {self.target_id} ({self.relationship_type})"
 
 class UserProfile(models.Model):
     GENDER_CHOICES = [
@@ -100,6 +265,31 @@ class UserProfile(models.Model):
     mother_name = models.CharField(max_length=100, blank=True)
     nickname = models.CharField(max_length=50, blank=True)
     profile_picture = models.ImageField(upload_to='profile_pictures/', null=True, blank=True)
+    # Phonetic key of the user's first and last name and nickname (see village.phonetics).
+    name_phonetic = models.CharField(max_length=255, blank=True, db_index=True, editable=False)
+    # Social cluster from community detection (see CommunitiesDB): the id of
+    # one of its members. cluster_changes counts the changes to the profile's
+    # relationships since the last run.
+    cluster_id = models.PositiveIntegerField(null=True, blank=True, db_index=True, editable=False)
+    cluster_changes = models.PositiveIntegerField(default=0, db_index=True, editable=False)
+    # Pending relationship requests received, kept up to date by signals (see
+    # RelationshipsDB.adjust_pending_count) for the navbar badge.
+    pending_received_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='profile_updated_idx'),
+        ]
+
+    def get_name_phonetic(self):
+        return phonetic_key(' '.join([self.user.first_name, self.user.last_name, self.nickname]))[:255]
+
+    def save(self, *args, **kwargs):
+        self.name_phonetic = self.get_name_phonetic()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'nickname' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'name_phonetic'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.user.username}'s Profile"
@@ -170,6 +360,9 @@ class Relationship(models.Model):
 
     class Meta:
         unique_together = ('user', 'related_user')
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='relationship_updated_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.user.username} - {self.related_user.user.username} ({self.get_relationship_type_display()})"
@@ -199,10 +392,89 @@ class RelationshipRequest(models.Model):
     
     class Meta:
         unique_together = ('from_user', 'to_user')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets the save signal tell whether a request stopped being pending.
+        if 'status' not in instance.get_deferred_fields():
+            instance._loaded_status = instance.status
+        return instance
     
     def __str__(self):
         return f"Request from {self.from_user.user.username} to {self.to_user.user.username}"
 
+class KinshipEdge(models.Model):
+    """
+    A typed family link: ``person`` is the ``kind`` of ``relative`` (kind
+    'parent' means ``person`` is ``relative``'s parent). ``KinshipDB`` keeps
+    every link in both directions, with the inverse kind.
+    """
+    KINDS = [
+        ('parent', 'Parent'),
+        ('child', 'Child'),
+        ('spouse', 'Spouse'),
+        ('sibling', 'Sibling'),
+    ]
+    INVERSE_KINDS = {'parent': 'child', 'child': 'parent', 'spouse': 'spouse', 'sibling': 'sibling'}
+
+    person = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='kinship_edges')
+    relative = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='+')
+    kind = models.CharField(max_length=10, choices=KINDS)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('person', 'relative')
+        indexes = [
+            models.Index(fields=['relative', 'kind'], name='kinship_relative_kind_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.person_id} is {self.get_kind_display().lower()} of {self.relative_id}"
+
+class Lineage(models.Model):
+    """
+    Materialized ancestor/descendant pairs: the transitive closure of the
+    'parent' kinship links, maintained by ``KinshipDB``. ``depth`` is the
+    number of generations between the two (1 = parent), the shortest if
+    there are several lines of descent.
+    """
+    ancestor = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveSmallIntegerField()
+
+    class Meta:
+        unique_together = ('descendant', 'ancestor')
+        indexes = [
+            models.Index(fields=['ancestor', 'depth'], name='lineage_ancestor_depth_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestor_id} -> {self.descendant_id} ({self.depth})"
+
+class ProfileRecommendation(models.Model):
+    """
+    A precomputed "people you may know" suggestion, written in batch by
+    ``RecommendationsDB.compute``. ``rank`` orders a profile's suggestions
+    (1 = best) so a page of them is a single index range scan.
+    """
+    profile = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='recommendations')
+    candidate = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveIntegerField()
+    score = models.FloatField()
+    mutual_count = models.PositiveIntegerField(default=0)
+    same_village = models.BooleanField(default=False)
+    same_panchayat = models.BooleanField(default=False)
+    same_profession = models.BooleanField(default=False)
+    computed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('profile', 'rank')
+
+    def __str__(self):
+        return f"{self.profile_id} -> {self.candidate_id} ({self.score:.2f})"
+
 class CommunityEvent(models.Model):
     EVENT_TYPES = [
         ('festival', 'Festival'),
@@ -240,16 +512,25 @@ class CommunityEvent(models.Model):
 
     class Meta:
         ordering = ['-start_date']
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='event_updated_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
 class EventContribution(models.Model):
-    event = models.ForeignKey(CommunityEvent, on_delete=models.CASCADE)
+    event = models.ForeignKey(CommunityEvent, on_delete=models.CASCADE, related_name='contributions')
     contributor = models.ForeignKey(UserProfile, on_delete=models.CASCADE)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='contribution_updated_idx'),
+        ]
 
     def __str__(self):
         return f"{self.contributor.user.username} - {self.event.title}"
@@ -271,5 +552,44 @@ class VillageService(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='service_updated_idx'),
+        ]
+
     def __str__(self):
         return f"{self.name} - {self.get_service_type_display()}"
+
+class Tombstone(models.Model):
+    """
+    Records that a synced object was deleted, so offline clients catching up
+    through the sync endpoint (see ``SyncDB``) can drop their copy.
+    """
+    model = models.CharField(max_length=100)  # app_label.model_name
+    object_id = models.PositiveBigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted_at', 'id'], name='tombstone_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model} #{self.object_id} deleted"
+
+class SyncHold(models.Model):
+    """
+    Marks a long write to synced tables as in progress. Rows it stamps are
+    only committed when it ends, so ``SyncDB`` does not hand out tokens past
+    its start until then (see ``SyncDB.hold``).
+    """
+    label = models.CharField(max_length=100)
+    started_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['started_at'], name='sync_hold_started_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.label} since {self.started_at}"
@@ -0,0 +1,182 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are selected with a condition on the rows after the last one shown
+(``name > last name OR (name = last name AND id > last id)``) on an indexed
+ordering instead of ``OFFSET``, so fetching any page costs the same regardless
+of how deep into the list it is or how large the table grows.
+"""
+
+import base64
+import json
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+
+class KeysetPage:
+    """One page of results plus the cursors of its neighbours."""
+
+    def __init__(self, items, next_cursor=None, previous_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(values, reverse=False):
+    """Encode the ordering values of a row (and the direction) as a URL-safe token."""
+    payload = json.dumps({'v': list(values), 'r': reverse}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_token(token):
+    """Decode the JSON object in a token; raises ValueError if it is malformed."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError('Invalid cursor') from e
+    if not isinstance(payload, dict):
+        raise ValueError('Invalid cursor')
+    return payload
+
+
+def decode_cursor(token):
+    """Decode a cursor token; raises ValueError if it is malformed."""
+    payload = decode_token(token)
+    values = payload.get('v')
+    # The values end up in ORM lookups: only accept a list of plain scalars.
+    if not isinstance(values, list) or not all(isinstance(value, (str, int, float)) for value in values):
+        raise ValueError('Invalid cursor')
+    return values, bool(payload.get('r'))
+
+
+def parse_page_size(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """Parse a requested page size, falling back to the default and capping it."""
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, maximum))
+
+
+def keyset_after(fields, values, reverse=False):
+    """
+    Select the rows after ``values`` in ``fields`` order, spelled out as
+    ``f1 > v1 OR (f1 = v1 AND f2 > v2) OR ...`` (``<`` when ``reverse``)
+    rather than as a row-value comparison, which not every backend supports.
+    """
+    lookup = 'lt' if reverse else 'gt'
+    condition = Q()
+    for index, field in enumerate(fields):
+        clause = Q(**{f'{field}__{lookup}': values[index]})
+        for previous, value in zip(fields[:index], values[:index]):
+            clause &= Q(**{previous: value})
+        condition |= clause
+    return condition
+
+
+def paginate_keyset(queryset, cursor=None, page_size=DEFAULT_PAGE_SIZE, fields=('name', 'id')):
+    """
+    Return one page of ``queryset`` ordered by ``fields``.
+
+    Args:
+        queryset: The (already filtered) queryset to page through.
+        cursor: A token from a previous page, or None for the first page.
+        page_size: The number of rows per page.
+        fields: The ordering; the last field must be unique.
+
+    Returns:
+        A KeysetPage. Raises ValueError for an invalid cursor.
+    """
+    fields = list(fields)
+    reverse = False
+    if cursor:
+        values, reverse = decode_cursor(cursor)
+        if len(values) != len(fields):
+            raise ValueError('Invalid cursor')
+        queryset = queryset.filter(keyset_after(fields, values, reverse))
+
+    ordering = [f'-{field}' if reverse else field for field in fields]
+    rows = list(queryset.order_by(*ordering)[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if reverse:
+        rows.reverse()
+
+    def key(row):
+        return [getattr(row, field) for field in fields]
+
+    next_cursor = previous_cursor = None
+    if rows:
+        if has_more or reverse:
+            next_cursor = encode_cursor(key(rows[-1]))
+        if (has_more and reverse) or (cursor and not reverse):
+            previous_cursor = encode_cursor(key(rows[0]), reverse=True)
+    return KeysetPage(rows, next_cursor, previous_cursor)
+
+
+class KeysetCursorPagination(BasePagination):
+    """
+    DRF pagination class built on ``paginate_keyset``.
+
+    Accepts ``?cursor=`` and ``?page_size=`` (capped at ``max_page_size``).
+    """
+    ordering = ('name', 'id')
+    page_size = DEFAULT_PAGE_SIZE
+    max_page_size = MAX_PAGE_SIZE
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = parse_page_size(
+            request.query_params.get(self.page_size_query_param),
+            default=self.page_size,
+            maximum=self.max_page_size
+        )
+        try:
+            self.page = paginate_keyset(
+                queryset,
+                cursor=request.query_params.get(self.cursor_query_param),
+                page_size=page_size,
+                fields=self.ordering
+            )
+        except ValueError:
+            raise NotFound('Invalid cursor.')
+        return self.page.items
+
+    def _link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self._link(self.page.next_cursor),
+            'previous': self._link(self.page.previous_cursor),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
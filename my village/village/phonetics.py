@@ -0,0 +1,117 @@
+"""
+Phonetic keys for Indian names.
+
+Names are typed in Devanagari or in one of several Roman spellings ("Purba",
+"Purbi", "Purva", "पूर्वी"). ``phonetic_key`` reduces every spelling to the same
+short key so that one indexed lookup finds all of them:
+
+* Devanagari is transliterated to Latin first;
+* vowels are dropped except at the start of a word, so 'ee'/'i' and 'aa'/'a'
+  spellings agree;
+* aspiration is ignored ('bh' = 'b', 'chh' = 'ch', 'th' = 't');
+* letters that Indian spellings use interchangeably share a code
+  ('v'/'w'/'b', 'f'/'p', 'z'/'j', 'q'/'k', 'x' = 'ks');
+* 'm'/'n' before a consonant (anusvara) become 'n', and repeated codes are
+  collapsed ('Chhappra' = 'Chapra').
+
+Every word gets its own key, so a name's key is a space-separated sequence.
+"""
+
+import re
+import unicodedata
+
+_VIRAMA = '्'
+_NUKTA = '़'
+
+_CONSONANTS = dict(zip(
+    'कखगघङचछजझञटठडढणतथदधनपफबभमयरलवशषसह',
+    ['k', 'kh', 'g', 'gh', 'n', 'ch', 'chh', 'j', 'jh', 'n',
+     't', 'th', 'd', 'dh', 'n', 't', 'th', 'd', 'dh', 'n',
+     'p', 'ph', 'b', 'bh', 'm', 'y', 'r', 'l', 'v', 'sh', 'sh', 's', 'h'],
+))
+# Consonants written with a nukta, either precomposed or as base + U+093C.
+_NUKTA_CONSONANTS = {
+    'क': 'q', 'ख': 'kh', 'ग': 'g', 'ज': 'z', 'ड': 'r', 'ढ': 'rh', 'फ': 'f', 'य': 'y',
+    '\u0958': 'q', '\u0959': 'kh', '\u095a': 'g', '\u095b': 'z', '\u095c': 'r', '\u095d': 'rh', '\u095e': 'f', '\u095f': 'y',
+}
+_VOWELS = dict(zip('अआइईउऊऋएऐओऔ', ['a', 'aa', 'i', 'ii', 'u', 'uu', 'ri', 'e', 'ai', 'o', 'au']))
+_VOWEL_SIGNS = dict(zip('ािीुूृेैोौ', ['aa', 'i', 'ii', 'u', 'uu', 'ri', 'e', 'ai', 'o', 'au']))
+_SIGNS = {'ँ': 'n', 'ं': 'n', 'ः': 'h'}
+
+# Letter -> phonetic code; letters missing here (vowels, 'h', 'y') only count
+# at the start of a word.
+_CODES = {
+    'b': 'b', 'v': 'b', 'w': 'b',
+    'p': 'p', 'f': 'p',
+    'k': 'k', 'q': 'k', 'c': 'c', 'g': 'g',
+    'j': 'j', 'z': 'j',
+    't': 't', 'd': 'd',
+    'n': 'n', 'm': 'm',
+    's': 's', 'r': 'r', 'l': 'l',
+}
+_VOWEL_LETTERS = set('aeiou')
+
+_non_letters = re.compile(r'[^a-z ]+')
+_aspirated = re.compile(r'([bcdgjkprst])h')
+_word = re.compile(r'\S+')
+
+def transliterate(text: str) -> str:
+    """
+    Transliterate Devanagari to plain Latin letters; other text is returned
+    unchanged.
+    """
+    output = []
+    characters = list(text or '')
+    for position, character in enumerate(characters):
+        following = characters[position + 1] if position + 1 < len(characters) else ''
+        if character in _NUKTA_CONSONANTS and (following == _NUKTA or character not in _CONSONANTS):
+            output.append(_NUKTA_CONSONANTS[character])
+            following = characters[position + 2] if following == _NUKTA and position + 2 < len(characters) else following
+        elif character in _CONSONANTS:
+            output.append(_CONSONANTS[character])
+        elif character in _VOWELS:
+            output.append(_VOWELS[character])
+            continue
+        elif character in _VOWEL_SIGNS:
+            output.append(_VOWEL_SIGNS[character])
+            continue
+        elif character in _SIGNS:
+            output.append(_SIGNS[character])
+            continue
+        elif character in (_VIRAMA, _NUKTA):
+            continue
+        else:
+            output.append(character)
+            continue
+        # A consonant carries an inherent 'a' unless a vowel sign or virama follows.
+        if following not in _VOWEL_SIGNS and following not in (_VIRAMA, _NUKTA):
+            output.append('a')
+    return ''.join(output)
+
+def _word_key(word: str) -> str:
+    word = _aspirated.sub(r'\1', word.replace('x', 'ks'))
+    codes = []
+    for position, letter in enumerate(word):
+        code = _CODES.get(letter)
+        if code is None:
+            if position == 0 and letter in _VOWEL_LETTERS:
+                codes.append('a')
+            elif position == 0 and letter in 'hy':
+                codes.append(letter)
+            continue
+        if code == 'm' and position + 1 < len(word) and _CODES.get(word[position + 1]) not in (None, 'm', 'n'):
+            code = 'n'
+        if not codes or codes[-1] != code:
+            codes.append(code)
+    return ''.join(codes)
+
+def phonetic_key(text: str) -> str:
+    """
+    Return the phonetic key of a name, one code word per name word.
+
+    >>> phonetic_key('Purba Champaran') == phonetic_key('पूर्वी चंपारण')
+    True
+    """
+    text = unicodedata.normalize('NFKD', transliterate(text).lower())
+    text = _non_letters.sub(' ', text.encode('ascii', 'ignore').decode())
+    return ' '.join(filter(None, (_word_key(word) for word in _word.findall(text))))
@@ -0,0 +1,242 @@
+"""
+Query planning for nested serializers.
+
+Walks a serializer's fields and works out which relations it will read, so
+the queryset can load them up front: forward foreign keys and one-to-one
+links with ``select_related`` (one JOIN), many-valued relations with
+``prefetch_related`` (one extra query each). Listing any number of objects
+then costs the same number of queries instead of a few per row. For reads,
+the columns the serializer does not output are left out with ``only()``.
+
+The same plan tells which ``updated_at`` columns a response depends on, for
+validating cached copies of it (see ``village.conditional``).
+"""
+
+import threading
+from django.db.models import Count, Max, Prefetch
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+
+class _Plan:
+    """What a serializer reads: relations to join or prefetch, and columns."""
+
+    def __init__(self):
+        self.select = []
+        self.prefetch = []
+        self.columns = []
+        # Lookup paths of the updated_at columns of every object rendered,
+        # and of the many-valued relations whose size shows in the output.
+        self.timestamps = []
+        self.collections = []
+        # False once a field reads something other than known columns (a
+        # method, property or the whole object), as only() is not safe then.
+        self.columns_known = True
+
+
+# Plans are cached per serializer class and requested field set; the cache is
+# emptied when it fills up, as clients can ask for any number of field sets.
+PLAN_CACHE_SIZE = 1000
+_plans = {}
+_plans_lock = threading.Lock()
+
+
+def optimize_queryset(queryset, serializer, only=False):
+    """
+    Apply the ``select_related``/``prefetch_related`` calls that serializing
+    ``queryset`` with ``serializer`` needs.
+
+    Args:
+        queryset: The queryset of ``serializer.Meta.model`` objects.
+        serializer: The serializer class the objects will be rendered with,
+            or an instance of it (whose fields may have been trimmed, see
+            ``SparseFieldsMixin``).
+        only: Also load only the columns the serializer outputs. Leave off
+            for objects that will be saved.
+
+    Returns:
+        The queryset with the related objects loaded.
+    """
+    return _apply(queryset, _get_plan(serializer), only)
+
+
+def change_aggregates(serializer):
+    """
+    Aggregates over a queryset whose values change whenever the output of
+    ``serializer`` for it does: the number of objects, of related objects in
+    nested lists, and the latest ``updated_at`` of everything rendered.
+
+    Args:
+        serializer: The serializer class or instance, as for
+            ``optimize_queryset``.
+
+    Returns:
+        A dictionary of aggregate expressions for ``QuerySet.aggregate()``.
+    """
+    plan = _get_plan(serializer)
+    aggregates = {'count': Count('pk', distinct=True)}
+    for position, path in enumerate(plan.collections):
+        aggregates[f'count_{position}'] = Count(path, distinct=True)
+    for position, path in enumerate(plan.timestamps):
+        aggregates[f'updated_{position}'] = Max(path)
+    return aggregates
+
+
+class OptimizedQuerysetMixin:
+    """ViewSet mixin that plans the queryset for the view's serializer."""
+
+    def get_queryset(self):
+        return optimize_queryset(
+            super().get_queryset(), self.get_serializer(), only=self.request.method in SAFE_METHODS
+        )
+
+    def serialize_list(self, serializer_class, queryset):
+        """Render the objects of a custom list action, planned like the view's own."""
+        context = self.get_serializer_context()
+        queryset = optimize_queryset(queryset, serializer_class(context=context), only=True)
+        return serializer_class(queryset, many=True, context=context).data
+
+
+def _apply(queryset, plan, only, extra_columns=()):
+    if plan.select:
+        queryset = queryset.select_related(*plan.select)
+    for path, model, child, remote_field in plan.prefetch:
+        if child is not None:
+            related = _apply(model._default_manager.all(), _get_plan(child), only, [remote_field] if remote_field else [])
+        elif only and remote_field:
+            related = model._default_manager.only(remote_field)
+        else:
+            queryset = queryset.prefetch_related(path)
+            continue
+        queryset = queryset.prefetch_related(Prefetch(path, queryset=related))
+    if only and plan.columns_known:
+        queryset = queryset.only(*plan.columns, *extra_columns)
+    return queryset
+
+
+def _get_plan(serializer):
+    if isinstance(serializer, type):
+        serializer_class, serializer = serializer, serializer()
+    else:
+        serializer_class = type(serializer)
+    key = (serializer_class, getattr(serializer, 'sparse_key', None))
+    plan = _plans.get(key)
+    if plan is None:
+        plan = _Plan()
+        _walk(serializer, serializer_class.Meta.model, '', plan)
+        _add_timestamp(plan, serializer_class.Meta.model, '')
+        with _plans_lock:
+            if len(_plans) >= PLAN_CACHE_SIZE:
+                _plans.clear()
+            _plans[key] = plan
+    return plan
+
+
+def _walk(serializer, model, prefix, plan):
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        if field.source == '*':
+            plan.columns_known = False
+            continue
+
+        *through, last = field.source_attrs
+        if isinstance(field, serializers.RelatedField) and field.use_pk_only_optimization():
+            # Reads the ``<name>_id`` column of the object holding the link.
+            relation = _relation(model, through) if through else ('', model, None)
+            if relation is None:
+                plan.columns_known = False
+            else:
+                if relation[0]:
+                    _select(plan, prefix + relation[0])
+                plan.columns.append(prefix + '__'.join(filter(None, [relation[0], last])))
+            continue
+
+        relation = _relation(model, field.source_attrs)
+        if relation is None:
+            column = _column(model, field.source_attrs)
+            if column is None:
+                plan.columns_known = False
+            else:
+                plan.columns.append(prefix + column)
+            continue
+        path, related, model_field = relation
+        path = prefix + path
+        if isinstance(field, serializers.ListSerializer):
+            plan.prefetch.append((path, related, field.child, _remote_field(model_field)))
+            plan.collections.append(path)
+            child = _get_plan(field.child)
+            plan.collections.extend(f'{path}__{nested}' for nested in child.collections)
+            plan.timestamps.extend(f'{path}__{nested}' for nested in child.timestamps)
+        elif isinstance(field, serializers.ManyRelatedField):
+            plan.prefetch.append((path, related, None, _remote_field(model_field)))
+            plan.collections.append(path)
+            _add_timestamp(plan, related, path + '__')
+        elif isinstance(field, serializers.BaseSerializer):
+            _select(plan, path)
+            _add_timestamp(plan, related, path + '__')
+            _walk(field, related, path + '__', plan)
+        else:
+            # Other related fields may read any attribute of the object.
+            _select(plan, path)
+            plan.columns_known = False
+
+
+def _select(plan, path):
+    if path not in plan.select:
+        plan.select.append(path)
+        plan.columns.append(path)
+
+
+def _add_timestamp(plan, model, prefix):
+    if any(field.name == 'updated_at' for field in model._meta.concrete_fields):
+        plan.timestamps.append(prefix + 'updated_at')
+
+
+def _remote_field(model_field):
+    """The foreign key a reverse relation is followed through, if any."""
+    if model_field is not None and model_field.one_to_many and model_field.auto_created:
+        return model_field.field.name
+    return None
+
+
+def _fields_by_name(model):
+    return {
+        **{field.name: field for field in model._meta.get_fields() if not field.auto_created or field.concrete},
+        **{rel.get_accessor_name(): rel for rel in model._meta.related_objects},
+    }
+
+
+def _column(model, source_attrs):
+    """The lookup path of a plain column, or None if the source is not one."""
+    *through, last = source_attrs
+    if through:
+        relation = _relation(model, through)
+        if relation is None:
+            return None
+        column = _column(relation[1], [last])
+        return f'{relation[0]}__{column}' if column else None
+    model_field = _fields_by_name(model).get(last)
+    return last if model_field is not None and model_field.concrete else None
+
+
+def _relation(model, source_attrs):
+    """
+    Resolve a field's source to a relation.
+
+    Returns:
+        ``(lookup path, related model, model field)``, or None if the source
+        is not a relation (a plain column, property or method) or goes
+        through a many-valued relation before its end.
+    """
+    model_field = _fields_by_name(model).get(source_attrs[0])
+    if model_field is None or not model_field.is_relation:
+        return None
+    if len(source_attrs) == 1:
+        return source_attrs[0], model_field.related_model, model_field
+    if model_field.many_to_many or model_field.one_to_many:
+        return None
+    rest = _relation(model_field.related_model, source_attrs[1:])
+    if rest is None:
+        return None
+    return f'{source_attrs[0]}__{rest[0]}', rest[1], rest[2]
@@ -1,18 +1,205 @@
+from collections import defaultdict
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Village, UserProfile, Relationship, CommunityEvent, EventContribution, VillageService
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.utils import timezone
+from .db.search_backends import get_search_backend
+from .models import Village, UserProfile, Relationship, CommunityEvent, EventContribution, VillageService, KinshipEdge
 
-class UserSerializer(serializers.ModelSerializer):
+def parse_field_paths(value):
+    """Turn ``'id,village.name,village.code'`` into ``{'id': {}, 'village': {'name': {}, 'code': {}}}``."""
+    if value is None:
+        return None
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for part in filter(None, (part.strip() for part in path.split('.'))):
+            node = node.setdefault(part, {})
+    return tree
+
+class SparseFieldsMixin:
+    """
+    Lets API clients trim responses with query parameters.
+
+    ``?fields=id,title,village.name`` returns only the listed fields (dotted
+    names select fields of nested objects). ``?expand=village,created_by.user``
+    returns the listed relations as nested objects and every other relation
+    as its id (or list of ids). Without the parameters, responses are not
+    trimmed. Write-only fields are never dropped, and when data is being
+    written, writable fields are only left out of the response, not out of
+    the input.
+    """
+
+    _sparse_spec = None
+    _hidden_fields = ()
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None or expand is not None:
+            # Same syntax as the query parameters, for use from code.
+            self._sparse_spec = (parse_field_paths(fields), parse_field_paths(expand))
+
+    def get_sparse_spec(self):
+        """The ``(fields, expand)`` trees for this serializer (None: no limit)."""
+        if self._sparse_spec is not None:
+            return self._sparse_spec
+        parent = self.parent.parent if isinstance(self.parent, serializers.ListSerializer) else self.parent
+        request = self.context.get('request') if parent is None else None
+        if request is None:
+            return None, None
+        params = getattr(request, 'query_params', request.GET)
+        return parse_field_paths(params.get('fields')), parse_field_paths(params.get('expand'))
+
+    @property
+    def sparse_key(self):
+        """A hashable form of the trimming applied, for caching query plans."""
+        return repr(self.get_sparse_spec())
+
+    def get_fields(self):
+        fields = super().get_fields()
+        only, expand = self.get_sparse_spec()
+        if only is not None:
+            if hasattr(self.root, 'initial_data'):
+                self._hidden_fields = {
+                    name for name, field in fields.items()
+                    if name not in only and not field.read_only and not field.write_only
+                }
+            fields = {
+                name: field for name, field in fields.items()
+                if name in only or field.write_only or name in self._hidden_fields
+            }
+        for name, field in fields.items():
+            many = isinstance(field, serializers.ListSerializer)
+            nested = field.child if many else field
+            if field.write_only or not isinstance(nested, serializers.BaseSerializer):
+                continue
+            nested_only = (only or {}).get(name) or None
+            if expand is not None and name not in expand and nested_only is None:
+                fields[name] = serializers.PrimaryKeyRelatedField(read_only=True, many=many, source=field.source)
+            elif isinstance(nested, SparseFieldsMixin):
+                nested._sparse_spec = (nested_only, expand.get(name, {}) if expand is not None else None)
+        return fields
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        for name in self._hidden_fields:
+            data.pop(name, None)
+        return data
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Primary key field that takes its object from the lookups a
+    ``BulkListSerializer`` made for all items at once, and queries on its
+    own otherwise.
+    """
+
+    def to_internal_value(self, data):
+        queryset = self.get_queryset()
+        found = self.context.get('related_objects', {}).get(queryset.model)
+        if found is None or self.pk_field is not None or isinstance(data, bool):
+            return super().to_internal_value(data)
+        try:
+            return found[queryset.model._meta.pk.to_python(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, DjangoValidationError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+class BulkListSerializer(serializers.ListSerializer):
+    """
+    List serializer for writing many objects in one request.
+
+    The objects behind the ``BulkPrimaryKeyRelatedField`` fields of all
+    items are fetched with one query per related model before the items are
+    validated. Objects are written with ``bulk_create``/``bulk_update`` in one
+    transaction, and as that skips model signals the search index is
+    refreshed here.
+
+    To update, pass ``instance`` as a dictionary of the objects by id; each
+    item must carry the ``id`` of the object it changes.
+    """
+
+    BATCH_SIZE = 500
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            self.context['related_objects'] = self._fetch_related(data)
+        return super().to_internal_value(data)
+
+    def run_child_validation(self, data):
+        if isinstance(self.instance, dict):
+            self.child.instance = self.instance[data['id']]
+            self.child.initial_data = data
+        return super().run_child_validation(data)
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        with transaction.atomic():
+            objects = model._default_manager.bulk_create(
+                [model(**attrs) for attrs in validated_data], batch_size=self.BATCH_SIZE
+            )
+            _reindex(model, [obj.pk for obj in objects])
+        return objects
+
+    def update(self, instance, validated_data):
+        model = self.child.Meta.model
+        objects = []
+        changed = set()
+        for item, attrs in zip(self.initial_data, validated_data):
+            obj = instance[item['id']]
+            for attr, value in attrs.items():
+                setattr(obj, attr, value)
+            changed.update(attrs)
+            objects.append(obj)
+        if any(field.name == 'updated_at' for field in model._meta.concrete_fields):
+            # bulk_update does not apply auto_now.
+            now = timezone.now()
+            for obj in objects:
+                obj.updated_at = now
+            changed.add('updated_at')
+        with transaction.atomic():
+            if changed:
+                model._default_manager.bulk_update(objects, sorted(changed), batch_size=self.BATCH_SIZE)
+            _reindex(model, [obj.pk for obj in objects])
+        return objects
+
+    def _fetch_related(self, data):
+        querysets = {}
+        wanted = defaultdict(set)
+        for field in self.child.fields.values():
+            if not isinstance(field, BulkPrimaryKeyRelatedField) or field.read_only:
+                continue
+            queryset = field.get_queryset()
+            model = queryset.model
+            querysets.setdefault(model, queryset)
+            for item in data:
+                value = item.get(field.field_name) if isinstance(item, dict) else None
+                if value is None or isinstance(value, bool):
+                    continue
+                try:
+                    wanted[model].add(model._meta.pk.to_python(value))
+                except (TypeError, DjangoValidationError):
+                    # Reported when the item is validated.
+                    continue
+        return {model: querysets[model].in_bulk(wanted[model]) for model in querysets}
+
+def _reindex(model, pks):
+    backend = get_search_backend()
+    if backend is not None:
+        backend.index_many(model, pks)
+
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('id', 'username', 'email', 'first_name', 'last_name')
 
-class VillageSerializer(serializers.ModelSerializer):
+class VillageSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Village
         fields = '__all__'
 
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     village = VillageSerializer(read_only=True)
     village_id = serializers.PrimaryKeyRelatedField(
@@ -23,9 +210,10 @@ class UserProfileSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = UserProfile
-        fields = '__all__'
+        # Bookkeeping for community detection and the request badge.
+        exclude = ('cluster_changes', 'pending_received_count')
 
-class RelationshipSerializer(serializers.ModelSerializer):
+class RelationshipSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user = UserProfileSerializer(read_only=True)
     related_user = UserProfileSerializer(read_only=True)
     user_id = serializers.PrimaryKeyRelatedField(
@@ -43,9 +231,26 @@ class RelationshipSerializer(serializers.ModelSerializer):
         model = Relationship
         fields = '__all__'
 
-class EventContributionSerializer(serializers.ModelSerializer):
+class KinshipEdgeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    person_id = serializers.PrimaryKeyRelatedField(
+        queryset=UserProfile.objects.all(),
+        source='person'
+    )
+    relative_id = serializers.PrimaryKeyRelatedField(
+        queryset=UserProfile.objects.all(),
+        source='relative'
+    )
+
+    class Meta:
+        model = KinshipEdge
+        fields = ('id', 'person_id', 'relative_id', 'kind', 'created_at')
+        # Posting an existing pair changes its kind (KinshipDB.add_relative).
+        validators = []
+
+class EventContributionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    serializer_related_field = BulkPrimaryKeyRelatedField
     contributor = UserProfileSerializer(read_only=True)
-    contributor_id = serializers.PrimaryKeyRelatedField(
+    contributor_id = BulkPrimaryKeyRelatedField(
         queryset=UserProfile.objects.all(),
         source='contributor',
         write_only=True
@@ -54,17 +259,19 @@ class EventContributionSerializer(serializers.ModelSerializer):
     class Meta:
         model = EventContribution
         fields = '__all__'
+        list_serializer_class = BulkListSerializer
 
-class CommunityEventSerializer(serializers.ModelSerializer):
+class CommunityEventSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    serializer_related_field = BulkPrimaryKeyRelatedField
     village = VillageSerializer(read_only=True)
     created_by = UserProfileSerializer(read_only=True)
     contributions = EventContributionSerializer(many=True, read_only=True)
-    village_id = serializers.PrimaryKeyRelatedField(
+    village_id = BulkPrimaryKeyRelatedField(
         queryset=Village.objects.all(),
         source='village',
         write_only=True
     )
-    created_by_id = serializers.PrimaryKeyRelatedField(
+    created_by_id = BulkPrimaryKeyRelatedField(
         queryset=UserProfile.objects.all(),
         source='created_by',
         write_only=True
@@ -73,10 +280,12 @@ class CommunityEventSerializer(serializers.ModelSerializer):
     class Meta:
         model = CommunityEvent
         fields = '__all__'
+        list_serializer_class = BulkListSerializer
 
-class VillageServiceSerializer(serializers.ModelSerializer):
+class VillageServiceSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    serializer_related_field = BulkPrimaryKeyRelatedField
     village = VillageSerializer(read_only=True)
-    village_id = serializers.PrimaryKeyRelatedField(
+    village_id = BulkPrimaryKeyRelatedField(
         queryset=Village.objects.all(),
         source='village',
         write_only=True
@@ -84,4 +293,5 @@ class VillageServiceSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = VillageService
-        fields = '__all__' 
\ No newline at end of file
+        fields = '__all__'
+        list_serializer_class = BulkListSerializer 
\ No newline at end of file
@@ -0,0 +1,161 @@
+"""
+Signal handlers for the village app.
+
+Keeps derived data (such as the location closure table, the in-memory
+location tree and the full-text search index) in step with the models it is
+computed from.
+"""
+
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.utils import timezone
+from .db.communities import CommunitiesDB
+from .db.kinship import KinshipDB
+from .db.location_hierarchy import LocationHierarchyDB
+from .db.location_tree import invalidate_location_tree
+from .db.relationship_graph import record_relationship_changes
+from .db.relationships import RelationshipsDB
+from .db.search_backends import SEARCH_INDEXES, get_search_backend
+from .db.sync import SyncDB
+from .graph_images import invalidate_graph_image
+from .models import LOCATION_MODELS, Relationship, RelationshipRequest, UserProfile
+
+
+def location_saved(sender, instance, created, raw=False, **kwargs):
+    """Insert or re-link closure rows when a location is created or moved."""
+    if raw:
+        return
+    invalidate_location_tree()
+    if created:
+        LocationHierarchyDB.add_to_closure(instance)
+        return
+
+    loaded = getattr(instance, '_loaded_ancestors', None)
+    if loaded is not None and loaded != instance.get_ancestor_ids():
+        LocationHierarchyDB.move_in_closure(instance)
+
+
+def location_deleted(sender, instance, **kwargs):
+    """Drop the closure rows of a deleted location."""
+    invalidate_location_tree()
+    LocationHierarchyDB.remove_from_closure(instance)
+
+
+for model in LOCATION_MODELS:
+    post_save.connect(location_saved, sender=model, dispatch_uid=f'location_saved_{model.__name__}')
+    post_delete.connect(location_deleted, sender=model, dispatch_uid=f'location_deleted_{model.__name__}')
+
+
+def search_document_saved(sender, instance, **kwargs):
+    """Re-index an object whose searchable text may have changed."""
+    backend = get_search_backend()
+    if backend is not None:
+        backend.index(instance)
+
+
+def search_document_deleted(sender, instance, **kwargs):
+    """Drop a deleted object from the search index."""
+    backend = get_search_backend()
+    if backend is not None:
+        backend.remove(sender, instance.pk)
+
+
+def user_saved(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    Refresh the phonetic name key and search row of the user's profile, and
+    its updated_at, as the API renders the user inside the profile.
+    """
+    if raw or (update_fields is not None and set(update_fields) <= {'last_login'}):
+        return
+    profiles = list(UserProfile.objects.filter(user=instance).only('pk', 'nickname', 'name_phonetic'))
+    for profile in profiles:
+        profile.user = instance
+        UserProfile.objects.filter(pk=profile.pk).update(
+            name_phonetic=profile.get_name_phonetic(), updated_at=timezone.now()
+        )
+    backend = get_search_backend()
+    if backend is not None:
+        backend.index_many(UserProfile, [profile.pk for profile in profiles])
+
+
+for label in SEARCH_INDEXES:
+    model = apps.get_model(label)
+    post_save.connect(search_document_saved, sender=model, dispatch_uid=f'search_document_saved_{model.__name__}')
+    post_delete.connect(search_document_deleted, sender=model, dispatch_uid=f'search_document_deleted_{model.__name__}')
+
+post_save.connect(user_saved, sender=User, dispatch_uid='search_user_saved')
+
+
+def relationship_changed(sender, instance, **kwargs):
+    """Drop the cached graph images of both members of a relationship."""
+    invalidate_graph_image(instance.user_id)
+    invalidate_graph_image(instance.related_user_id)
+
+
+def relationship_saved(sender, instance, **kwargs):
+    """Keep the in-memory relationship graph index up to date."""
+    relationship_type = instance.relationship_type if instance.status == 'accepted' else None
+    record_relationship_changes([(instance.user_id, instance.related_user_id, relationship_type)])
+    CommunitiesDB.mark_dirty(instance.user_id, instance.related_user_id)
+
+
+def relationship_deleted(sender, instance, **kwargs):
+    record_relationship_changes([(instance.user_id, instance.related_user_id, None)])
+    CommunitiesDB.mark_dirty(instance.user_id, instance.related_user_id)
+
+
+post_save.connect(relationship_changed, sender=Relationship, dispatch_uid='relationship_graph_saved')
+post_delete.connect(relationship_changed, sender=Relationship, dispatch_uid='relationship_graph_deleted')
+post_save.connect(relationship_saved, sender=Relationship, dispatch_uid='relationship_index_saved')
+post_delete.connect(relationship_deleted, sender=Relationship, dispatch_uid='relationship_index_deleted')
+
+
+def relationship_request_saved(sender, instance, created, raw=False, **kwargs):
+    """Keep the recipient's pending request count up to date."""
+    if raw:
+        return
+    if created:
+        was_pending = False
+    elif hasattr(instance, '_loaded_status'):
+        was_pending = instance._loaded_status == 'pending'
+    else:
+        # Saved without being loaded first: count from scratch.
+        RelationshipsDB.refresh_pending_count(instance.to_user_id)
+        return
+    is_pending = instance.status == 'pending'
+    instance._loaded_status = instance.status
+    RelationshipsDB.adjust_pending_count(instance.to_user_id, is_pending - was_pending)
+
+
+def relationship_request_deleted(sender, instance, **kwargs):
+    if instance.status == 'pending':
+        RelationshipsDB.adjust_pending_count(instance.to_user_id, -1)
+
+
+post_save.connect(relationship_request_saved, sender=RelationshipRequest, dispatch_uid='pending_request_saved')
+post_delete.connect(relationship_request_deleted, sender=RelationshipRequest, dispatch_uid='pending_request_deleted')
+
+
+def profile_deleting(sender, instance, **kwargs):
+    """Remember whose lineage runs through a profile that is being deleted."""
+    instance._kinship_descendants = KinshipDB.with_descendants([instance.pk]) - {instance.pk}
+
+
+def profile_deleted(sender, instance, **kwargs):
+    descendants = getattr(instance, '_kinship_descendants', None)
+    if descendants:
+        KinshipDB.rebuild_lineage(descendants)
+
+
+pre_delete.connect(profile_deleting, sender=UserProfile, dispatch_uid='kinship_profile_deleting')
+post_delete.connect(profile_deleted, sender=UserProfile, dispatch_uid='kinship_profile_deleted')
+
+
+def synced_object_deleted(sender, instance, **kwargs):
+    """Leave a tombstone for offline clients to pick up on their next sync."""
+    SyncDB.record_deletion(instance)
+
+
+for model in SyncDB.MODELS.values():
+    post_delete.connect(synced_object_deleted, sender=model, dispatch_uid=f'sync_tombstone_{model.__name__}')
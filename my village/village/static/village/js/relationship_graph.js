@@ -0,0 +1,133 @@
+// Draws a member's relationship network from the profile graph API
+// (/api/profiles/<id>/graph/?depth=N) as an SVG, laid out in the browser.
+(function() {
+    const SVG_NS = 'http://www.w3.org/2000/svg';
+    const WIDTH = 1200;
+    const HEIGHT = 800;
+
+    // Fruchterman-Reingold force layout; positions are kept inside the view box.
+    function layout(nodes, edges) {
+        const index = new Map(nodes.map((node, i) => [node.id, i]));
+        const k = Math.sqrt((WIDTH * HEIGHT) / Math.max(nodes.length, 1)) * 0.6;
+        const iterations = nodes.length > 200 ? 150 : 300;
+
+        // Start on rings by depth so the layout converges quickly.
+        nodes.forEach((node, i) => {
+            const angle = (2 * Math.PI * i) / nodes.length;
+            const radius = node.depth * 180;
+            node.x = WIDTH / 2 + radius * Math.cos(angle);
+            node.y = HEIGHT / 2 + radius * Math.sin(angle);
+        });
+
+        let temperature = WIDTH / 10;
+        for (let step = 0; step < iterations; step++) {
+            const dx = new Float64Array(nodes.length);
+            const dy = new Float64Array(nodes.length);
+            for (let i = 0; i < nodes.length; i++) {
+                for (let j = i + 1; j < nodes.length; j++) {
+                    const x = nodes[i].x - nodes[j].x;
+                    const y = nodes[i].y - nodes[j].y;
+                    const distance = Math.max(Math.hypot(x, y), 0.01);
+                    const force = (k * k) / distance;
+                    dx[i] += (x / distance) * force;
+                    dy[i] += (y / distance) * force;
+                    dx[j] -= (x / distance) * force;
+                    dy[j] -= (y / distance) * force;
+                }
+            }
+            edges.forEach(edge => {
+                const a = index.get(edge.source);
+                const b = index.get(edge.target);
+                const x = nodes[a].x - nodes[b].x;
+                const y = nodes[a].y - nodes[b].y;
+                const distance = Math.max(Math.hypot(x, y), 0.01);
+                const force = (distance * distance) / k;
+                dx[a] -= (x / distance) * force;
+                dy[a] -= (y / distance) * force;
+                dx[b] += (x / distance) * force;
+                dy[b] += (y / distance) * force;
+            });
+            nodes.forEach((node, i) => {
+                if (node.depth === 0) {
+                    node.x = WIDTH / 2;
+                    node.y = HEIGHT / 2;
+                    return;
+                }
+                const length = Math.max(Math.hypot(dx[i], dy[i]), 0.01);
+                node.x = Math.min(WIDTH - 40, Math.max(40, node.x + (dx[i] / length) * Math.min(length, temperature)));
+                node.y = Math.min(HEIGHT - 40, Math.max(40, node.y + (dy[i] / length) * Math.min(length, temperature)));
+            });
+            temperature *= 0.98;
+        }
+    }
+
+    function element(name, attributes, parent) {
+        const el = document.createElementNS(SVG_NS, name);
+        Object.entries(attributes).forEach(([key, value]) => el.setAttribute(key, value));
+        parent.appendChild(el);
+        return el;
+    }
+
+    function render(svg, graph, memberUrl) {
+        svg.replaceChildren();
+        const byId = new Map(graph.nodes.map(node => [node.id, node]));
+        graph.edges.forEach(edge => {
+            const a = byId.get(edge.source);
+            const b = byId.get(edge.target);
+            const line = element('line', {
+                x1: a.x, y1: a.y, x2: b.x, y2: b.y,
+                stroke: edge.color, 'stroke-width': 2, 'stroke-opacity': 0.8
+            }, svg);
+            element('title', {}, line).textContent = edge.label;
+        });
+        graph.nodes.forEach(node => {
+            const link = element('a', {href: memberUrl.replace('/0/', '/' + node.id + '/')}, svg);
+            element('circle', {
+                cx: node.x, cy: node.y, r: node.depth === 0 ? 28 : 18,
+                fill: node.color, stroke: '#555', 'stroke-width': 1
+            }, link);
+            const label = element('text', {
+                x: node.x, y: node.y + (node.depth === 0 ? 44 : 32),
+                'text-anchor': 'middle', 'font-size': 14, fill: '#333'
+            }, link);
+            label.textContent = node.label;
+        });
+    }
+
+    function exportImage(button, imageUrl) {
+        button.disabled = true;
+        fetch(imageUrl, {credentials: 'same-origin'})
+            .then(response => response.json())
+            .then(data => {
+                if (data.pending) {
+                    setTimeout(() => exportImage(button, imageUrl), 2000);
+                    return;
+                }
+                button.disabled = false;
+                if (data.error) {
+                    alert(data.error);
+                    return;
+                }
+                window.open(data.url, '_blank');
+            });
+    }
+
+    window.drawRelationshipGraph = function(options) {
+        function load() {
+            options.placeholder.classList.remove('d-none');
+            fetch(options.graphUrl + '?depth=' + options.depthSelect.value, {credentials: 'same-origin'})
+                .then(response => response.json())
+                .then(graph => {
+                    layout(graph.nodes, graph.edges);
+                    render(options.svg, graph, options.memberUrl);
+                    options.placeholder.classList.add('d-none');
+                    options.svg.classList.remove('d-none');
+                    options.truncatedNote.classList.toggle('d-none', !graph.truncated);
+                });
+        }
+
+        options.depthSelect.addEventListener('change', load);
+        options.exportButton.addEventListener('click', () => exportImage(options.exportButton, options.imageUrl));
+        load();
+    };
+})();
@@ -1,3 +1,991 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import random
+import tempfile
+from collections import defaultdict, deque
+from datetime import timedelta
+from unittest import mock
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.db.models import Q
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from . import graph_images
+from .context_processors import pending_requests
+from .db import CommunitiesDB, KinshipDB, LocationHierarchyDB, RelationshipsDB, SyncDB, UserManagementDB
+from .db import relationship_graph
+from .db.location_import import iter_json_array
+from .db.location_search import LocationAutocompleteIndex
+from .db.location_tree import LocationTree
+from .db.relationship_graph import RelationshipGraphIndex
+from .models import (
+    Block, CommunityEvent, District, EventContribution, KinshipEdge, Lineage, Panchayat, PoliceStation, PostOffice,
+    Relationship, RelationshipGraphChange, RelationshipRequest, SyncHold, UserProfile, Village, VillageService,
+)
 
-# Create your tests here.
+
+class APITests(TestCase):
+    """Query counts, trimming, caching and sync of the REST API endpoints."""
+
+    ENDPOINTS = [
+        '/api/villages/',
+        '/api/profiles/',
+        '/api/relationships/',
+        '/api/kinship/',
+        '/api/events/',
+        '/api/contributions/',
+        '/api/services/',
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        district = District.objects.create(name='District')
+        block = Block.objects.create(name='Block', district=district)
+        police_station = PoliceStation.objects.create(name='Police Station', block=block)
+        post_office = PostOffice.objects.create(name='Post Office', police_station=police_station)
+        cls.panchayat = Panchayat.objects.create(name='Panchayat', post_office=post_office)
+        cls.user = User.objects.create_user('viewer', password='password')
+        UserProfile.objects.create(user=cls.user)
+        cls.added = 0
+
+    def add_rows(self, count):
+        """Add ``count`` villages, each with a member, event, contribution, service and links."""
+        now = timezone.now()
+        for _ in range(count):
+            self.added += 1
+            village = Village.objects.create(name=f'Village {self.added}', panchayat=self.panchayat)
+            user = User.objects.create_user(f'member{self.added}')
+            profile = UserProfile.objects.create(user=user, village=village)
+            event = CommunityEvent.objects.create(
+                title=f'Event {self.added}', description='', event_type='other', start_date=now,
+                end_date=now + timedelta(hours=1), village=village, created_by=profile,
+            )
+            EventContribution.objects.create(event=event, contributor=profile, amount=10)
+            EventContribution.objects.create(event=event, contributor=self.user.userprofile, amount=5)
+            VillageService.objects.create(
+                village=village, name=f'Service {self.added}', service_type='shop', description='', address='',
+            )
+            Relationship.objects.create(user=profile, related_user=self.user.userprofile, relationship_type='friend')
+            KinshipEdge.objects.create(person=profile, relative=self.user.userprofile, kind='sibling')
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return len(queries)
+
+    def test_list_query_count_is_constant(self):
+        self.client.force_login(self.user)
+        self.add_rows(2)
+        few = {url: self.count_queries(url) for url in self.ENDPOINTS}
+        self.add_rows(8)
+        for url in self.ENDPOINTS:
+            with self.subTest(url=url):
+                self.assertEqual(self.count_queries(url), few[url])
+
+    def test_nested_actions_query_count_is_constant(self):
+        self.client.force_login(self.user)
+        self.add_rows(1)
+        village = Village.objects.get()
+        member = UserProfile.objects.get(village=village)
+        urls = [
+            f'/api/villages/{village.pk}/events/',
+            f'/api/villages/{village.pk}/services/',
+            f'/api/profiles/{member.pk}/relationships/',
+        ]
+        few = {url: self.count_queries(url) for url in urls}
+        now = timezone.now()
+        for index in range(5):
+            CommunityEvent.objects.create(
+                title=f'Extra {index}', description='', event_type='other', start_date=now,
+                end_date=now, village=village, created_by=member,
+            )
+            VillageService.objects.create(
+                village=village, name=f'Extra {index}', service_type='other', description='', address='',
+            )
+            other = UserProfile.objects.create(user=User.objects.create_user(f'other{index}'), village=village)
+            Relationship.objects.create(user=member, related_user=other, relationship_type='other')
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.count_queries(url), few[url])
+
+    def test_sparse_fields_and_expand(self):
+        self.client.force_login(self.user)
+        self.add_rows(2)
+        url = '/api/events/?fields=id,title,village.name,created_by,contributions&expand='
+        event = self.client.get(url).json()[0]
+        self.assertEqual(set(event), {'id', 'title', 'village', 'created_by', 'contributions'})
+        self.assertEqual(set(event['village']), {'name'})
+        self.assertIsInstance(event['created_by'], int)
+        self.assertTrue(all(isinstance(pk, int) for pk in event['contributions']))
+        few = self.count_queries(url)
+        self.add_rows(8)
+        self.assertEqual(self.count_queries(url), few)
+
+    def test_sparse_fields_do_not_drop_writes(self):
+        self.client.force_login(self.user)
+        self.add_rows(1)
+        village = Village.objects.get()
+        response = self.client.patch(
+            f'/api/villages/{village.pk}/?fields=id', {'name': 'Renamed'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'id': village.pk})
+        village.refresh_from_db()
+        self.assertEqual(village.name, 'Renamed')
+
+        event = CommunityEvent.objects.get()
+        response = self.client.patch(
+            f'/api/events/{event.pk}/?fields=title', {'description': 'Changed'}, content_type='application/json'
+        )
+        self.assertEqual(response.json(), {'title': event.title})
+        event.refresh_from_db()
+        self.assertEqual(event.description, 'Changed')
+
+    def test_conditional_get(self):
+        self.client.force_login(self.user)
+        self.add_rows(2)
+        etag = self.client.get('/api/events/')['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/events/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(any('village_communityevent"."title' in query['sql'] for query in queries))
+
+        village = Village.objects.first()
+        village.name = 'Renamed'
+        village.save()
+        response = self.client.get('/api/events/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        etag = response['ETag']
+
+        EventContribution.objects.first().delete()
+        self.assertEqual(self.client.get('/api/events/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    @override_settings(SYNC_SETTLE_SECONDS=0)
+    def test_delta_sync(self):
+        self.client.force_login(self.user)
+        self.add_rows(3)
+        data = self.client.get('/api/sync?page_size=2').json()
+        self.assertTrue(data['has_more'])
+        while data['has_more']:
+            data = self.client.get(f"/api/sync?page_size=2&since={data['token']}").json()
+
+        village = Village.objects.first()
+        village.name = 'Renamed'
+        village.save()
+        service_id = VillageService.objects.values_list('pk', flat=True).first()
+        VillageService.objects.filter(pk=service_id).delete()
+        data = self.client.get(f"/api/sync?since={data['token']}").json()
+        self.assertEqual([row['id'] for row in data['changes']['villages']], [village.pk])
+        self.assertEqual(data['changes']['events'], [])
+        self.assertEqual(data['deleted']['services'], [service_id])
+
+    @override_settings(SYNC_SETTLE_SECONDS=0)
+    def test_sync_stops_at_writes_in_progress(self):
+        self.client.force_login(self.user)
+        self.add_rows(1)
+        token = self.client.get('/api/sync').json()['token']
+        with SyncDB.hold('test'):
+            village = Village.objects.create(name='Written late', panchayat=self.panchayat)
+            data = self.client.get(f'/api/sync?since={token}').json()
+            self.assertEqual(data['changes']['villages'], [])
+        data = self.client.get(f"/api/sync?since={data['token']}").json()
+        self.assertEqual([row['id'] for row in data['changes']['villages']], [village.pk])
+
+        # Holds left behind by a crashed process stop counting eventually.
+        SyncHold.objects.create(label='crashed', started_at=timezone.now() - timedelta(days=1))
+        Village.objects.filter(pk=village.pk).update(name='Renamed', updated_at=timezone.now())
+        data = self.client.get(f"/api/sync?since={data['token']}").json()
+        self.assertEqual([row['name'] for row in data['changes']['villages']], ['Renamed'])
+
+    def test_forged_cursors_are_rejected(self):
+        self.add_rows(2)
+        for payload in ['{"v":5,"r":false}', '{"v":[{"name__gt":"A"},1],"r":false}', '{"v":["A",[1]]}', '[]']:
+            cursor = base64.urlsafe_b64encode(payload.encode()).decode()
+            with self.subTest(payload=payload):
+                self.assertEqual(self.client.get(f'/api/villages/?cursor={cursor}').status_code, 404)
+                self.assertEqual(self.client.get(f'/villages/?cursor={cursor}').status_code, 200)
+
+    def test_forged_sync_tokens_are_rejected(self):
+        self.client.force_login(self.user)
+        for payload in ['{"v":5}', '{"v":[5]}', '{"v":[{"deleted":5}]}', '[1]', '"v"', 'not json']:
+            token = base64.urlsafe_b64encode(payload.encode()).decode()
+            with self.subTest(payload=payload):
+                self.assertEqual(self.client.get(f'/api/sync?since={token}').status_code, 400)
+
+    def test_bulk_create_and_update(self):
+        self.client.force_login(self.user)
+        self.add_rows(3)
+        villages = list(Village.objects.values_list('pk', flat=True))
+
+        def services(count):
+            return [
+                {'village_id': villages[index % len(villages)], 'name': f'Bulk {index}', 'service_type': 'shop',
+                 'description': 'Bulk service', 'address': 'Main road'}
+                for index in range(count)
+            ]
+
+        def post(items):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post('/api/services/bulk/', items, content_type='application/json')
+            self.assertEqual(response.status_code, 201, response.content)
+            return response.json(), len(queries)
+
+        created, few = post(services(2))
+        self.assertEqual([service['name'] for service in created], ['Bulk 0', 'Bulk 1'])
+        self.assertEqual(post(services(20))[1], few)
+
+        items = services(2)
+        items[1]['village_id'] = 0
+        response = self.client.post('/api/services/bulk/', items, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(VillageService.objects.filter(name__startswith='Bulk').count(), 22)
+
+        changes = [{'id': service['id'], 'name': f"Renamed {service['id']}"} for service in created]
+        response = self.client.patch('/api/services/bulk/', changes, content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual([service['name'] for service in response.json()], [change['name'] for change in changes])
+        self.assertEqual(
+            set(VillageService.objects.filter(pk__in=[service['id'] for service in created]).values_list('name', flat=True)),
+            {change['name'] for change in changes},
+        )
+
+
+class KinshipTests(TestCase):
+    """Kinship links, the lineage table kept from them and the family tree."""
+
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create([User(username=f'person{index}') for index in range(6)])
+        cls.people = UserProfile.objects.bulk_create([UserProfile(user=user) for user in users])
+
+    def test_only_members_of_a_link_may_change_it(self):
+        a, b, c = self.people[:3]
+        self.client.force_login(c.user)
+        data = {'person_id': a.pk, 'relative_id': b.pk, 'kind': 'parent'}
+        self.assertEqual(self.client.post('/api/kinship/', data).status_code, 403)
+        self.assertFalse(KinshipEdge.objects.exists())
+
+        self.client.force_login(a.user)
+        self.assertEqual(self.client.post('/api/kinship/', data).status_code, 201)
+        edge = KinshipEdge.objects.get(person=a, relative=b)
+        self.client.force_login(c.user)
+        self.assertEqual(self.client.delete(f'/api/kinship/{edge.pk}/').status_code, 403)
+        self.assertTrue(Lineage.objects.filter(ancestor=a, descendant=b).exists())
+
+        c.user.is_staff = True
+        c.user.save()
+        self.assertEqual(self.client.delete(f'/api/kinship/{edge.pk}/').status_code, 204)
+        self.assertFalse(KinshipEdge.objects.exists())
+        self.assertFalse(Lineage.objects.exists())
+
+    def test_posting_an_existing_pair_changes_its_kind(self):
+        a, b = self.people[:2]
+        self.client.force_login(a.user)
+        self.client.post('/api/kinship/', {'person_id': a.pk, 'relative_id': b.pk, 'kind': 'parent'})
+        response = self.client.post('/api/kinship/', {'person_id': a.pk, 'relative_id': b.pk, 'kind': 'spouse'})
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(KinshipEdge.objects.get(person=a, relative=b).kind, 'spouse')
+        self.assertEqual(KinshipEdge.objects.get(person=b, relative=a).kind, 'spouse')
+        self.assertFalse(Lineage.objects.exists())
+
+    def lineage(self):
+        return set(Lineage.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+
+    def assertLineageIsFresh(self):
+        """The incrementally kept rows equal a rebuild from scratch."""
+        kept = self.lineage()
+        KinshipDB.rebuild_lineage()
+        self.assertEqual(self.lineage(), kept)
+
+    def chain(self, count):
+        """Make the first ``count`` people a line of parents and children."""
+        for parent, child in zip(self.people, self.people[1:count]):
+            KinshipDB.add_relative(parent, child, 'parent')
+        return [person.pk for person in self.people[:count]]
+
+    def test_multi_generation_chain(self):
+        a, b, c, d = self.chain(4)
+        self.assertEqual(self.lineage(), {
+            (a, b, 1), (a, c, 2), (a, d, 3), (b, c, 1), (b, d, 2), (c, d, 1),
+        })
+        # Linking in a new root above the chain reaches every generation.
+        KinshipDB.add_relative(self.people[5], self.people[0], 'parent')
+        e = self.people[5].pk
+        self.assertTrue({(e, a, 1), (e, b, 2), (e, c, 3), (e, d, 4)} <= self.lineage())
+        self.assertLineageIsFresh()
+
+    def test_changing_a_parent_to_a_spouse(self):
+        a, b, c = self.chain(3)
+        KinshipDB.add_relative(self.people[0], self.people[1], 'spouse')
+        self.assertEqual(self.lineage(), {(b, c, 1)})
+        self.assertEqual(KinshipEdge.objects.get(person_id=b, relative_id=a).kind, 'spouse')
+        self.assertLineageIsFresh()
+
+    def test_removing_a_middle_link(self):
+        a, b, c, d = self.chain(4)
+        # A second line of descent keeps d a descendant of a, one generation further.
+        KinshipDB.add_relative(self.people[0], self.people[4], 'parent')
+        KinshipDB.add_relative(self.people[4], self.people[5], 'parent')
+        KinshipDB.add_relative(self.people[5], self.people[3], 'parent')
+        self.assertIn((a, d, 3), self.lineage())
+        self.assertTrue(KinshipDB.remove_relative(self.people[1], self.people[2]))
+        rows = self.lineage()
+        self.assertIn((a, b, 1), rows)
+        self.assertIn((c, d, 1), rows)
+        self.assertNotIn(b, {ancestor for ancestor, descendant, _ in rows if descendant in (c, d)})
+        self.assertIn((a, d, 3), rows)
+        self.assertFalse(any(ancestor == a and descendant == c for ancestor, descendant, _ in rows))
+        self.assertFalse(KinshipDB.remove_relative(self.people[1], self.people[2]))
+        self.assertLineageIsFresh()
+
+    def test_cycles_are_rejected(self):
+        self.chain(3)
+        before = self.lineage()
+        with self.assertRaises(ValueError):
+            KinshipDB.add_relative(self.people[2], self.people[0], 'parent')
+        with self.assertRaises(ValueError):
+            KinshipDB.add_relative(self.people[0], self.people[2], 'child')
+        with self.assertRaises(ValueError):
+            KinshipDB.add_relative(self.people[0], self.people[0], 'sibling')
+        self.assertEqual(self.lineage(), before)
+        self.assertFalse(KinshipEdge.objects.filter(person=self.people[2], relative=self.people[0]).exists())
+
+    def test_reversing_a_link(self):
+        a, b, c = self.chain(3)
+        KinshipDB.add_relative(self.people[0], self.people[1], 'child')
+        self.assertEqual(self.lineage(), {(b, a, 1), (b, c, 1)})
+        self.assertEqual(KinshipEdge.objects.get(person_id=b, relative_id=a).kind, 'parent')
+        self.assertLineageIsFresh()
+
+        # Reversing a direct link that a longer line of descent backs up is
+        # still a cycle; the rejected replacement keeps the old link.
+        d, e, f = self.people[3:6]
+        KinshipDB.add_relative(d, e, 'parent')
+        KinshipDB.add_relative(e, f, 'parent')
+        KinshipDB.add_relative(d, f, 'parent')
+        before = self.lineage()
+        with self.assertRaises(ValueError):
+            KinshipDB.add_relative(d, f, 'child')
+        self.assertEqual(KinshipEdge.objects.get(person=d, relative=f).kind, 'parent')
+        self.assertEqual(KinshipEdge.objects.get(person=f, relative=d).kind, 'child')
+        self.assertEqual(self.lineage(), before)
+
+    def test_deleting_a_profile(self):
+        a, b, c, d = self.chain(4)
+        self.people[1].delete()
+        self.assertEqual(self.lineage(), {(c, d, 1)})
+        self.assertFalse(KinshipEdge.objects.filter(person_id=b).exists())
+        self.assertFalse(KinshipEdge.objects.filter(relative_id=b).exists())
+        self.assertLineageIsFresh()
+
+    def test_family_tree_generations(self):
+        a, b, c, d, e = self.chain(5)
+        KinshipDB.add_relative(self.people[2], self.people[5], 'parent')
+        f = self.people[5].pk
+        tree = KinshipDB.get_family_tree(c, generations=1)
+        self.assertEqual({person['id']: person['generation'] for person in tree['people']}, {b: -1, c: 0, d: 1, f: 1})
+        tree = KinshipDB.get_family_tree(c, generations=2)
+        self.assertEqual(
+            {person['id']: person['generation'] for person in tree['people']},
+            {a: -2, b: -1, c: 0, d: 1, f: 1, e: 2},
+        )
+        self.assertIn({'parent': d, 'child': e}, tree['links'])
+        lone = KinshipDB.get_family_tree(a, generations=1)
+        self.assertEqual([person['generation'] for person in lone['people']], [0, 1])
+
+
+class SearchTests(TestCase):
+    """Full-text search through ``BaseDB.search``."""
+
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create([User(username=f'farmer{index}') for index in range(30)])
+        cls.profiles = [UserProfile.objects.create(user=user, profession='Farmer') for user in users]
+
+    def test_filtered_search_is_limited(self):
+        queryset = UserProfile.objects.exclude(pk=self.profiles[0].pk)
+        with CaptureQueriesContext(connection) as queries:
+            results = UserManagementDB.search(UserProfile, 'farm', ['profession'], queryset=queryset, limit=5)
+        self.assertEqual(len(results), 5)
+        self.assertNotIn(self.profiles[0], results)
+        searches = [query['sql'] for query in queries if 'MATCH' in query['sql']]
+        self.assertTrue(searches)
+        self.assertTrue(all('LIMIT' in sql for sql in searches))
+
+        # Most ranked ids are filtered out: the search reads further.
+        wanted = [profile.pk for profile in self.profiles[-3:]]
+        results = UserManagementDB.search(
+            UserProfile, 'farm', ['profession'], queryset=UserProfile.objects.filter(pk__in=wanted), limit=5
+        )
+        self.assertEqual(sorted(profile.pk for profile in results), wanted)
+
+
+class RelationshipGraphTests(SimpleTestCase):
+    """The in-memory relationship graph index, built from given rows."""
+
+    def random_pairs(self, rnd, nodes, count):
+        pairs = set()
+        while len(pairs) < count:
+            a, b = rnd.sample(range(1, nodes + 1), 2)
+            pairs.add((a, b))
+        return pairs
+
+    def distances(self, adjacency, source):
+        """Plain breadth-first distances over undirected edges."""
+        found = {source: 0}
+        queue = deque([source])
+        while queue:
+            current = queue.popleft()
+            for neighbour in adjacency.get(current, ()):
+                if neighbour not in found:
+                    found[neighbour] = found[current] + 1
+                    queue.append(neighbour)
+        return found
+
+    def test_shortest_paths_match_breadth_first_search(self):
+        rnd = random.Random(7)
+        pairs = self.random_pairs(rnd, 200, 300)
+        adjacency = defaultdict(set)
+        for a, b in pairs:
+            adjacency[a].add(b)
+            adjacency[b].add(a)
+        rows = sorted((a, b, 'friend') for a, b in pairs | {(b, a) for a, b in pairs})
+        graph = RelationshipGraphIndex(1, rows=rows)
+        for _ in range(200):
+            source, target = rnd.randrange(1, 202), rnd.randrange(1, 202)
+            expected = self.distances(adjacency, source).get(target)
+            for max_depth in (2, 6):
+                with self.subTest(source=source, target=target, max_depth=max_depth):
+                    path = graph.shortest_path(source, target, max_depth)
+                    if expected is None or expected > max_depth:
+                        self.assertIsNone(path)
+                        continue
+                    self.assertEqual(len(path) - 1, expected)
+                    self.assertEqual((path[0], path[-1]), (source, target))
+                    for a, b in zip(path, path[1:]):
+                        self.assertIn(b, adjacency[a])
+
+    def test_paths_found_during_a_change_are_not_cached(self):
+        graph = RelationshipGraphIndex(1, rows=[(1, 2, 'friend'), (2, 1, 'friend'), (2, 3, 'friend'), (3, 2, 'friend')])
+        search = graph._search
+
+        def search_during_change(*args):
+            path = search(*args)
+            graph.apply([(2, 3, None), (3, 2, None)])
+            return path
+
+        with mock.patch.object(graph, '_search', side_effect=search_during_change):
+            self.assertEqual(graph.shortest_path(1, 3, 4), [1, 2, 3])
+        self.assertIsNone(graph.shortest_path(1, 3, 4))
+
+    def test_overlay_and_compaction_keep_edges(self):
+        rnd = random.Random(11)
+        edges = {(a, b): 'friend' for a, b in self.random_pairs(rnd, 50, 200)}
+        graph = RelationshipGraphIndex(1, rows=sorted((a, b, kind) for (a, b), kind in edges.items()))
+        graph.COMPACT_THRESHOLD = 40
+        kinds = ['family', 'friend', 'colleague']
+
+        def check():
+            for node in range(1, 52):
+                expected = sorted((b, kind) for (a, b), kind in edges.items() if a == node)
+                self.assertEqual(sorted(graph.neighbours(node)), expected)
+                self.assertEqual(graph.degree(node), len(expected))
+            self.assertEqual(graph.edge_count, len(edges))
+
+        for _ in range(30):
+            changes = []
+            for a, b in self.random_pairs(rnd, 51, 5):
+                if (a, b) in edges and rnd.random() < 0.5:
+                    del edges[a, b]
+                    changes.append((a, b, None))
+                else:
+                    edges[a, b] = rnd.choice(kinds)
+                    changes.append((a, b, edges[a, b]))
+            graph.apply(changes)
+            check()
+            self.assertLessEqual(graph._snapshot.overlay_size, graph.COMPACT_THRESHOLD)
+        graph.compact()
+        self.assertEqual(graph._snapshot.overlay_size, 0)
+        check()
+        self.assertEqual(graph.edge_type(1, 2), edges.get((1, 2)) or edges.get((2, 1)))
+
+    def test_readers_keep_a_consistent_snapshot(self):
+        graph = RelationshipGraphIndex(1, rows=[(1, 2, 'friend'), (2, 1, 'friend'), (2, 3, 'friend'), (3, 2, 'friend')])
+        snapshot = graph._snapshot
+        graph.apply([(1, 3, 'friend'), (3, 1, 'friend'), (2, 3, None), (3, 2, None)])
+        graph.compact()
+        self.assertEqual(sorted(snapshot.neighbour_ids(2)), [1, 3])
+        self.assertEqual(snapshot.neighbour_ids(1), [2])
+        self.assertEqual(sorted(graph.neighbour_ids(1)), [2, 3])
+        self.assertEqual(graph.neighbour_ids(2), [1])
+
+
+class GraphImageTests(TestCase):
+    """Stored relationship graph images and their invalidation."""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        users = User.objects.bulk_create([User(username='center'), User(username='friend')])
+        self.profile, self.friend = UserProfile.objects.bulk_create([UserProfile(user=user) for user in users])
+        self.relationship = Relationship.objects.create(
+            user=self.profile, related_user=self.friend, relationship_type='friend'
+        )
+
+    def test_failed_renders_are_not_retried(self):
+        edges = graph_images.get_graph_edges(self.profile)
+        name = graph_images.image_name(self.profile.pk, graph_images.graph_key(self.profile, edges))
+        with mock.patch.object(graph_images, 'render_graph', side_effect=RuntimeError), self.assertLogs(graph_images.logger):
+            graph_images._render_job(name, 'center', edges)
+        with mock.patch.object(graph_images, '_get_executor') as executor:
+            with self.assertRaises(graph_images.GraphRenderFailed):
+                graph_images.get_graph_image(self.profile)
+        executor.assert_not_called()
+
+        # A change to the relationships clears the failure along with the images.
+        self.relationship.relationship_type = 'family'
+        self.relationship.save()
+        self.assertFalse(default_storage.exists(graph_images.failure_name(name)))
+        with mock.patch.object(graph_images, '_get_executor') as executor:
+            self.assertIsNone(graph_images.get_graph_image(self.profile)[0])
+        executor.return_value.submit.assert_called_once()
+
+    def test_invalidation_removes_images_of_any_process(self):
+        directory = graph_images.image_dir(self.profile.pk)
+        default_storage.save(f'{directory}/old.png', ContentFile(b'png'))
+        default_storage.save(f'{directory}/older.png', ContentFile(b'png'))
+        graph_images.invalidate_graph_image(self.profile.pk)
+        self.assertEqual(default_storage.listdir(directory), ([], []))
+        graph_images.invalidate_graph_image(self.friend.pk)
+
+
+class LocationHierarchyTests(TestCase):
+    """Reading the location hierarchy through ``LocationHierarchyDB``."""
+
+    def test_ancestors_are_read_in_one_query(self):
+        district = District.objects.create(name='District')
+        block = Block.objects.create(name='Block', district=district)
+        police_station = PoliceStation.objects.create(name='Police Station', block=block)
+        post_office = PostOffice.objects.create(name='Post Office', police_station=police_station)
+        panchayat = Panchayat.objects.create(name='Panchayat', post_office=post_office)
+        village = Village.objects.create(name='Village', panchayat=panchayat)
+        with self.assertNumQueries(1):
+            ancestors = LocationHierarchyDB.get_ancestors('village', village.pk)
+            names = {level: location.name for level, location in ancestors.items()}
+        self.assertEqual(list(ancestors), ['district', 'block', 'police_station', 'post_office', 'panchayat'])
+        self.assertEqual(names['police_station'], 'Police Station')
+        self.assertEqual(LocationHierarchyDB.get_ancestors('block', block.pk), {'district': district})
+        self.assertEqual(LocationHierarchyDB.get_ancestors('district', district.pk), {})
+        self.assertEqual(LocationHierarchyDB.get_ancestors('village', 0), {})
+
+    def test_moving_a_node_with_update_fields(self):
+        chains = []
+        for name in ('East', 'West'):
+            district = District.objects.create(name=name)
+            block = Block.objects.create(name=name, district=district)
+            police_station = PoliceStation.objects.create(name=name, block=block)
+            chains.append(PostOffice.objects.create(name=name, police_station=police_station))
+        east, west = chains
+        panchayat = Panchayat.objects.create(name='Panchayat', post_office=east)
+        village = Village.objects.create(name='Village', panchayat=panchayat)
+
+        panchayat = Panchayat.objects.get(pk=panchayat.pk)
+        panchayat.post_office = west
+        panchayat.save(update_fields=['post_office'])
+        panchayat.refresh_from_db()
+        village.refresh_from_db()
+        for node in (panchayat, village):
+            with self.subTest(level=node.hierarchy_level):
+                self.assertEqual(node.district_id, west.district_id)
+                self.assertEqual(node.block_id, west.block_id)
+                self.assertEqual(node.police_station_id, west.police_station_id)
+
+        panchayat.post_office = east
+        panchayat.save(update_fields=['name'])
+        panchayat.refresh_from_db()
+        self.assertEqual(panchayat.district_id, west.district_id)
+
+    def test_backfill_moves_updated_at(self):
+        district = District.objects.create(name='District')
+        block = Block.objects.create(name='Block', district=district)
+        police_station = PoliceStation.objects.create(name='Police Station', block=block)
+        post_office = PostOffice.objects.create(name='Post Office', police_station=police_station)
+        panchayat = Panchayat.objects.create(name='Panchayat', post_office=post_office)
+        village = Village.objects.create(name='Village', panchayat=panchayat)
+        earlier = timezone.now() - timedelta(days=1)
+        Village.objects.update(district=None, updated_at=earlier)
+        call_command('backfill_location_ancestors', stdout=io.StringIO())
+        village.refresh_from_db()
+        self.assertEqual(village.district_id, district.pk)
+        self.assertGreater(village.updated_at, earlier)
+
+    def test_streamed_array_items(self):
+        items = [
+            {'name': 'Gaya', 'blocks': [{'name': 'Bodh [Gaya]', 'note': 'a "quoted", {braced} name\\'}]},
+            'plain ] string',
+            [1, [2, {}]],
+            3.5,
+            None,
+            {'name': 'x' * 50},
+        ]
+        text = json.dumps({'state': 'Bihar', 'districts': items, 'after': [0]})
+        for chunk_size in (1, 2, 7, 1 << 16):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(list(iter_json_array(io.StringIO(text), 'districts', chunk_size)), items)
+        self.assertEqual(list(iter_json_array(io.StringIO('{"districts": []}'), 'districts')), [])
+        with self.assertRaises(ValueError):
+            list(iter_json_array(io.StringIO('{"districts": [{"name": "Gaya"}'), 'districts'))
+
+    def test_level_filter_applies_before_the_scan_limit(self):
+        district = District.objects.create(name='Ramtekeshwarnagar')
+        block = Block.objects.create(name='Block', district=district)
+        police_station = PoliceStation.objects.create(name='Police Station', block=block)
+        post_office = PostOffice.objects.create(name='Post Office', police_station=police_station)
+        panchayat = Panchayat.objects.create(name='Panchayat', post_office=post_office)
+        Village.objects.bulk_create(
+            [Village(name=f'Rampur {index:03}', panchayat=panchayat) for index in range(250)]
+        )
+        index = LocationAutocompleteIndex(LocationTree(0))
+        results = index.search('ram', limit=5, level='district')
+        self.assertEqual([(result['level'], result['id']) for result in results], [('district', district.pk)])
+        self.assertEqual(len(index.search('ram', limit=5)), 5)
+
+    def test_only_found_children_are_cached_publicly(self):
+        district = District.objects.create(name='District')
+        Block.objects.create(name='Block', district=district)
+        response = self.client.get(reverse('hierarchy_children', args=['district', district.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('public', response['Cache-Control'])
+        response = self.client.get(
+            reverse('hierarchy_children', args=['district', district.pk]), HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertIn('public', response['Cache-Control'])
+        for args in (['district', 0], ['village', district.pk], ['nowhere', 1]):
+            with self.subTest(args=args):
+                response = self.client.get(reverse('hierarchy_children', args=args))
+                self.assertEqual(response.status_code, 404)
+                self.assertFalse(response.has_header('Cache-Control'))
+
+
+class RelationshipGraphSyncTests(TestCase):
+    """Keeping the graph index of each process in step with the database."""
+
+    def setUp(self):
+        users = User.objects.bulk_create([User(username=f'node{index}') for index in range(3)])
+        self.a, self.b, self.c = UserProfile.objects.bulk_create([UserProfile(user=user) for user in users])
+        self.enterContext(mock.patch.object(relationship_graph, '_graph', None))
+        self.enterContext(mock.patch.object(relationship_graph, '_checked_at', 0.0))
+
+    def changed_elsewhere(self):
+        """Write relationships as another process would: this index is not told."""
+        Relationship.objects.create(user=self.a, related_user=self.c, relationship_type='friend')
+        Relationship.objects.filter(user=self.a, related_user=self.b).delete()
+        relationship_graph._checked_at = 0.0
+
+    def test_other_processes_apply_logged_changes(self):
+        Relationship.objects.create(user=self.a, related_user=self.b, relationship_type='family')
+        graph = relationship_graph.get_relationship_graph()
+        self.assertEqual(graph.neighbours(self.a.pk), [(self.b.pk, 'family')])
+        self.changed_elsewhere()
+        self.assertIs(relationship_graph.get_relationship_graph(), graph)
+        self.assertEqual(graph.neighbours(self.a.pk), [(self.c.pk, 'friend')])
+
+    def test_rebuild_when_the_log_was_pruned(self):
+        Relationship.objects.create(user=self.a, related_user=self.b, relationship_type='family')
+        graph = relationship_graph.get_relationship_graph()
+        self.changed_elsewhere()
+        RelationshipGraphChange.objects.all().delete()
+        rebuilt = relationship_graph.get_relationship_graph()
+        self.assertIsNot(rebuilt, graph)
+        self.assertEqual(rebuilt.neighbours(self.a.pk), [(self.c.pk, 'friend')])
+
+
+class CommunityTests(TestCase):
+    """Community detection on two planted clusters joined by one link."""
+
+    @classmethod
+    def setUpTestData(cls):
+        district = District.objects.create(name='District')
+        block = Block.objects.create(name='Block', district=district)
+        police_station = PoliceStation.objects.create(name='Police Station', block=block)
+        post_office = PostOffice.objects.create(name='Post Office', police_station=police_station)
+        panchayat = Panchayat.objects.create(name='Panchayat', post_office=post_office)
+        cls.villages = [Village.objects.create(name=name, panchayat=panchayat) for name in ('East', 'West')]
+        cls.groups = []
+        for village in cls.villages:
+            users = User.objects.bulk_create([User(username=f'{village.name}{index}') for index in range(6)])
+            members = UserProfile.objects.bulk_create([UserProfile(user=user, village=village) for user in users])
+            for index, member in enumerate(members):
+                for other in members[index + 1:]:
+                    Relationship.objects.create(user=member, related_user=other, relationship_type='friend')
+            cls.groups.append(members)
+        Relationship.objects.create(user=cls.groups[0][0], related_user=cls.groups[1][0], relationship_type='friend')
+
+    def clusters(self, members):
+        return set(UserProfile.objects.filter(pk__in=[member.pk for member in members]).values_list('cluster_id', flat=True))
+
+    def test_full_detection_finds_the_planted_clusters(self):
+        result = CommunitiesDB.detect(full=True)
+        self.assertEqual(result['profiles'], 12)
+        east, west = (self.clusters(members) for members in self.groups)
+        self.assertEqual(len(east), 1)
+        self.assertEqual(len(west), 1)
+        self.assertNotEqual(east, west)
+        self.assertFalse(UserProfile.objects.filter(cluster_changes__gt=0).exists())
+
+    def test_incremental_detection_relabels_only_the_changed_part(self):
+        CommunitiesDB.detect(full=True)
+        (east,) = self.clusters(self.groups[0])
+        user = User.objects.create_user('newcomer')
+        newcomer = UserProfile.objects.create(user=user, village=self.villages[0])
+        for member in self.groups[0][1:4]:
+            Relationship.objects.create(user=newcomer, related_user=member, relationship_type='friend')
+
+        result = CommunitiesDB.detect()
+        self.assertLess(result['profiles'], 13)
+        self.assertEqual(self.clusters(self.groups[0] + [newcomer]), {east})
+        self.assertEqual(len(self.clusters(self.groups[1])), 1)
+
+    def test_changes_during_a_run_are_kept(self):
+        changed = self.groups[1][1]
+        Relationship.objects.filter(user=changed, related_user=self.groups[1][2]).delete()
+
+        def change_during_run(ids):
+            CommunitiesDB.mark_dirty(changed.pk)
+            return relationship_graph.adjacency_matrix(ids)
+
+        with mock.patch('village.db.communities.adjacency_matrix', change_during_run):
+            CommunitiesDB.detect()
+        dirty = UserProfile.objects.filter(cluster_changes__gt=0).values_list('pk', flat=True)
+        self.assertEqual(list(dirty), [changed.pk])
+
+    def test_village_clusters(self):
+        CommunitiesDB.detect(full=True)
+        self.client.force_login(self.groups[0][0].user)
+        response = self.client.get(f'/api/villages/{self.villages[0].pk}/clusters/')
+        self.assertEqual(response.status_code, 200)
+        (east,) = self.clusters(self.groups[0])
+        self.assertEqual(
+            response.json(), [{'cluster_id': east, 'members': 6, 'size': 6, 'villages': 1, 'share': 1.0}]
+        )
+
+
+class RelationshipRequestTests(TestCase):
+    """Answering relationship requests, one at a time and in bulk."""
+
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create([User(username=name) for name in ('me', 'ann', 'bob', 'cal', 'dev', 'eve')])
+        cls.me, cls.ann, cls.bob, cls.cal, cls.dev, cls.eve = UserProfile.objects.bulk_create(
+            [UserProfile(user=user) for user in users]
+        )
+
+    def setUp(self):
+        self.enterContext(mock.patch.object(relationship_graph, '_graph', None))
+        self.enterContext(mock.patch.object(relationship_graph, '_checked_at', 0.0))
+        self.invalidated = self.enterContext(mock.patch('village.db.relationships.invalidate_graph_image'))
+        self.requests = {
+            sender.user.username: RelationshipRequest.objects.create(
+                from_user=sender, to_user=self.me, relationship_type=kind
+            )
+            for sender, kind in ((self.ann, 'friend'), (self.bob, 'family'), (self.cal, 'friend'))
+        }
+        # Cal is already related to me; Dev's request was answered before;
+        # Eve's request went to someone else.
+        Relationship.objects.create(user=self.cal, related_user=self.me, relationship_type='neighbor')
+        self.requests['dev'] = RelationshipRequest.objects.create(
+            from_user=self.dev, to_user=self.me, relationship_type='friend', status='rejected'
+        )
+        self.requests['eve'] = RelationshipRequest.objects.create(
+            from_user=self.eve, to_user=self.ann, relationship_type='friend'
+        )
+        self.ids = [request.pk for request in self.requests.values()]
+
+    def statuses(self):
+        return {
+            name: RelationshipRequest.objects.get(pk=request.pk).status for name, request in self.requests.items()
+        }
+
+    def test_accepting_in_bulk(self):
+        changes = dict(UserProfile.objects.values_list('pk', 'cluster_changes'))
+        with self.captureOnCommitCallbacks(execute=True):
+            result = RelationshipsDB.respond_to_requests(self.me, self.ids, 'accept')
+        self.assertEqual(result, {'accepted': 2, 'rejected': 1, 'already_connected': 1})
+        self.assertEqual(
+            self.statuses(),
+            {'ann': 'accepted', 'bob': 'accepted', 'cal': 'rejected', 'dev': 'rejected', 'eve': 'pending'},
+        )
+        self.assertEqual(
+            set(Relationship.objects.filter(Q(user=self.me) | Q(related_user=self.me)).values_list(
+                'user_id', 'related_user_id', 'relationship_type'
+            )),
+            {
+                (self.ann.pk, self.me.pk, 'friend'), (self.me.pk, self.ann.pk, 'friend'),
+                (self.bob.pk, self.me.pk, 'family'), (self.me.pk, self.bob.pk, 'family'),
+                (self.cal.pk, self.me.pk, 'neighbor'),
+            },
+        )
+        graph = relationship_graph.get_relationship_graph()
+        self.assertEqual(
+            sorted(graph.neighbours(self.me.pk)), [(self.ann.pk, 'friend'), (self.bob.pk, 'family')]
+        )
+        for profile in (self.me, self.ann, self.bob):
+            with self.subTest(profile=profile.user.username):
+                self.assertGreater(UserProfile.objects.get(pk=profile.pk).cluster_changes, changes[profile.pk])
+        self.assertEqual(UserProfile.objects.get(pk=self.cal.pk).cluster_changes, changes[self.cal.pk])
+        invalidated = {call.args[0] for call in self.invalidated.call_args_list}
+        self.assertEqual(invalidated, {self.me.pk, self.ann.pk, self.bob.pk})
+
+        # Answered requests are not answered again.
+        self.assertEqual(
+            RelationshipsDB.respond_to_requests(self.me, self.ids, 'accept'),
+            {'accepted': 0, 'rejected': 0, 'already_connected': 0},
+        )
+
+    def test_rejecting_in_bulk(self):
+        result = RelationshipsDB.respond_to_requests(self.me, self.ids, 'reject')
+        self.assertEqual(result, {'accepted': 0, 'rejected': 3, 'already_connected': 0})
+        self.assertEqual(
+            self.statuses(),
+            {'ann': 'rejected', 'bob': 'rejected', 'cal': 'rejected', 'dev': 'rejected', 'eve': 'pending'},
+        )
+        self.assertEqual(Relationship.objects.count(), 1)
+        with self.assertRaises(ValueError):
+            RelationshipsDB.respond_to_requests(self.me, self.ids, 'ignore')
+
+    def test_respond_to_requests_endpoint(self):
+        url = '/api/relationships/respond-to-requests/'
+        self.client.force_login(self.me.user)
+        for data in ({'action': 'accept', 'request_ids': 'all'}, {'action': 'ignore', 'request_ids': self.ids}):
+            with self.subTest(data=data):
+                self.assertEqual(self.client.post(url, data, content_type='application/json').status_code, 400)
+        self.assertEqual(self.statuses()['ann'], 'pending')
+
+        response = self.client.post(url, {'action': 'accept', 'request_ids': self.ids}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'accepted': 2, 'rejected': 1, 'already_connected': 1})
+
+    def test_bulk_form(self):
+        self.client.force_login(self.me.user)
+        response = self.client.post(
+            reverse('handle_relationship_requests_bulk'),
+            {'action': 'accept', 'request_ids': [self.requests['ann'].pk, self.requests['cal'].pk, 'x']},
+        )
+        self.assertRedirects(response, reverse('relationship_requests'), fetch_redirect_response=False)
+        self.assertEqual(
+            [str(message) for message in get_messages(response.wsgi_request)],
+            ['Accepted 1 request.', '1 request came from people you are already related to and were closed.'],
+        )
+        self.assertEqual(self.statuses()['ann'], 'accepted')
+        self.assertEqual(self.statuses()['bob'], 'pending')
+
+    def test_single_request(self):
+        def answer(user, name, action):
+            self.client.force_login(user)
+            response = self.client.post(
+                reverse('handle_relationship_request', args=[self.requests[name].pk]), {'action': action}
+            )
+            self.assertRedirects(response, reverse('relationship_requests'), fetch_redirect_response=False)
+            # Drop the messages rather than follow the redirect that shows them.
+            self.client.cookies.pop('messages', None)
+            return [str(message) for message in get_messages(response.wsgi_request)]
+
+        self.assertEqual(
+            answer(self.ann.user, 'bob', 'accept'), ["You don't have permission to accept or reject this request."]
+        )
+        self.assertEqual(answer(self.me.user, 'bob', 'accept'), ['You are now connected with bob.'])
+        self.assertEqual(answer(self.me.user, 'bob', 'reject'), ['This request has already been answered.'])
+        self.assertEqual(answer(self.me.user, 'cal', 'accept'), ['You already have a relationship with cal.'])
+        self.assertEqual(answer(self.me.user, 'ann', 'reject'), ['You have rejected the request from ann.'])
+        self.assertEqual(
+            self.statuses(),
+            {'ann': 'rejected', 'bob': 'accepted', 'cal': 'rejected', 'dev': 'rejected', 'eve': 'pending'},
+        )
+        self.assertTrue(Relationship.objects.filter(user=self.me, related_user=self.bob).exists())
+
+
+class PendingRequestCountTests(TestCase):
+    """The pending request count kept on each profile for the navbar badge."""
+
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create([User(username=name) for name in ('me', 'ann', 'bob', 'nobody')])
+        cls.me, cls.ann, cls.bob = UserProfile.objects.bulk_create([UserProfile(user=user) for user in users[:3]])
+        cls.nobody = users[3]
+
+    def setUp(self):
+        cache.clear()
+
+    def count(self):
+        """The stored count, checked against the cached one."""
+        stored = UserProfile.objects.get(pk=self.me.pk).pending_received_count
+        self.assertEqual(RelationshipsDB.get_pending_count(self.me.user), stored)
+        return stored
+
+    def send(self, sender):
+        with self.captureOnCommitCallbacks(execute=True):
+            return RelationshipRequest.objects.create(from_user=sender, to_user=self.me, relationship_type='friend')
+
+    def test_answering_requests(self):
+        first, second = self.send(self.ann), self.send(self.bob)
+        self.assertEqual(self.count(), 2)
+        with self.assertNumQueries(0):
+            RelationshipsDB.get_pending_count(self.me.user)
+
+        for request, status in ((first, 'accepted'), (second, 'rejected')):
+            with self.subTest(status=status), self.captureOnCommitCallbacks(execute=True):
+                request = RelationshipRequest.objects.get(pk=request.pk)
+                request.status = status
+                request.save()
+            self.assertEqual(self.count(), 1 if status == 'accepted' else 0)
+
+        # Saving an answered request again does not count it twice.
+        with self.captureOnCommitCallbacks(execute=True):
+            request.save()
+        self.assertEqual(self.count(), 0)
+
+    def test_deleting_requests(self):
+        request = self.send(self.ann)
+        self.send(self.bob)
+        with self.captureOnCommitCallbacks(execute=True):
+            request.delete()
+        self.assertEqual(self.count(), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bob.delete()
+        self.assertEqual(self.count(), 0)
+
+    def test_saving_without_loading_recounts(self):
+        request = self.send(self.ann)
+        self.send(self.bob)
+        UserProfile.objects.filter(pk=self.me.pk).update(pending_received_count=7)
+        with self.captureOnCommitCallbacks(execute=True):
+            request = RelationshipRequest.objects.only('to_user').get(pk=request.pk)
+            request.status = 'accepted'
+            request.save()
+        self.assertEqual(self.count(), 1)
+
+    def test_answering_in_bulk(self):
+        requests = [self.send(self.ann), self.send(self.bob)]
+        self.assertEqual(self.count(), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            RelationshipsDB.respond_to_requests(self.me, [request.pk for request in requests], 'reject')
+        self.assertEqual(self.count(), 0)
+
+    def test_users_without_a_profile(self):
+        request = RequestFactory().get('/')
+        request.user = self.nobody
+        self.assertEqual(pending_requests(request), {'pending_requests_count': 0})
+        request.user = AnonymousUser()
+        self.assertEqual(pending_requests(request), {'pending_requests_count': 0})
@@ -8,12 +8,16 @@ router = DefaultRouter()
 router.register(r'villages', views.VillageViewSet)
 router.register(r'profiles', views.UserProfileViewSet)
 router.register(r'relationships', views.RelationshipViewSet)
+router.register(r'kinship', views.KinshipEdgeViewSet)
 router.register(r'events', views.CommunityEventViewSet)
 router.register(r'contributions', views.EventContributionViewSet)
 router.register(r'services', views.VillageServiceViewSet)
 
 # API URLs
 api_urlpatterns = [
+    path('hierarchy/<str:level>/<int:parent_id>/children', views.hierarchy_children, name='hierarchy_children'),
+    path('locations/autocomplete', views.location_autocomplete, name='location_autocomplete'),
+    path('sync', views.sync, name='sync'),
     path('', include(router.urls)),
 ]
 
@@ -67,8 +71,10 @@ template_urlpatterns = [
     # Relationship URLs
     path('relationships/', views.my_relationships, name='my_relationships'),
     path('relationships/graph/', views.relationship_graph, name='relationship_graph'),
+    path('relationships/graph/image/', views.relationship_graph_image, name='relationship_graph_image'),
     path('relationships/requests/', views.relationship_requests, name='relationship_requests'),
     path('relationships/requests/<int:request_id>/', views.handle_relationship_request, name='handle_relationship_request'),
+    path('relationships/requests/bulk/', views.handle_relationship_requests_bulk, name='handle_relationship_requests_bulk'),
     path('relationships/send-request/<int:user_id>/', views.send_relationship_request, name='send_relationship_request'),
     path('relationships/add/', views.add_relationship, name='add_relationship'),
     path('relationships/remove/', views.remove_relationship, name='remove_relationship'),
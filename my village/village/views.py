@@ -1,28 +1,43 @@
+from functools import wraps
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils import timezone
+from django.template.defaultfilters import pluralize
 from rest_framework import viewsets, permissions, status
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.response import Response
 from django.contrib.auth.models import User
-from .models import Village, UserProfile, Relationship, CommunityEvent, EventContribution, VillageService, District, Block, PoliceStation, PostOffice, Panchayat, AadhaarVerification, RelationshipRequest
+from .models import Village, UserProfile, Relationship, CommunityEvent, EventContribution, VillageService, District, Block, PoliceStation, PostOffice, Panchayat, AadhaarVerification, RelationshipRequest, KinshipEdge
+from .graph_images import CENTER_COLOR, COLOR_MAP, GraphRenderFailed, get_graph_edges, get_graph_image
 from .forms import AadhaarVerificationForm, CommunityEventForm, UserProfileForm, UserSearchForm, RelationshipRequestForm
+from .db import CommunitiesDB, KinshipDB, LocationHierarchyDB, RecommendationsDB, RelationshipsDB, SyncDB, UserManagementDB
+from .db.sync import SyncTokenExpired
+from .db.location_search import get_autocomplete_index
+from .db.location_tree import get_location_tree
+from .pagination import KeysetCursorPagination, paginate_keyset, parse_page_size
+from .bulk import BulkWriteMixin
+from .conditional import ConditionalGetMixin
+from .query_optimizer import OptimizedQuerysetMixin, optimize_queryset
 from .serializers import (
     UserSerializer, VillageSerializer, UserProfileSerializer,
     RelationshipSerializer, CommunityEventSerializer,
-    EventContributionSerializer, VillageServiceSerializer
+    EventContributionSerializer, VillageServiceSerializer, KinshipEdgeSerializer
 )
 from django.contrib.auth.forms import UserCreationForm
-from django.db.models import Q
-import networkx as nx
-import matplotlib.pyplot as plt
-import io
-import base64
+from django.db.models import Q, Count
 from django.http import HttpResponse, JsonResponse
+from django.conf import settings
+from django.utils.cache import patch_cache_control
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition
 from django.contrib.auth import logout, login, authenticate
 from django.contrib.auth.forms import AuthenticationForm
 
+# Members listed for a search on the relationships page.
+SEARCH_RESULTS_LIMIT = 50
+
 def home(request):
     """Home page view."""
     featured_villages = Village.objects.all()[:3]
@@ -68,8 +83,9 @@ def village_list(request):
             }
         )
     
-    # Get all districts for the filter
-    districts = District.objects.all().order_by('name')
+    # Dropdown options come from the in-memory location tree
+    tree = get_location_tree()
+    districts = tree.get_children(None, None)
     
     # Get selected filters
     selected_district = request.GET.get('district')
@@ -78,32 +94,59 @@ def village_list(request):
     selected_post_office = request.GET.get('post_office')
     selected_panchayat = request.GET.get('panchayat')
     
-    # Initialize querysets
-    blocks = Block.objects.none()
-    police_stations = PoliceStation.objects.none()
-    post_offices = PostOffice.objects.none()
-    panchayats = Panchayat.objects.none()
-    villages = Village.objects.all()
+    # Initialize option lists
+    blocks = []
+    police_stations = []
+    post_offices = []
+    panchayats = []
+    villages = Village.objects.select_related(
+        'district', 'block', 'police_station', 'post_office', 'panchayat'
+    )
     
-    # Apply filters
-    if selected_district:
-        blocks = Block.objects.filter(district_id=selected_district).order_by('name')
-        villages = villages.filter(panchayat__post_office__police_station__block__district_id=selected_district)
+    # Option lists for each selected level
+    if selected_district and selected_district.isdigit():
+        blocks = tree.get_children('district', int(selected_district))
         
-        if selected_block:
-            police_stations = PoliceStation.objects.filter(block_id=selected_block).order_by('name')
-            villages = villages.filter(panchayat__post_office__police_station__block_id=selected_block)
+        if selected_block and selected_block.isdigit():
+            police_stations = tree.get_children('block', int(selected_block))
             
-            if selected_police_station:
-                post_offices = PostOffice.objects.filter(police_station_id=selected_police_station).order_by('name')
-                villages = villages.filter(panchayat__post_office__police_station_id=selected_police_station)
+            if selected_police_station and selected_police_station.isdigit():
+                post_offices = tree.get_children('police_station', int(selected_police_station))
                 
-                if selected_post_office:
-                    panchayats = Panchayat.objects.filter(post_office_id=selected_post_office).order_by('name')
-                    villages = villages.filter(panchayat__post_office_id=selected_post_office)
-                    
-                    if selected_panchayat:
-                        villages = villages.filter(panchayat_id=selected_panchayat)
+                if selected_post_office and selected_post_office.isdigit():
+                    panchayats = tree.get_children('post_office', int(selected_post_office))
+    
+    # Filter on the denormalized columns and fetch a single keyset page
+    villages = LocationHierarchyDB.filter_villages(villages, request.GET)
+    page_size = parse_page_size(request.GET.get('page_size'))
+    try:
+        page = paginate_keyset(villages, cursor=request.GET.get('cursor'), page_size=page_size)
+    except ValueError:
+        # Ignore a malformed cursor and start from the first page
+        page = paginate_keyset(villages, page_size=page_size)
+    
+    # Badge counts for the villages on this page only
+    page_ids = [village.id for village in page]
+    member_counts = dict(
+        UserProfile.objects.filter(village_id__in=page_ids)
+        .values_list('village_id').annotate(total=Count('id'))
+    )
+    event_counts = dict(
+        CommunityEvent.objects.filter(village_id__in=page_ids)
+        .values_list('village_id').annotate(total=Count('id'))
+    )
+    service_counts = dict(
+        VillageService.objects.filter(village_id__in=page_ids)
+        .values_list('village_id').annotate(total=Count('id'))
+    )
+    for village in page:
+        village.member_count = member_counts.get(village.id, 0)
+        village.event_count = event_counts.get(village.id, 0)
+        village.service_count = service_counts.get(village.id, 0)
+    
+    # Query string without the cursor, for the next/previous links
+    filters = request.GET.copy()
+    filters.pop('cursor', None)
     
     context = {
         'user_profile': user_profile,
@@ -112,7 +155,11 @@ def village_list(request):
         'police_stations': police_stations,
         'post_offices': post_offices,
         'panchayats': panchayats,
-        'villages': villages,
+        'villages': page,
+        'next_cursor': page.next_cursor,
+        'previous_cursor': page.previous_cursor,
+        'filter_query': filters.urlencode(),
+        'hierarchy_version': tree.version,
         'selected_district': selected_district,
         'selected_block': selected_block,
         'selected_police_station': selected_police_station,
@@ -124,7 +171,10 @@ def village_list(request):
 
 def village_detail(request, pk):
     """Show village details."""
-    village = get_object_or_404(Village, pk=pk)
+    village = get_object_or_404(
+        Village.objects.select_related('district', 'block', 'police_station', 'post_office', 'panchayat'),
+        pk=pk
+    )
     
     # Get or create user profile if user is authenticated
     user_profile = None
@@ -200,7 +250,7 @@ def village_create(request):
         return redirect('village_detail', pk=village.pk)
     
     # Get all districts for the form
-    districts = District.objects.all()
+    districts = get_location_tree().get_children(None, None)
     return render(request, 'village/village_form.html', {'districts': districts})
 
 def event_list(request):
@@ -352,14 +402,18 @@ def profile(request):
 @login_required
 def my_relationships(request):
     """User relationships view with search functionality."""
+    profile = request.user.userprofile
     # Get user's relationships
-    relationships = Relationship.objects.filter(user=request.user.userprofile)
+    relationships = Relationship.objects.filter(user=profile).select_related(
+        'related_user__user', 'related_user__village'
+    )
     
     # Initialize search form
     search_form = UserSearchForm(request.GET)
-    users = UserProfile.objects.exclude(user=request.user)  # Exclude current user
+    users = []
     
-    if search_form.is_valid():
+    if search_form.is_valid() and any(search_form.cleaned_data.values()):
+        users = UserProfile.objects.exclude(user=request.user).select_related('user', 'village')  # Exclude current user
         search_query = search_form.cleaned_data.get('search_query')
         age_min = search_form.cleaned_data.get('age_min')
         age_max = search_form.cleaned_data.get('age_max')
@@ -369,15 +423,6 @@ def my_relationships(request):
         village = search_form.cleaned_data.get('village')
         
         # Apply filters
-        if search_query:
-            users = users.filter(
-                Q(user__first_name__icontains=search_query) |
-                Q(user__last_name__icontains=search_query) |
-                Q(nickname__icontains=search_query) |
-                Q(education__icontains=search_query) |
-                Q(profession__icontains=search_query)
-            )
-        
         if age_min:
             users = users.filter(age__gte=age_min)
         
@@ -395,6 +440,30 @@ def my_relationships(request):
         
         if village:
             users = users.filter(village=village)
+        
+        # Full-text search last, so the results keep their relevance order
+        if search_query:
+            users = UserManagementDB.search_members(search_query, queryset=users, limit=SEARCH_RESULTS_LIMIT)
+        else:
+            users = list(users[:SEARCH_RESULTS_LIMIT])
+    
+    # One page of the precomputed "people you may know" suggestions
+    recommendations = RecommendationsDB.get_recommendations(profile)
+    page_size = parse_page_size(request.GET.get('page_size'), default=10)
+    try:
+        suggestions = paginate_keyset(recommendations, cursor=request.GET.get('cursor'), page_size=page_size, fields=('rank',))
+    except ValueError:
+        # Ignore a malformed cursor and start from the first page
+        suggestions = paginate_keyset(recommendations, page_size=page_size, fields=('rank',))
+    
+    # Mutual connection badges for everyone shown
+    mutual_counts = RelationshipsDB.get_mutual_counts(
+        profile.pk, [user.pk for user in users] + [suggestion.candidate_id for suggestion in suggestions]
+    )
+    for user in users:
+        user.mutual_count = mutual_counts[user.pk]
+    for suggestion in suggestions:
+        suggestion.mutual_count = mutual_counts[suggestion.candidate_id]
     
     # Get existing relationships for the filtered users
     existing_relationships = {
@@ -406,6 +475,7 @@ def my_relationships(request):
         'relationships': relationships,
         'search_form': search_form,
         'users': users,
+        'suggestions': suggestions,
         'existing_relationships': existing_relationships
     }
     
@@ -532,14 +602,27 @@ def pending_verifications(request):
 
 def member_list(request):
     """List all members."""
-    members = UserProfile.objects.all()
+    members = list(UserProfile.objects.select_related('user', 'village'))
     villages = Village.objects.all()
+    viewer = getattr(request.user, 'userprofile', None) if request.user.is_authenticated else None
+    if viewer is not None:
+        mutual_counts = RelationshipsDB.get_mutual_counts(viewer.pk, [member.pk for member in members])
+        for member in members:
+            member.mutual_count = mutual_counts[member.pk] if member.pk != viewer.pk else 0
     return render(request, 'village/member_list.html', {'members': members, 'villages': villages})
 
 def member_detail(request, pk):
     """Show member details."""
     member = get_object_or_404(UserProfile, pk=pk)
-    return render(request, 'village/member_detail.html', {'member': member})
+    connection_path = None
+    viewer = getattr(request.user, 'userprofile', None) if request.user.is_authenticated else None
+    if viewer is not None and viewer.pk != member.pk:
+        connection_path = RelationshipsDB.get_path(viewer.pk, member.pk)
+    return render(request, 'village/member_detail.html', {
+        'member': member,
+        'viewer': viewer,
+        'connection_path': connection_path,
+    })
 
 @login_required
 def member_create(request):
@@ -594,28 +677,108 @@ def register(request):
         form = UserCreationForm()
     return render(request, 'village/register.html', {'form': form})
 
+def _hierarchy_etag(request, level, parent_id):
+    return f"h{get_location_tree().version}-{level}-{parent_id}"
+
+def _cache_found_publicly(view):
+    """Let shared caches keep successful responses, but not errors."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            patch_cache_control(response, public=True, max_age=settings.HIERARCHY_CACHE_MAX_AGE)
+        return response
+    return wrapper
+
+@_cache_found_publicly
+@condition(etag_func=_hierarchy_etag)
+def hierarchy_children(request, level, parent_id):
+    """Return the direct children of a location as compact [id, name] pairs."""
+    tree = get_location_tree()
+    if level not in tree.levels or level == tree.level_names[-1]:
+        return JsonResponse({'error': f"Unknown parent level '{level}'."}, status=404)
+    if tree.get(level, parent_id) is None:
+        return JsonResponse({'error': 'Location not found.'}, status=404)
+    
+    children = [[node.id, node.name] for node in tree.get_children(level, parent_id)]
+    return JsonResponse(children, safe=False)
+
+def location_autocomplete(request):
+    """Suggest locations for a partial name or village code (?q=, ?level=, ?limit=)."""
+    query = request.GET.get('q', '')
+    limit = parse_page_size(request.GET.get('limit'), default=10, maximum=50)
+    results = get_autocomplete_index().search(query, limit=limit, level=request.GET.get('level'))
+    return JsonResponse({'query': query, 'results': results})
+
+SYNC_SERIALIZERS = {
+    'villages': VillageSerializer,
+    'profiles': UserProfileSerializer,
+    'relationships': RelationshipSerializer,
+    'events': CommunityEventSerializer,
+    'contributions': EventContributionSerializer,
+    'services': VillageServiceSerializer,
+}
+
+@gzip_page
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def sync(request):
+    """
+    Objects created, updated or deleted since ?since=<token> (everything when
+    absent), up to ?page_size= of each kind, with related objects as ids.
+    Repeat with the returned token while has_more is true.
+    """
+    page_size = parse_page_size(request.query_params.get('page_size'), default=SyncDB.PAGE_SIZE, maximum=SyncDB.MAX_PAGE_SIZE)
+    planned = {name: serializer_class(expand='') for name, serializer_class in SYNC_SERIALIZERS.items()}
+    try:
+        result = SyncDB.get_changes(
+            request.query_params.get('since'),
+            page_size=page_size,
+            prepare=lambda name, queryset: optimize_queryset(queryset, planned[name], only=True)
+        )
+    except SyncTokenExpired:
+        return Response({'error': 'The sync token has expired; sync again without one.'}, status=status.HTTP_410_GONE)
+    except ValueError:
+        return Response({'error': 'Invalid sync token.'}, status=status.HTTP_400_BAD_REQUEST)
+    result['changes'] = {
+        name: SYNC_SERIALIZERS[name](rows, many=True, expand='').data
+        for name, rows in result['changes'].items()
+    }
+    return Response(result)
+
 # Create your views here.
 
-class VillageViewSet(viewsets.ModelViewSet):
+class VillageViewSet(ConditionalGetMixin, OptimizedQuerysetMixin, viewsets.ModelViewSet):
     queryset = Village.objects.all()
     serializer_class = VillageSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = KeysetCursorPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            # ?district=, ?block=, ... filter on the denormalized hierarchy columns
+            queryset = LocationHierarchyDB.filter_villages(queryset, self.request.query_params)
+        return queryset
 
     @action(detail=True, methods=['get'])
     def services(self, request, pk=None):
         village = self.get_object()
-        services = VillageService.objects.filter(village=village)
-        serializer = VillageServiceSerializer(services, many=True)
-        return Response(serializer.data)
+        return Response(self.serialize_list(VillageServiceSerializer, VillageService.objects.filter(village=village)))
 
     @action(detail=True, methods=['get'])
     def events(self, request, pk=None):
         village = self.get_object()
-        events = CommunityEvent.objects.filter(village=village)
-        serializer = CommunityEventSerializer(events, many=True)
-        return Response(serializer.data)
+        return Response(self.serialize_list(CommunityEventSerializer, CommunityEvent.objects.filter(village=village)))
 
-class UserProfileViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['get'])
+    def clusters(self, request, pk=None):
+        """Social clusters among the village's members, largest first."""
+        village = self.get_object()
+        limit = parse_page_size(request.query_params.get('limit'), default=20)
+        return Response(CommunitiesDB.get_village_clusters(village.pk, limit=limit))
+
+class UserProfileViewSet(ConditionalGetMixin, OptimizedQuerysetMixin, viewsets.ModelViewSet):
     queryset = UserProfile.objects.all()
     serializer_class = UserProfileSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -626,11 +789,50 @@ class UserProfileViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def relationships(self, request, pk=None):
         profile = self.get_object()
-        relationships = Relationship.objects.filter(user=profile)
-        serializer = RelationshipSerializer(relationships, many=True)
-        return Response(serializer.data)
+        return Response(self.serialize_list(RelationshipSerializer, Relationship.objects.filter(user=profile)))
 
-class RelationshipViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['get'])
+    def graph(self, request, pk=None):
+        """The profile's relationship neighbourhood as nodes/edges (?depth=1..3)."""
+        profile = self.get_object()
+        try:
+            depth = int(request.query_params.get('depth', 1))
+        except ValueError:
+            depth = 1
+        return Response(RelationshipsDB.get_graph(profile.pk, depth=depth))
+
+    @action(detail=True, methods=['get'], url_path='family-tree')
+    def family_tree(self, request, pk=None):
+        """The profile's ancestors and descendants (?generations=1..10)."""
+        profile = self.get_object()
+        try:
+            generations = int(request.query_params.get('generations', 3))
+        except ValueError:
+            generations = 3
+        return Response(KinshipDB.get_family_tree(profile.pk, generations=generations))
+
+    @action(detail=True, methods=['get'])
+    def path(self, request, pk=None):
+        """How the requesting user (or ?from=<profile id>) is connected to this profile."""
+        profile = self.get_object()
+        source_id = request.query_params.get('from')
+        if source_id is None:
+            source = getattr(request.user, 'userprofile', None)
+            if source is None:
+                return Response({'error': 'You do not have a profile.'}, status=status.HTTP_400_BAD_REQUEST)
+            source_id = source.pk
+        try:
+            source_id = int(source_id)
+            max_depth = int(request.query_params.get('max_depth', RelationshipsDB.MAX_PATH_DEPTH))
+        except ValueError:
+            return Response({'error': 'Invalid profile id or depth.'}, status=status.HTTP_400_BAD_REQUEST)
+        steps = RelationshipsDB.get_path(source_id, profile.pk, max_depth=max_depth)
+        return Response({
+            'degrees': len(steps) - 1 if steps is not None else None,
+            'path': steps or [],
+        })
+
+class RelationshipViewSet(ConditionalGetMixin, OptimizedQuerysetMixin, viewsets.ModelViewSet):
     queryset = Relationship.objects.all()
     serializer_class = RelationshipSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -638,7 +840,49 @@ class RelationshipViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user.userprofile)
 
-class CommunityEventViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['post'], url_path='respond-to-requests')
+    def respond_to_requests(self, request):
+        """Accept or reject many received requests: {"action": "accept"|"reject", "request_ids": [...]}."""
+        profile = getattr(request.user, 'userprofile', None)
+        if profile is None:
+            return Response({'error': 'You do not have a profile.'}, status=status.HTTP_400_BAD_REQUEST)
+        request_ids = request.data.get('request_ids')
+        if not isinstance(request_ids, list) or not all(isinstance(pk, int) for pk in request_ids):
+            return Response({'error': 'request_ids must be a list of ids.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            result = RelationshipsDB.respond_to_requests(profile, request_ids, request.data.get('action'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result)
+
+class KinshipEdgeViewSet(ConditionalGetMixin, OptimizedQuerysetMixin, viewsets.ModelViewSet):
+    """Typed family links; each is stored in both directions by KinshipDB."""
+    queryset = KinshipEdge.objects.all()
+    serializer_class = KinshipEdgeSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    http_method_names = ['get', 'post', 'delete', 'head', 'options']
+
+    def perform_create(self, serializer):
+        data = serializer.validated_data
+        self.check_family_member(data['person'], data['relative'])
+        try:
+            serializer.instance = KinshipDB.add_relative(data['person'], data['relative'], data['kind'])
+        except ValueError as e:
+            raise ValidationError({'error': str(e)})
+
+    def perform_destroy(self, instance):
+        self.check_family_member(instance.person, instance.relative)
+        KinshipDB.remove_relative(instance.person, instance.relative)
+
+    def check_family_member(self, person, relative):
+        """Only the two members themselves (or staff) may link or unlink them."""
+        if self.request.user.is_staff:
+            return
+        profile = getattr(self.request.user, 'userprofile', None)
+        if profile is None or profile.pk not in (person.pk, relative.pk):
+            raise PermissionDenied('You can only add or remove your own relatives.')
+
+class CommunityEventViewSet(BulkWriteMixin, ConditionalGetMixin, OptimizedQuerysetMixin, viewsets.ModelViewSet):
     queryset = CommunityEvent.objects.all()
     serializer_class = CommunityEventSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
@@ -658,7 +902,7 @@ class CommunityEventViewSet(viewsets.ModelViewSet):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class EventContributionViewSet(viewsets.ModelViewSet):
+class EventContributionViewSet(BulkWriteMixin, ConditionalGetMixin, OptimizedQuerysetMixin, viewsets.ModelViewSet):
     queryset = EventContribution.objects.all()
     serializer_class = EventContributionSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -666,7 +910,7 @@ class EventContributionViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(contributor=self.request.user.userprofile)
 
-class VillageServiceViewSet(viewsets.ModelViewSet):
+class VillageServiceViewSet(BulkWriteMixin, ConditionalGetMixin, OptimizedQuerysetMixin, viewsets.ModelViewSet):
     queryset = VillageService.objects.all()
     serializer_class = VillageServiceSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
@@ -872,48 +1116,17 @@ def handle_relationship_request(request, request_id):
             messages.success(request, "Request cancelled successfully.")
             return redirect('relationship_requests')
         
-        if action == 'accept':
-            # Check if a relationship already exists
-            existing_relationship = Relationship.objects.filter(
-                Q(user=relationship_request.from_user, related_user=relationship_request.to_user) |
-                Q(user=relationship_request.to_user, related_user=relationship_request.from_user)
-            ).first()
-            
-            if existing_relationship:
-                messages.warning(request, f"You already have a relationship with {relationship_request.from_user.user.get_full_name() or relationship_request.from_user.user.username}.")
-                relationship_request.status = 'rejected'
-                relationship_request.save()
-                return redirect('relationship_requests')
-            
-            # Create bidirectional relationships
-            Relationship.objects.create(
-                user=relationship_request.from_user,
-                related_user=relationship_request.to_user,
-                relationship_type=relationship_request.relationship_type
-            )
-            Relationship.objects.create(
-                user=relationship_request.to_user,
-                related_user=relationship_request.from_user,
-                relationship_type=relationship_request.relationship_type
-            )
-            
-            relationship_request.status = 'accepted'
-            relationship_request.save()
-            
-            messages.success(
-                request,
-                f'You are now connected with {relationship_request.from_user.user.get_full_name() or relationship_request.from_user.user.username}.'
-            )
-            return redirect('relationship_requests')
-        
-        if action == 'reject':
-            relationship_request.status = 'rejected'
-            relationship_request.save()
-            
-            messages.success(
-                request,
-                f'You have rejected the request from {relationship_request.from_user.user.get_full_name() or relationship_request.from_user.user.username}.'
-            )
+        if action in ('accept', 'reject'):
+            sender_name = relationship_request.from_user.user.get_full_name() or relationship_request.from_user.user.username
+            result = RelationshipsDB.respond_to_requests(request.user.userprofile, [relationship_request.pk], action)
+            if result['already_connected']:
+                messages.warning(request, f"You already have a relationship with {sender_name}.")
+            elif result['accepted']:
+                messages.success(request, f'You are now connected with {sender_name}.')
+            elif result['rejected']:
+                messages.success(request, f'You have rejected the request from {sender_name}.')
+            else:
+                messages.info(request, "This request has already been answered.")
             return redirect('relationship_requests')
         
         messages.error(request, "Invalid action.")
@@ -921,6 +1134,30 @@ def handle_relationship_request(request, request_id):
     
     return redirect('relationship_requests')
 
+@login_required
+def handle_relationship_requests_bulk(request):
+    """Accept or reject several received requests in one go."""
+    if request.method == 'POST':
+        action = request.POST.get('action')
+        request_ids = [int(pk) for pk in request.POST.getlist('request_ids') if pk.isdigit()]
+        if action not in ('accept', 'reject'):
+            messages.error(request, "Invalid action.")
+        elif not request_ids:
+            messages.warning(request, "Select at least one request.")
+        else:
+            result = RelationshipsDB.respond_to_requests(request.user.userprofile, request_ids, action)
+            if result['accepted']:
+                messages.success(request, f"Accepted {result['accepted']} request{pluralize(result['accepted'])}.")
+            if action == 'reject' and result['rejected']:
+                messages.success(request, f"Rejected {result['rejected']} request{pluralize(result['rejected'])}.")
+            if result['already_connected']:
+                messages.warning(
+                    request,
+                    f"{result['already_connected']} request{pluralize(result['already_connected'])} came from "
+                    "people you are already related to and were closed."
+                )
+    return redirect('relationship_requests')
+
 def relationship_graph(request):
     if not request.user.is_authenticated:
         return redirect('login')
@@ -932,91 +1169,37 @@ def relationship_graph(request):
         messages.error(request, 'Please complete your profile first.')
         return redirect('profile_create')
     
-    # Create a new directed graph
-    G = nx.DiGraph()
-    
-    # Add the current user as the central node
-    G.add_node(request.user.id, 
-               label=request.user.get_full_name() or request.user.username,
-               color='#FFD700')  # Gold color for current user
-    
-    # Get all relationships
-    relationships = Relationship.objects.filter(
-        Q(from_user=request.user) | Q(to_user=request.user)
-    ).select_related('from_user', 'to_user')
-    
-    # Color mapping for different relationship types
-    color_map = {
-        'family': '#FF6B6B',      # Red
-        'friend': '#4ECDC4',      # Turquoise
-        'classmate': '#45B7D1',   # Blue
-        'colleague': '#96CEB4',   # Green
-        'neighbor': '#FFEEAD',    # Yellow
-        'other': '#D4A5A5'        # Pink
-    }
-    
-    # Add nodes and edges for each relationship
-    for rel in relationships:
-        # Determine the other user in the relationship
-        other_user = rel.to_user if rel.from_user == request.user else rel.from_user
-        
-        # Add the other user as a node
-        G.add_node(other_user.id,
-                  label=other_user.get_full_name() or other_user.username,
-                  color=color_map.get(rel.relationship_type, color_map['other']))
-        
-        # Add edge with relationship type as label
-        G.add_edge(request.user.id, other_user.id, 
-                  label=rel.get_relationship_type_display())
-    
-    # Create the plot
-    plt.figure(figsize=(12, 8))
-    pos = nx.spring_layout(G, k=1, iterations=50)
-    
-    # Draw nodes
-    nx.draw_networkx_nodes(G, pos, 
-                          node_color=[G.nodes[node]['color'] for node in G.nodes()],
-                          node_size=2000)
-    
-    # Draw edges
-    nx.draw_networkx_edges(G, pos, edge_color='gray', arrows=True, arrowsize=20)
-    
-    # Draw labels
-    nx.draw_networkx_labels(G, pos, 
-                          labels={node: G.nodes[node]['label'] for node in G.nodes()},
-                          font_size=10)
-    
-    # Draw edge labels
-    edge_labels = nx.get_edge_attributes(G, 'label')
-    nx.draw_networkx_edge_labels(G, pos, edge_labels=edge_labels, font_size=8)
-    
-    # Save the plot to a bytes buffer
-    buffer = io.BytesIO()
-    plt.savefig(buffer, format='png', bbox_inches='tight', dpi=300)
-    buffer.seek(0)
-    plt.close()
-    
-    # Convert the plot to base64 string
-    image_base64 = base64.b64encode(buffer.getvalue()).decode()
+    # The graph itself is drawn in the browser from the profile graph API;
+    # only the statistics are computed here.
+    edges = get_graph_edges(user_profile)
     
     # Get relationship statistics
     relationship_stats = {
-        'total': relationships.count(),
-        'by_type': {}
+        'total': len(edges),
+        'by_type': {rel_type: 0 for rel_type, _ in Relationship.RELATIONSHIP_TYPES}
     }
-    
-    for rel_type, _ in Relationship.RELATIONSHIP_TYPES:
-        count = relationships.filter(relationship_type=rel_type).count()
-        relationship_stats['by_type'][rel_type] = count
+    for _, _, rel_type, _ in edges:
+        relationship_stats['by_type'][rel_type] = relationship_stats['by_type'].get(rel_type, 0) + 1
     
     context = {
-        'graph_image': image_base64,
+        'user_profile': user_profile,
         'relationship_stats': relationship_stats,
-        'color_map': color_map
+        'color_map': COLOR_MAP,
+        'center_color': CENTER_COLOR
     }
     
     return render(request, 'village/relationship_graph.html', context)
 
+@login_required
+def relationship_graph_image(request):
+    """Render the user's relationship graph as a PNG in the background and report when it is ready."""
+    user_profile = get_object_or_404(UserProfile, user=request.user)
+    try:
+        image_url, _ = get_graph_image(user_profile)
+    except GraphRenderFailed:
+        return JsonResponse({'url': None, 'pending': False, 'error': 'The graph image could not be drawn.'}, status=500)
+    return JsonResponse({'url': image_url, 'pending': image_url is None})
+
 def custom_logout(request):
     """Custom logout view."""
     logout(request)